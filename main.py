@@ -1,221 +1,288 @@
 
-import pandas as pd
-from utils.mappings import *
-from utils.price_bands import get_IWSR_data_estimates
-from utils.utils import *
-from utils.price_bands import *
-from utils.proportions import *
-def get_base_df(current_year):
-    """ Method to get starting point for estimating market size from income statement data for CY
-    
-    param current_year: current year (which is the last full calendar year experienced)
-    : return: pandas dataframe with transformed income statement data
+import os
+import sys
+import time
+import argparse
+import importlib
+from utils import OUTPUT_DIRECTORY
+
+IMPORT_BUDGET = 3.0 # seconds, the imports of a single stage should stay below this
+
+# modules imported by each stage, in import order so that every module is timed without its dependencies
+STAGE_MODULES = {
+    'estimate': ['numpy', 'pandas', 'scipy.sparse', 'utils.cache', 'utils.mappings', 'utils.rollup', 'utils.schemas',
+                 'utils.utils', 'utils.sources', 'utils.mapping_matrix', 'utils.estimates'],
+    'price-bands': ['numpy', 'pandas', 'scipy.sparse', 'utils.cache', 'utils.mappings', 'utils.rollup',
+                    'utils.schemas', 'utils.utils', 'utils.price_bands'],
+    'fiscal-volume': ['numpy', 'pandas', 'scipy.sparse', 'utils.cache', 'utils.mappings', 'utils.rollup',
+                      'utils.schemas', 'utils.utils', 'utils.proportions'],
+    'fiscal-value': ['numpy', 'pandas', 'scipy.sparse', 'utils.cache', 'utils.mappings', 'utils.rollup',
+                     'utils.schemas', 'utils.utils', 'utils.proportions'],
+    'backtest': ['numpy', 'pandas', 'scipy.sparse', 'utils.cache', 'utils.mappings', 'utils.rollup', 'utils.schemas',
+                 'utils.utils', 'utils.sources', 'utils.mapping_matrix', 'utils.estimates', 'utils.backtest'],
+    'seasonality': ['numpy', 'pandas', 'scipy.sparse', 'utils.cache', 'utils.mappings', 'utils.rollup',
+                    'utils.schemas', 'utils.utils', 'utils.proportions', 'utils.seasonality'],
+    'pipeline': ['numpy', 'pandas', 'scipy.sparse', 'utils.cache', 'utils.mappings', 'utils.rollup', 'utils.schemas',
+                 'utils.utils', 'utils.sources', 'utils.mapping_matrix', 'utils.estimates', 'utils.price_bands',
+                 'utils.proportions', 'utils.seasonality', 'utils.pipeline'],
+    'synthetic': ['numpy', 'utils.schemas', 'utils.synthetic'],
+    'benchmark': ['numpy', 'pandas', 'utils.cache', 'utils.schemas', 'utils.synthetic', 'utils.benchmark'],
+}
+
+
+def import_stage(stage):
+    """ Method to import the modules of a stage and measure the import time of each module
+
+    param stage: name of the stage, e.g. 'estimate'
+    : return: list of (module name, seconds) tuples
     """
-    base_df = get_income_statement_data(current_year)
-    base_df = transform_BIP_data(base_df)
-    base_df = base_df.rename(columns = {'Volume': 'Income CY'})
-    return base_df
 
+    timings = []
+    for name in STAGE_MODULES[stage]:
+        start = time.perf_counter()
+        importlib.import_module(name)
+        timings.append((name, time.perf_counter() - start))
+    return timings
 
-def get_IWSR_estimate(base_df, iwsr_mappings, last_year):
-    """ Method to get market estimate from IWSR LY data
 
-    param base_df: dataframe containing income statement data and other estimates
-    param iwsr_mappings: dict detailing mapping between IWSR and Income Statement stats groups
-    param last_year: year prior to current year (which is the last full calendar year experienced)
-    : return: pandas series containing market estimate for relevant stats groups with index compatible to base_df
-    
-    """
-
-    iwsr_df = get_IWSR_data(last_year)
-
-    # map IWSR data to base df 
-    IWSR_LY = base_df['index'].apply(map_to_base_data, args = [iwsr_df, iwsr_mappings])
-
-    # calculate income statement to IWSR ratio for LY data
-    ratio_LY = base_df['Income LY']/IWSR_LY
-    return base_df['Income CY']/ratio_LY
+def print_import_breakdown(timings, budget=IMPORT_BUDGET):
+    """ Method to print the import time per module and warn when the total exceeds the budget
 
-
-def get_SALBA_estimate(base_df, salba_mappings, current_year):
-    """ Method to get market estimate from SALBA CY data
-
-    param base_df: dataframe containing income statement data and other estimates
-    param salba_mappings: dict detailing mapping between SALBA and Income Statement stats groups
-    param current_year: current year (which is the last full calendar year experienced)
-    : return: pandas series containing market estimate for relevant stats groups with index compatible to base_df
-    
+    param timings: list of (module name, seconds) tuples from import_stage
+    param budget: import time budget in seconds
+    : return: total import time in seconds
     """
 
-    salba_df = get_SALBA_data(current_year)
-    salba_df = transform_SALBA_df(salba_df)
-    return base_df['index'].apply(map_to_base_data, args = [salba_df, salba_mappings]) 
+    total = sum(seconds for _, seconds in timings)
+    print('Import time breakdown:')
+    for name, seconds in timings:
+        print(f'  {name:<22}{seconds:8.3f}s')
+    print(f'  {"total":<22}{total:8.3f}s (budget {budget:.3f}s)')
+    if total > budget:
+        print(f'Warning: import time exceeds the budget by {total - budget:.3f}s')
+    return total
 
 
-def get_SAWIS_estimate(base_df, sawis_mappings, current_year):
-    """ Method to get market estimate from SAWIS CY data
+def run_estimate(args):
+    """ Method to estimate the market size of each stats group """
 
-    param base_df: dataframe containing income statement data and other estimates
-    param sawis_mapping: dict detailing mapping between SAWIS and Income Statement stats groups
-    param current_year: current year (which is the last full calendar year experienced)
-    : return: pandas series containing market estimate for relevant stats groups with index compatible to base_df
-    
-    """
+    estimates = importlib.import_module('utils.estimates')
+    return estimates.result(current_year=args.current_year, last_year=args.last_year, prefetch=args.prefetch,
+                            max_workers=args.workers, executor=args.executor)
 
-    sawis_df = get_SAWIS_data(current_year)
-    return base_df['index'].apply(map_to_base_data, args = [sawis_df, sawis_mappings])
 
+def run_price_bands(args):
+    """ Method to convert the Data Orbis categories to price bands """
 
-def get_GLOBAL_estimate(base_df, global_mappings, current_year):
-    """ Method to get market estimate from GLOBAL CY data
+    price_bands = importlib.import_module('utils.price_bands')
+    if args.long:
+        df = price_bands.price_band_conversions_long(args.years)
+        output_path = OUTPUT_DIRECTORY / 'price_bands_long.csv'
+        df.to_csv(output_path, index=False)
+        return df
+    if args.allocate:
+        shares = price_bands.get_price_band_shares(args.year, args.measure)
+        df = price_bands.category_to_priceband(price_bands.get_IWSR_data_estimates(args.year), shares)
+        output_path = OUTPUT_DIRECTORY / f'price_band_allocation{args.year}.csv'
+        df.to_csv(output_path)
+        return df
+    return price_bands.price_band_conversions(args.year, args.measure)
 
-    param base_df: dataframe containing income statement data and other estimates
-    param global_mappings: dict detailing mapping between GLOBAL and Income Statement stats groups
-    param current_year: current year (which is the last full calendar year experienced)
-    : return: pandas series containing market estimate for relevant stats groups with index compatible to base_df
-    
-    """
-
-    global_df = get_global_data(current_year)
-    return base_df['index'].apply(map_to_base_data, args = [global_df, global_mappings])
-
-
-def get_data_orbis_estimate(base_df, data_orbis_mappings, iwsr_mappings, current_year = '2020', last_year = '2019'):
-
-    """ Method to get market estimate from data orbis data.
-    It assumed that Data Orbis represents only about 30-40% of total domestic alcohol sales. 
-    To estimate the market size from Data Orbis, we look at what proportion each stats group was of the IWSR data in LY.
-    We use that ratio to scale the current year Data Orbis volumes per stats group
-    
-    param base_df: dataframe containing income statement data and other estimates
-    param epos_mapping: dict detailing mapping between Data Orbis and Income Statement stats groups
-    param iwsr_mapping: dict detailing mapping between IWSR and Income Statement stats groups
-    param current_year: current year (which is the last full calendar year experienced)
-    : return: pandas series containing market estimate for relevant stats groups with index compatible to base_df
-    
-    """
-    iwsr_df = get_IWSR_data(last_year)
-    IWSR_LY = base_df['index'].apply(map_to_base_data, args = [iwsr_df, iwsr_mappings])
 
-    df_LY = get_data_orbis(last_year)
-    df_CY = get_data_orbis(current_year)
+def run_fiscal_volume(args):
+    """ Method to convert the volume forecasts to fiscal years """
 
-    df_LY = transform_data_orbis(df_LY)
-    df_CY = transform_data_orbis(df_CY)
+    proportions = importlib.import_module('utils.proportions')
+    return proportions.fiscal_year_conversion(args.year, args.start_month)
 
-    df_LY['Volume'] = df_LY['Volume']*(12/11) # to account for missing january data in 2019 
 
-    data_orbis_LY = base_df['index'].apply(map_to_base_data, args = [df_LY, data_orbis_mappings]) 
-    data_orbis_CY = base_df['index'].apply(map_to_base_data, args = [df_CY, data_orbis_mappings]) 
+def run_fiscal_value(args):
+    """ Method to convert the value forecasts to fiscal years """
 
-    # calculate ratio of data orbis volume to IWSR volume for last year
-    ratio_LY = data_orbis_LY/IWSR_LY
-    return data_orbis_CY/ratio_LY
-
-def result(current_year='2020', last_year='2019'):
-    """Function to produce the estimates
-        param current_year: current year of analysis
-        param last_year: year before current year
-        : return IWSR estimates for current year
-    """
-
-    # get starting point, which is income statement
-    base_df = get_base_df(current_year)
-    # Create a new column with last year's income volumes
-    base_df['Income LY'] = transform_BIP_data(get_income_statement_data(last_year))
-    base_df = base_df.reset_index()
-
-    # get IWSR for previous year (most accurate estimate)
-    base_df['IWSR LY'] = base_df['index'].apply(map_to_base_data, args=[get_IWSR_data(last_year), iwsr_mappings])
+    proportions = importlib.import_module('utils.proportions')
+    df = proportions.fiscal_year_conversion_value(args.year, args.start_month)
+    output_path = OUTPUT_DIRECTORY / 'Fiscal_year_value_new.csv'
+    df.to_csv(output_path)
+    return df
 
-    # Estimate IWSR 2020 data using 2019 income-iwsr ratio per stats group and 2020 Income data
-    base_df['IWSR Estimate'] = get_IWSR_estimate(base_df, iwsr_mappings, last_year)
 
-    # Get estimates for brandy, gin, whisky, vodka and liqueurs from SALBA
-    base_df['SALBA Estimate'] = get_SALBA_estimate(base_df, salba_mappings, current_year)
-    base_df = base_df.set_index('index')
+def run_backtest(args):
+    """ Method to backtest the estimates of every year against the actual IWSR data """
 
-    base_df.loc['Liqueurs', 'SALBA Estimate'] += get_amarula_data(current_year)
+    backtest = importlib.import_module('utils.backtest')
+    year_pairs = [(year, str(int(year) - 1)) for year in args.years] if args.years else None
+    df = backtest.backtest_IWSR_estimates(year_pairs, max_workers=args.workers)
+    output_path = OUTPUT_DIRECTORY / 'backtest_IWSR_estimates.csv'
+    df.to_csv(output_path, index=False)
+    return df
 
-    base_df = base_df.reset_index()
 
-    # Get estimates for still, fortified, and sparkling wine from SAWIS
-    base_df['SAWIS Estimate'] = get_SAWIS_estimate(base_df, sawis_mappings, current_year)
+def run_seasonality(args):
+    """ Method to get the seasonal proportions of every period of a fiscal calendar """
 
-    # Get estimate for beer from GLOBAL data
-    base_df['GLOBAL Estimate'] = get_GLOBAL_estimate(base_df, global_mappings, current_year)
+    seasonality = importlib.import_module('utils.seasonality')
+    cube = seasonality.get_seasonality_cube(args.year)
+    df = seasonality.get_period_proportions(cube, args.start_month, args.period_months)
+    output_path = OUTPUT_DIRECTORY / 'seasonality_proportions.csv'
+    df.to_csv(output_path)
+    return df
 
-    # Get data orbis estimate for brandy, gin, whisky, vodka, liqueurs, beer, all wines, Ciders & RTDS
-    base_df['Data Orbis Estimate'] = get_data_orbis_estimate(base_df, data_orbis_mappings, iwsr_mappings,
-                                                             current_year, last_year)
 
-    # Get the adjusted average estimate (discard furthest data point and recalcuate mean)
-    base_df['Avg Estimate'] = base_df.apply(get_adjusted_mean_estimate, axis=1)
+def run_pipeline(args):
+    """ Method to run the estimate, price-bands and fiscal-volume stages incrementally, only the stages downstream
+    of a changed workbook or parameter, and all stages after a change of the code, are run """
 
-    base_df = base_df.set_index('index')
+    pipeline = importlib.import_module('utils.pipeline')
+    stages = pipeline.get_pipeline(args.current_year, args.last_year, args.price_band_year, args.measure,
+                                   args.fiscal_year, args.start_month)
+    plan = pipeline.run_pipeline(stages, dry_run=args.dry_run)
+    print(plan.drop(columns='Key').to_string(index=False))
+    return plan
 
-    output_path = f'out\market_size_test{current_year}.csv'
-    # base_df.loc[['Brandy', 'Gin', 'Vodka', 'Liqueurs', 'Whisky', 'Beer', 'Sparkling Wine', 'Wine Aperitif',
-    #              'Fortified Wine 1', 'Still Wine', 'Fortified Wine 2', 'CIDER & RTDs', 'Ciders',
-    #              'FABs']].to_csv(output_path)
-    df = base_df.loc[['Brandy', 'Gin', 'Vodka', 'Liqueurs', 'Whisky', 'Beer', 'Sparkling Wine', 'Wine Aperitif',
-                  'Fortified Wine 1', 'Still Wine', 'Fortified Wine 2', 'CIDER & RTDs', 'Ciders',
-                  'FABs']].to_csv(output_path)
-    return df
 
-# def test_IWSR_estimates(current_year='2020', last_year='2019'):
-#     """Function to compare current year IWSR estimates to actual IWSR data for current year
-#
-#         param current_year: current year of analysis
-#         param last_year: year before current year
-#         : return : difference between the two as errors
-#     """
-#     IWSR_df = get_IWSR_data_estimates(current_year)
-#     result_df = result(current_year, last_year)
-#     # fortified_aperitif_s = result_df.loc['Fortified Wine 1'] + result_df.loc['Fortified Wine 2']\
-#     #                        + result_df.loc['Wine Aperitif']
-#     # fortified_aperitif_s = (pd.DataFrame(data=fortified_aperitif_s, columns=['Fortified Wine & Wine Aperitifs'])).T
-#     # result_df = pd.concat([result_df, fortified_aperitif_s])
-#
-#     brandy_df = abs((result_df.loc['Brandy']['Avg Estimate'] / IWSR_df.loc['Brandy']['Sales Volume']) - 1)
-#     gin_df = abs((result_df.loc['Gin']['Avg Estimate'] / IWSR_df.loc['Gin and Genever']['Sales Volume']) - 1)
-#     #cane_df = abs((result_df.loc['Brandy']['Avg Estimate'] / IWSR_df.loc['Brandy']['Sales Volume']) - 1)
-#     vodka_df = abs((result_df.loc['Vodka']['Avg Estimate'] / IWSR_df.loc['Vodka']['Sales Volume']) - 1)
-#     liqueurs_df = abs((result_df.loc['Liqueurs']['Avg Estimate'] / IWSR_df.loc['Liqueurs']['Sales Volume']) - 1)
-#     whisky_df = abs((result_df.loc['Whisky']['Avg Estimate'] / IWSR_df.loc['Whisky']['Sales Volume']) - 1)
-#     #rum_df = abs((result_df.loc['Rum']['Avg Estimate'] / IWSR_df.loc['Rum']['Sales Volume']) - 1)
-#     #tequila_df = abs((result_df.loc['Brandy']['Avg Estimate'] / IWSR_df.loc['Brandy']['Sales Volume']) - 1)
-#     spark_df = abs((result_df.loc['Sparkling Wine']['Avg Estimate'] / IWSR_df.loc['Sparkling Wine']['Sales Volume']) - 1)
-#     still_df = abs((result_df.loc['Still Wine']['Avg Estimate'] / IWSR_df.loc['Still Wine']['Sales Volume']) - 1)
-#     fort_df = abs((result_df.loc['Fortified Wine 2']['Avg Estimate'] / IWSR_df.loc['Fortified Wine & Wine Aperitifs']['Sales Volume']) - 1)
-#     cider_fabs_df = abs((result_df.loc['CIDER & RTDs']['Avg Estimate'] / IWSR_df.loc['Cider & FABs']['Sales Volume']) - 1)
-#     beer_df = abs((result_df.loc['Beer']['Avg Estimate'] / IWSR_df.loc['Beer']['Sales Volume']) - 1)
-#
-#     df = pd.DataFrame(data=[brandy_df, gin_df, vodka_df, liqueurs_df, whisky_df,
-#                             spark_df, still_df, fort_df, cider_fabs_df, beer_df], columns=['Error of Estimates'],
-#                       index=['Brandy', 'Gin', 'Vodka', 'Liqueurs', 'Whisky', 'Sparkling Wine', 'Still Wine',
-#                              'Fortified Wine & Wine Aperitifs', 'Cider & FABs', 'Beer'])
-#
-#     return df
+def run_synthetic(args):
+    """ Method to write a synthetic data folder with the layout of every source """
 
-if __name__ == '__main__':
+    synthetic = importlib.import_module('utils.synthetic')
+    paths = synthetic.generate_synthetic_data(args.output_dir, args.scale, seed=args.seed)
+    print(f'Wrote {len(paths)} workbooks to {args.output_dir}')
+    return paths
 
-    # get estimates
-    result(current_year='2020', last_year='2019')
 
-    # get price bands
-    price_band_conversions('2020', 'SALESVOLUME')
+def run_benchmark(args):
+    """ Method to time every stage on synthetic data and write the results as JSON """
 
-    # get fiscal year conversions
-    fiscal_year_conversion('all_years')
+    benchmark = importlib.import_module('utils.benchmark')
+    results = benchmark.run_benchmarks(args.scales, args.stages, args.repeat, args.work_dir, args.seed)
+    benchmark.write_benchmarks(results, args.output)
 
+    if args.baseline:
+        df = benchmark.compare_benchmarks(benchmark.read_benchmarks(args.baseline), results, args.tolerance)
+        print(df.to_string(index=False))
+        if df['regression'].any():
+            print(f'Warning: {df["regression"].sum()} benchmarks are slower than the baseline')
+        if (df['outputs_changed'] == True).any():
+            print(f'Warning: {(df["outputs_changed"] == True).sum()} benchmarks wrote other outputs than the baseline')
+    return results
 
 
+def parse_args(argv=None):
+    """ Method to parse the command line arguments
 
+    param argv: list of arguments, defaults to sys.argv
+    : return: parsed arguments
+    """
 
+    parser = argparse.ArgumentParser(description='Estimate market sizes, price bands and fiscal years. '
+                                                 'Without a command the estimate, price-bands and fiscal-volume '
+                                                 'stages are run one after the other.')
+    parser.add_argument('--data-dir', help='data folder to read the sources from (default: ../Market Sizing/data)')
+    parser.add_argument('--orbis-chunksize', type=int,
+                        help='stream the Data Orbis export in chunks of this many rows to bound the memory use')
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET,
+                        help='import time budget in seconds for a stage')
+    subparsers = parser.add_subparsers(dest='stage')
+
+    estimate = subparsers.add_parser('estimate', help='estimate the market size of each stats group')
+    estimate.add_argument('--current-year', default='2020')
+    estimate.add_argument('--last-year', default='2019')
+    estimate.add_argument('--prefetch', action='store_true', help='load all source workbooks in parallel')
+    estimate.add_argument('--workers', type=int, help='number of threads or processes used by --prefetch')
+    estimate.add_argument('--executor', default='thread', choices=['thread', 'process'])
+    estimate.set_defaults(run=run_estimate)
+
+    price_bands = subparsers.add_parser('price-bands', help='split the categories into price bands')
+    price_bands.add_argument('--year', default='2020')
+    price_bands.add_argument('--measure', default='SALESVOLUME', choices=['SALESVOLUME', 'SALESVALUE'])
+    price_bands.add_argument('--long', action='store_true',
+                             help='split both measures of all --years in one pass into a single long table')
+    price_bands.add_argument('--years', nargs='+', default=['2020', '2019'], choices=['2020', '2019'])
+    price_bands.add_argument('--allocate', action='store_true',
+                             help='split the IWSR volumes of --year into the price bands of their subcategory')
+    price_bands.set_defaults(run=run_price_bands)
+
+    fiscal_volume = subparsers.add_parser('fiscal-volume', help='convert the volume forecasts to fiscal years')
+    fiscal_volume.add_argument('--year', default='all_years')
+    fiscal_volume.add_argument('--start-month', type=int, default=7, choices=[1, 7],
+                               help='first month of the fiscal year, the SARS data only has halves')
+    fiscal_volume.set_defaults(run=run_fiscal_volume)
+
+    fiscal_value = subparsers.add_parser('fiscal-value', help='convert the value forecasts to fiscal years')
+    fiscal_value.add_argument('--year', default='all_years')
+    fiscal_value.add_argument('--start-month', type=int, default=7, choices=[1, 7],
+                              help='first month of the fiscal year, the SARS data only has halves')
+    fiscal_value.set_defaults(run=run_fiscal_value)
+
+    backtest = subparsers.add_parser('backtest', help='backtest the estimates against the actual IWSR data')
+    backtest.add_argument('--years', nargs='+', help='years to estimate (default: every year with all sources)')
+    backtest.add_argument('--workers', type=int, help='number of worker processes (default: number of cores)')
+    backtest.set_defaults(run=run_backtest)
+
+    seasonality = subparsers.add_parser('seasonality', help='split the calendar years into the periods of a fiscal calendar')
+    seasonality.add_argument('--year', default='all_years')
+    seasonality.add_argument('--start-month', type=int, default=7, help='first month of the fiscal year')
+    seasonality.add_argument('--period-months', type=int, default=6, choices=[1, 2, 3, 4, 6, 12])
+    seasonality.set_defaults(run=run_seasonality)
+
+    pipeline = subparsers.add_parser('pipeline', help='run the estimate, price-bands and fiscal-volume stages, '
+                                                      'reusing the outputs of the stages that did not change')
+    pipeline.add_argument('--current-year', default='2020')
+    pipeline.add_argument('--last-year', default='2019')
+    pipeline.add_argument('--price-band-year', default='2020')
+    pipeline.add_argument('--measure', default='SALESVOLUME', choices=['SALESVOLUME', 'SALESVALUE'])
+    pipeline.add_argument('--fiscal-year', default='all_years')
+    pipeline.add_argument('--start-month', type=int, default=7, choices=[1, 7],
+                          help='first month of the fiscal year of the fiscal-volume stages')
+    pipeline.add_argument('--dry-run', action='store_true', help='only show which stages would run')
+    pipeline.set_defaults(run=run_pipeline)
+
+    synthetic = subparsers.add_parser('synthetic', help='write synthetic workbooks with the layout of every source')
+    synthetic.add_argument('--output-dir', required=True, help='data folder to write to, use it as --data-dir')
+    synthetic.add_argument('--scale', type=int, default=1, help='row count multiplier, e.g. 1, 10 or 100')
+    synthetic.add_argument('--seed', type=int, default=0)
+    synthetic.set_defaults(run=run_synthetic)
+
+    benchmark = subparsers.add_parser('benchmark', help='time every stage on synthetic data')
+    benchmark.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    benchmark.add_argument('--stages', nargs='+', help='stages to time (default: all)',
+                           choices=['estimate', 'price-bands', 'price-bands-long', 'fiscal-volume', 'fiscal-value',
+                                    'seasonality', 'backtest', 'all-stages', 'pipeline'])
+    benchmark.add_argument('--repeat', type=int, default=3, help='number of runs of every stage in every cache state')
+    benchmark.add_argument('--work-dir', help='folder of the synthetic data, reused by later benchmarks')
+    benchmark.add_argument('--seed', type=int, default=0)
+    benchmark.add_argument('--output', default=str(OUTPUT_DIRECTORY / 'benchmark.json'))
+    benchmark.add_argument('--baseline', help='results of an earlier benchmark to compare against')
+    benchmark.add_argument('--tolerance', type=float, default=0.25,
+                           help='relative slow down against the baseline that is reported as a regression')
+    benchmark.set_defaults(run=run_benchmark)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """ Entry point of the command line tool, runs the requested stage or the default stages
+
+    param argv: list of arguments, defaults to sys.argv
+    """
 
+    args = parse_args(argv)
 
+    # the data folder and chunk size have to be set before utils.utils is imported by the stage
+    if args.data_dir:
+        os.environ['MARKET_SIZING_DATA'] = os.path.abspath(args.data_dir)
+    if args.orbis_chunksize:
+        os.environ['MARKET_SIZING_ORBIS_CHUNKSIZE'] = str(args.orbis_chunksize)
+    OUTPUT_DIRECTORY.mkdir(exist_ok=True)
 
+    if args.stage is None:
+        stages = [parse_args(['estimate']), parse_args(['price-bands']), parse_args(['fiscal-volume'])]
+    else:
+        stages = [args]
 
+    for stage_args in stages:
+        print_import_breakdown(import_stage(stage_args.stage), args.import_budget)
+        stage_args.run(stage_args)
 
 
+if __name__ == '__main__':
+    main()
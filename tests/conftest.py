@@ -0,0 +1,27 @@
+import os
+import shutil
+import tempfile
+import pytest
+from pathlib import Path
+
+# the data and cache folders are read when utils is imported, so they point at a temporary folder before any test
+# module imports utils. The synthetic workbooks are written into it once per session
+TEST_DIRECTORY = Path(tempfile.mkdtemp(prefix='market_sizing_tests_'))
+os.environ['MARKET_SIZING_DATA'] = str(TEST_DIRECTORY / 'data')
+os.environ['MARKET_SIZING_CACHE'] = str(TEST_DIRECTORY / 'cache')
+
+
+@pytest.fixture(scope='session', autouse=True)
+def synthetic_data():
+    """ Fixture writing the synthetic workbooks of scale 1 into the data folder of the tests
+
+    : return: path of the data folder
+    """
+
+    pytest.importorskip('openpyxl')
+    from utils.synthetic import generate_synthetic_data
+
+    data_dir = Path(os.environ['MARKET_SIZING_DATA'])
+    generate_synthetic_data(data_dir, 1, seed=0)
+    yield data_dir
+    shutil.rmtree(TEST_DIRECTORY, ignore_errors=True)
@@ -0,0 +1,18 @@
+import pytest
+from utils import backtest
+from utils.backtest import BACKTEST_SOURCES, get_year_pairs
+
+
+def test_year_pairs_need_every_source(tmp_path, monkeypatch):
+    monkeypatch.setattr(backtest, 'DATA_DIRECTORY', tmp_path)
+    for source in BACKTEST_SOURCES:
+        for year in ['2019', '2020']:
+            (tmp_path / source / year).mkdir(parents=True)
+    assert get_year_pairs() == [('2020', '2019')]
+
+    # a source without a folder or without year folders is reported instead of failing on the missing folder
+    (tmp_path / 'SALBA' / '2019').rmdir()
+    (tmp_path / 'SALBA' / '2020').rmdir()
+    (tmp_path / 'GLOBAL_data').rename(tmp_path / 'GLOBAL')
+    with pytest.raises(ValueError, match='SALBA, GLOBAL_data'):
+        get_year_pairs()
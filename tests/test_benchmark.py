@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+from utils.benchmark import check_outputs, prepare_cache
+from utils.cache import read_excel_cached
+from utils.proportions import get_store_path, save_stored
+
+
+def test_prepare_cache_keeps_the_sheets_of_a_warm_run(tmp_path):
+    path = tmp_path / 'book.xlsx'
+    pd.DataFrame({'Category': ['Beer'], 'Volume': [1.0]}).to_excel(path, index=False)
+    cache_dir = tmp_path / 'cache'
+    read_excel_cached(path, 'Sheet1', cache_dir)
+    save_stored(pd.DataFrame({'H1': [0.5]}), 'stage_estimates', 'key', cache_dir)
+
+    prepare_cache(cache_dir, 'cached')
+    assert get_store_path('stage_estimates', 'key', cache_dir).exists()
+
+    prepare_cache(cache_dir, 'warm')
+    assert not get_store_path('stage_estimates', 'key', cache_dir).exists()
+    assert len([entry for entry in cache_dir.iterdir() if entry.is_file()]) == 1
+
+    prepare_cache(cache_dir, 'cold')
+    assert not cache_dir.exists()
+
+    with pytest.raises(ValueError):
+        prepare_cache(cache_dir, 'hot')
+
+
+def test_check_outputs_rejects_missing_and_empty_outputs(tmp_path):
+    with pytest.raises(RuntimeError):
+        check_outputs(tmp_path)
+
+    pd.DataFrame({'Volume': [1.0, None]}, index=['Beer', 'Gin']).to_csv(tmp_path / 'estimates.csv')
+    outputs = check_outputs(tmp_path)
+    assert outputs['estimates.csv']['rows'] == 2 and outputs['estimates.csv']['missing'] == 1
+
+    pd.DataFrame({'Volume': [1.0, 2.0], 'Estimate': [None, None]}, index=['Beer', 'Gin']).to_csv(tmp_path / 'nan.csv')
+    with pytest.raises(RuntimeError, match='Estimate'):
+        check_outputs(tmp_path)
@@ -0,0 +1,83 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from utils.cache import STORE_FOLDER, clear_cache, evict_cache, get_temporary_path, read_excel_cached
+from utils.proportions import get_store_path, save_stored
+
+
+def write_workbook(path, rows=20):
+    """ Method to write a small workbook to read through the cache
+
+    param path: path of the workbook
+    param rows: number of rows of the sheet
+    : return: the written dataframe
+    """
+
+    df = pd.DataFrame({'Category': [f'Category {i}' for i in range(rows)], 2019: np.arange(rows) * 1.5,
+                       'Note': ['-'] * (rows - 1) + [1.0]})
+    df.to_excel(path, sheet_name='Sheet1', index=False)
+    return df
+
+
+def test_read_excel_cached_loads_the_parsed_sheet(tmp_path):
+    path = tmp_path / 'book.xlsx'
+    write_workbook(path)
+    cache_dir = tmp_path / 'cache'
+
+    df = read_excel_cached(path, 'Sheet1', cache_dir)
+    assert len(list(cache_dir.iterdir())) == 1
+    pd.testing.assert_frame_equal(read_excel_cached(path, 'Sheet1', cache_dir), df)
+    pd.testing.assert_frame_equal(read_excel_cached(path, 'Sheet1', cache_dir, nrows=5), df.head(5))
+
+
+def test_concurrent_reads_of_an_entry_do_not_collide(tmp_path):
+    path = tmp_path / 'book.xlsx'
+    write_workbook(path, rows=200)
+    expected = pd.read_excel(path, sheet_name='Sheet1')
+    cache_dir = tmp_path / 'cache'
+
+    with ThreadPoolExecutor(8) as pool:
+        frames = list(pool.map(lambda _: read_excel_cached(path, 'Sheet1', cache_dir), range(8)))
+    for df in frames:
+        pd.testing.assert_frame_equal(df, expected)
+    assert not list(cache_dir.glob('*.tmp'))
+
+
+def test_temporary_path_is_unique_per_thread(tmp_path):
+    # the threads wait for each other, so they are all alive (and have distinct ids) while taking their path
+    barrier, paths = threading.Barrier(4), []
+
+    def take_path():
+        paths.append(get_temporary_path(tmp_path / 'entry.pkl'))
+        barrier.wait()
+
+    threads = [threading.Thread(target=take_path) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(paths)) == 4
+
+
+def test_evict_cache_removes_least_recently_used_sheets_only(tmp_path):
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir()
+    for i, name in enumerate(['old', 'middle', 'new']):
+        entry = cache_dir / f'{name}.pkl'
+        entry.write_bytes(b'x' * 100)
+        os.utime(entry, (1000 + i, 1000 + i))
+    save_stored(pd.DataFrame({'a': [1.0]}), 'proportions', 'key', cache_dir)
+    assert get_store_path('proportions', 'key', cache_dir).parent.name == STORE_FOLDER
+
+    removed = evict_cache(cache_dir, budget=150)
+    assert [entry.name for entry in removed] == ['old.pkl', 'middle.pkl']
+    assert sorted(entry.name for entry in cache_dir.glob('*.pkl')) == ['new.pkl']
+    assert get_store_path('proportions', 'key', cache_dir).exists()
+
+    assert evict_cache(tmp_path / 'missing', budget=0) == []
+
+    removed = clear_cache(cache_dir)
+    assert sorted(entry.name for entry in removed) == ['new.pkl', 'proportions_key.pkl']
+    assert not list(cache_dir.rglob('*.pkl'))
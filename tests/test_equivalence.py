@@ -0,0 +1,240 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.mappings import *
+from utils.mapping_matrix import project_sources, project_to_base
+from utils.proportions import *
+from utils.seasonality import get_EPOS_months, get_fiscal_proportions
+from utils.utils import *
+
+# the engines replaced row loops and chained sums of the original functions. The reference functions below are
+# compact copies of those originals, the engines have to give the same floating point results on synthetic data
+
+
+def reference_transform_BIP_data(df):
+    """ Method to build the derived stats groups like the original transform_BIP_data, one concat per group """
+
+    for group, rows in [('Fortified Wine 1', ['HP Fortified', 'SP Fortified']),
+                        ('Still Wine', ['HP Wine', 'MP Wine', 'SP Wine', 'Perle Wine', 'Flavoured Wines']),
+                        ('Fortified Wine 2', ['HP Fortified', 'SP Fortified', 'Wine Aperitif']),
+                        ('CIDER & RTDs', ['Other Flavoured Beverages', 'Ciders', 'Spirit Cooler']),
+                        ('FABs', ['Other Flavoured Beverages', 'Spirit Cooler'])]:
+        total = df.loc[rows[0]]
+        for row in rows[1:]:
+            total = total + df.loc[row]
+        df = pd.concat([df, pd.DataFrame(data=[total], index=[group], columns=['Volume'])])
+    return df
+
+
+def reference_transform_data_orbis(df, rules):
+    """ Method to sum the rows of every rule with a filter and add the rules of a stats group up in rule order """
+
+    totals = {}
+    for category, subcategory, group in rules:
+        rows = pd.Series(True, index=df.index)
+        if category is not None:
+            rows &= df['PRODUCTCATEGORY'] == category
+        if subcategory is not None:
+            rows &= df['PRODUCTSUBCATEGORY'] == subcategory
+        totals[group] = totals.get(group, 0) + df[rows]['SALESVOLUME'].sum()
+    return pd.Series(totals)
+
+
+def reference_rollup(df, spec, columns):
+    """ Method to build the derived groups of a spec with chained df.loc additions in spec order """
+
+    rows, groups = {index: df.loc[index, columns] for index in df.index}, {}
+    for group, members in spec:
+        total = rows[members[0]]
+        for member in members[1:]:
+            total = total + rows[member]
+        rows[group] = groups[group] = total
+    return pd.DataFrame(groups).T
+
+
+def reference_adjusted_mean_estimate(row):
+    """ Method to calculate the adjusted mean of a single row like the original get_adjusted_mean_estimate """
+
+    mean = row[ESTIMATE_COLUMNS].mean()
+    diff = row[ESTIMATE_COLUMNS] - mean
+    diff = diff.dropna().apply(lambda x: np.abs(x)).sort_values(ascending=True)
+    if diff.shape[0] > 1:
+        return row.loc[diff[:-1].index].mean()
+    return row.loc[diff.index].mean()
+
+
+def reference_fiscal_years(df, halves_of_year):
+    """ Method to convert calendar years to fiscal years with a row loop per year like the original
+    fiscal_year_conversion and fiscal_year_conversion_value
+
+    param df: dataframe with a row per forecast and the years as integer columns
+    param halves_of_year: function of (row position, year) to the H1 and H2 proportions of the row
+    : return: dataframe with the fiscal years (e.g. '2021') as columns
+    """
+
+    years = [c for c in df.columns if isinstance(c, (int, np.integer))]
+    halves = {}
+    for year in years:
+        h1, h2 = np.zeros(len(df)), np.zeros(len(df))
+        for i in range(len(df)):
+            proportions = halves_of_year(i, year)
+            h1[i] = proportions['H1'] * df.iloc[i][year]
+            h2[i] = proportions['H2'] * df.iloc[i][year]
+        halves[year] = (h1, h2)
+
+    return pd.DataFrame(data={str(year): halves[year - 1][1] + halves[year][0] for year in years[1:]},
+                        index=df.index)
+
+
+def reference_H1_H2_Epos(df, year):
+    """ Method to get the H1 and H2 proportions of a year like the original H1_H2_Epos, one filter per subcategory """
+
+    df = df[df['COUNTRYNAME'] == 'South Africa'].copy()
+    df['PRODUCTSUBCATEGORY'] = df['PRODUCTSUBCATEGORY'].replace(['Cognac'], 'Brandy')
+    df['month'] = df['Realigned YYYYMM'].apply(lambda x: int(str(x)[5:]))
+    df = df[df['Realigned YYYYMM'].apply(lambda x: str(x)[:4]) == year]
+
+    data = {}
+    for subcategory, group in EPOS_SUBCATEGORIES.items():
+        subcategory_df = df[df['PRODUCTSUBCATEGORY'] == subcategory]
+        h1 = subcategory_df[subcategory_df['month'] <= 6]['SALESVOLUME'].sum()
+        h2 = subcategory_df[subcategory_df['month'] > 6]['SALESVOLUME'].sum()
+        data[group] = [h1 / (h1 + h2), h2 / (h1 + h2)]
+    return pd.DataFrame.from_dict(data, orient='index', columns=['H1', 'H2'])
+
+
+@pytest.fixture
+def gappy_epos():
+    """ Fixture with the monthly EPOS data without January 2019 and without the second half of 2020 for rum
+
+    : return: tuple of the full and the gappy monthly EPOS data
+    """
+
+    df = read_source('data_orbis_monthly')
+    period = df['Realigned YYYYMM'].astype(str)
+    rum_h2_2020 = (df['PRODUCTSUBCATEGORY'] == 'Rum') & (period >= '2020-07')
+    return df, df[(period != '2019-01') & ~rum_h2_2020].reset_index(drop=True)
+
+
+def test_project_to_base_matches_map_to_base_data():
+    groups = transform_BIP_data(get_income_statement_data('2020')).reset_index()['index']
+    df = get_IWSR_data('2019')
+
+    expected = groups.apply(map_to_base_data, args=[df, iwsr_mappings]).astype(float)
+    pd.testing.assert_series_equal(project_to_base(groups, df, iwsr_mappings), expected, check_exact=True,
+                                   check_names=False)
+
+
+def test_project_sources_matches_map_to_base_data():
+    groups = transform_BIP_data(get_income_statement_data('2020')).reset_index()['index']
+    sources = {'IWSR': (get_IWSR_data('2019'), iwsr_mappings),
+               'SALBA': (transform_SALBA_df(get_SALBA_data('2020')), salba_mappings),
+               'Global': (get_global_data('2020'), global_mappings)}
+
+    expected = pd.DataFrame({name: groups.apply(map_to_base_data, args=list(source)).astype(float)
+                             for name, source in sources.items()})
+    pd.testing.assert_frame_equal(project_sources(groups, sources), expected, check_exact=True)
+
+
+def test_projections_raise_for_missing_categories():
+    groups = transform_BIP_data(get_income_statement_data('2020')).reset_index()['index']
+    df = get_IWSR_data('2019').drop(index='Gin and Genever')
+
+    with pytest.raises(KeyError, match='Gin and Genever'):
+        groups.apply(map_to_base_data, args=[df, iwsr_mappings])
+    with pytest.raises(KeyError, match='Gin and Genever'):
+        project_to_base(groups, df, iwsr_mappings)
+    with pytest.raises(KeyError, match='Gin and Genever'):
+        project_sources(groups, {'IWSR': (df, iwsr_mappings)})
+
+
+def test_membership_matrix_matches_rule_filters():
+    df = read_source('data_orbis', '2020')
+    # a pair matched by two rules of a stats group counts twice, like it did in the sums of the rules
+    rules = data_orbis_rules + [('Beer', 'Beer', 'Beer')]
+
+    groups, membership = compile_data_orbis_rules(df, rules)
+    assert membership.shape == (len(groups), len(df)) and membership.has_sorted_indices
+
+    # the product adds the rows up one after the other instead of pairwise, which only differs in the last digits
+    expected = reference_transform_data_orbis(df, rules)
+    pd.testing.assert_series_equal(transform_data_orbis(df, rules)['Volume'], expected, check_names=False, rtol=1e-12)
+
+
+def test_rollup_matches_chained_sums():
+    df = get_income_statement_data('2020')
+    pd.testing.assert_frame_equal(transform_BIP_data(df), reference_transform_BIP_data(df), check_exact=True)
+
+    df = get_SALBA_data('2020')
+    columns = ['1st Quarter', '2nd Quarter', '3rd Quarter', '4th Quarter', 'Volume']
+    pd.testing.assert_frame_equal(transform_SALBA_df(df), reference_rollup(df, salba_rollup, columns),
+                                  check_exact=True, check_dtype=False, check_names=False)
+
+
+def test_adjusted_mean_matches_row_function():
+    # small integers give ties in distance, and missing estimates leave rows with 0, 1 or 2 estimates
+    rng = np.random.default_rng(0)
+    values = rng.integers(0, 5, size=(500, len(ESTIMATE_COLUMNS))).astype(float) * 1000.1
+    values[rng.random(values.shape) < 0.3] = np.nan
+    df = pd.DataFrame(data=values, columns=ESTIMATE_COLUMNS)
+
+    expected = df.apply(reference_adjusted_mean_estimate, axis=1)
+    adjusted = get_adjusted_mean_estimates(df)
+    pd.testing.assert_series_equal(adjusted['Avg Estimate'], expected, check_exact=True, check_names=False)
+
+    # the discarded source is the estimate furthest from the mean, nothing is discarded from sets of 0 or 1
+    count = df.notna().sum(axis=1)
+    distance = df.sub(df.mean(axis=1), axis=0).abs()
+    assert adjusted['Discarded Estimate'][count <= 1].isna().all()
+    for i in np.flatnonzero(count > 1):
+        assert distance.iloc[i][adjusted['Discarded Estimate'].iloc[i]] == distance.iloc[i].max()
+
+
+def test_fiscal_year_engine_matches_row_loops():
+    df_base, df_2020 = H1_H2_base('all_years')
+    df_forecasts = get_forecasts_volume()
+
+    expected = reference_fiscal_years(
+        df_forecasts, lambda i, year: (df_2020 if year == 2020 else df_base).loc[df_forecasts.index[i]])
+    pd.testing.assert_frame_equal(fiscal_year_engine(df_forecasts, df_base, df_2020), expected, check_exact=True)
+
+
+def test_fiscal_year_conversion_value_matches_row_loops():
+    df_base, _ = get_proportions('all_years')
+    df_forecast = get_forecasts_value()
+
+    expected = reference_fiscal_years(df_forecast, lambda i, year: df_base.loc[df_forecast.iloc[i]['SELECT']])
+    df = fiscal_year_conversion_value('all_years')
+    assert list(df.index) == list(df_forecast['SELECT'])
+    assert list(df['Price_band']) == list(df_forecast['PRICE BAND CORRECT'])
+    assert list(df['Index']) == list(df_forecast['INDEX'])
+    np.testing.assert_array_equal(df[expected.columns].to_numpy(), expected.to_numpy())
+
+
+@pytest.mark.parametrize('gappy', [False, True])
+def test_epos_halves_match_subcategory_filters(gappy_epos, gappy):
+    df = gappy_epos[gappy]
+    df_all_years = H1_H2_Epos_all_years(df)
+
+    # the halves are summed one row after the other instead of pairwise, which only differs in the last digits
+    for year in ['2019', '2020']:
+        pd.testing.assert_frame_equal(H1_H2_Epos(year, df_all_years), reference_H1_H2_Epos(df, year), rtol=1e-12)
+
+
+def test_sum_in_row_order_handles_empty_groups():
+    values = np.array([1.0, np.nan, 2.0, 4.0, 8.0])
+    codes = np.array([3, 0, 3, 0, 3])
+    np.testing.assert_array_equal(sum_in_row_order(values, codes, 5), [4.0, 0.0, 0.0, 11.0, 0.0])
+    np.testing.assert_array_equal(sum_in_row_order(np.array([]), np.array([], dtype=int), 2), [0.0, 0.0])
+
+
+def test_period_proportions_count_missing_months_as_zero(gappy_epos):
+    _, df = gappy_epos
+    df_all_years = H1_H2_Epos_all_years(df)
+    df_fiscal = get_fiscal_proportions(get_EPOS_months(df).reindex(columns=range(1, 13)), start_month=7)
+
+    # the cube sums the months with a groupby, so the proportions agree up to rounding
+    for (category, year), row in df_fiscal.iterrows():
+        np.testing.assert_allclose(row[['H1', 'H2']].to_numpy(dtype=float),
+                                   df_all_years[str(year)].loc[category, ['H1', 'H2']].to_numpy(dtype=float),
+                                   rtol=1e-12)
@@ -0,0 +1,130 @@
+import shutil
+import pandas as pd
+from pathlib import Path
+from utils import cache, pipeline, proportions
+from utils.cache import code_fingerprint
+from utils.pipeline import Stage, get_pipeline, plan_pipeline, run_pipeline, write_csv
+from utils.proportions import get_store_path
+
+UTILS_DIRECTORY = Path(pipeline.__file__).parent
+
+
+def get_stages(output_path, factor=2, calls=None):
+    """ Method to get a small pipeline of a load, a transform and a write stage
+
+    param output_path: path of the csv file of the write stage
+    param factor: parameter of the transform stage
+    param calls: list the names of the stages are appended to when they run
+    : return: dictionary of stage name to stage
+    """
+
+    calls = [] if calls is None else calls
+
+    def load():
+        calls.append('load')
+        return pd.DataFrame({'Volume': [1.0, 2.0]}, index=['Beer', 'Gin'])
+
+    def transform(df):
+        calls.append('transform')
+        return df * factor
+
+    stages = [Stage('load', 'transform', load),
+              Stage('double', 'transform', transform, ['load'], {'factor': factor}),
+              Stage('write', 'write', lambda df: write_csv(df, output_path), ['double'],
+                    {'output_path': str(output_path)}, output=output_path)]
+    return {stage.name: stage for stage in stages}
+
+
+def get_status(plan):
+    return dict(zip(plan['Stage'], plan['Status']))
+
+
+def test_only_changed_stages_run(tmp_path):
+    output_path = tmp_path / 'out.csv'
+    calls = []
+
+    plan = run_pipeline(get_stages(output_path, calls=calls), cache_dir=tmp_path)
+    assert get_status(plan) == {'load': 'run', 'double': 'run', 'write': 'run'}
+    assert pd.read_csv(output_path, index_col=0)['Volume'].tolist() == [2.0, 4.0]
+
+    assert get_status(plan_pipeline(get_stages(output_path), cache_dir=tmp_path)) == {
+        'load': 'skip', 'double': 'skip', 'write': 'cached'}
+
+    # a new parameter runs its stage and the stages downstream of it, the input comes from the store
+    calls.clear()
+    plan = run_pipeline(get_stages(output_path, factor=3, calls=calls), cache_dir=tmp_path)
+    assert get_status(plan) == {'load': 'cached', 'double': 'run', 'write': 'run'}
+    assert calls == ['transform']
+    assert pd.read_csv(output_path, index_col=0)['Volume'].tolist() == [3.0, 6.0]
+
+
+def test_overwritten_output_is_written_again(tmp_path):
+    output_path = tmp_path / 'out.csv'
+    run_pipeline(get_stages(output_path), cache_dir=tmp_path)
+    expected = output_path.read_bytes()
+
+    # e.g. written by a command with other parameters, the file exists but is not the one of this key
+    pd.DataFrame({'Volume': [0.0]}).to_csv(output_path)
+    assert get_status(plan_pipeline(get_stages(output_path), cache_dir=tmp_path))['write'] == 'run'
+
+    run_pipeline(get_stages(output_path), cache_dir=tmp_path)
+    assert output_path.read_bytes() == expected
+    assert get_status(plan_pipeline(get_stages(output_path), cache_dir=tmp_path))['write'] == 'cached'
+
+
+def test_input_evicted_after_planning_is_run_again(tmp_path, monkeypatch):
+    output_path = tmp_path / 'out.csv'
+    run_pipeline(get_stages(output_path), cache_dir=tmp_path)
+
+    plan = plan_pipeline(get_stages(output_path, factor=3), cache_dir=tmp_path)
+    assert get_status(plan)['load'] == 'cached'
+    key = dict(zip(plan['Stage'], plan['Key']))['load']
+    get_store_path('stage_load', key, tmp_path).unlink()
+    proportions._store.clear()
+    monkeypatch.setattr(pipeline, 'plan_pipeline', lambda *args: plan.copy())
+
+    plan = run_pipeline(get_stages(output_path, factor=3), cache_dir=tmp_path)
+    assert get_status(plan) == {'load': 'run', 'double': 'run', 'write': 'run'}
+    assert pd.read_csv(output_path, index_col=0)['Volume'].tolist() == [3.0, 6.0]
+
+
+def test_code_fingerprint_only_covers_the_code_used(tmp_path):
+    directory = tmp_path / 'utils'
+    shutil.copytree(UTILS_DIRECTORY, directory, ignore=shutil.ignore_patterns('__pycache__'))
+    modules = [['utils.estimates'], ['utils.price_bands'], ['utils.proportions']]
+    before = [code_fingerprint(m, directory) for m in modules]
+
+    def edit(name, old, new):
+        path = directory / f'{name}.py'
+        path.write_text(path.read_text().replace(old, new, 1))
+        cache._code_hashes.clear()
+        return [code_fingerprint(m, directory) for m in modules]
+
+    # the benchmark and the synthetic data are not used by any stage
+    assert edit('benchmark', 'REGRESSION_TOLERANCE = 0.25', 'REGRESSION_TOLERANCE = 0.5') == before
+    assert edit('synthetic', 'SCALES = [1, 10, 100]', 'SCALES = [1, 10]') == before
+
+    # a mapping only changes the code using it
+    after = edit('mappings', "sawis_mappings = {'Still Wine': ['Still Wine']", "sawis_mappings = {'Still Wine': []")
+    assert after[0] != before[0] and after[1:] == before[1:]
+
+
+def test_pipeline_rewrites_output_of_another_command(tmp_path, monkeypatch):
+    # run the pipeline, write the fiscal years of another start month, the pipeline writes its own ones again
+    monkeypatch.chdir(tmp_path)
+    Path('out').mkdir()
+    cache_dir = tmp_path / 'cache'
+
+    run_pipeline(get_pipeline(), cache_dir=cache_dir)
+    output_path = Path('out') / 'Forecast_Fiscal_Year.csv'
+    expected = output_path.read_bytes()
+
+    plan = run_pipeline(get_pipeline(start_month=1), targets=['write_fiscal_volume'], cache_dir=cache_dir)
+    assert get_status(plan)['write_fiscal_volume'] == 'run'
+    assert output_path.read_bytes() != expected
+
+    plan = run_pipeline(get_pipeline(), cache_dir=cache_dir)
+    status = get_status(plan)
+    assert status['write_fiscal_volume'] == 'run' and status['fiscal_volume'] == 'cached'
+    assert status['write_estimates'] == 'cached'
+    assert output_path.read_bytes() == expected
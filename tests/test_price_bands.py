@@ -0,0 +1,50 @@
+import re
+import numpy as np
+import pandas as pd
+from utils.price_bands import *
+
+# rows of the allocation of the original category_to_priceband, in order
+ALLOCATION_LABELS = ['Still_Alcohol', 'Still_Low_Alcohol', 'Still_No_Alcohol', 'Sparkling_Alcohol',
+                     'Sparkling_No_Alcohol', 'Fortified_Alcohol', 'Aperitif_Low_Alcohol', 'Brandy_Alcohol',
+                     'Brandy_Low_Alcohol', 'Cane_Alcohol', 'Gin_Alcohol', 'Gin_Low_Alcohol', 'Liqueurs_Alcohol',
+                     'Rum_Alcohol', 'Tequila_Alcohol', 'Tequila_Low_Alcohol', 'Vodka_Alcohol', 'Vodka_Low_Alcohol',
+                     'Whisky_Alcohol', 'Cider_Alcohol', 'Cider_Low_Alcohol', 'Cider_No_Alcohol', 'Fabs_Alcohol',
+                     'Fabs_Low_Alcohol', 'Fabs_No_Alcohol', 'Beer_Alcohol', 'Beer_Low_Alcohol', 'Beer_No_Alcohol']
+
+
+def test_category_to_priceband_keeps_the_original_rows():
+    shares = get_price_band_shares('2020', 'SALESVOLUME')
+    category_df = get_IWSR_data_estimates('2020')
+    df = category_to_priceband(category_df, shares)
+    assert list(df.index) == ALLOCATION_LABELS
+
+    # every row is the IWSR volume of the category times the price band split of its subcategory and index
+    table = price_band_table(shares).reindex(PRICE_BANDS).fillna(0)
+    for name, (prefix, indices) in IWSR_PRICE_BAND_ROWS.items():
+        for index in indices:
+            volume = category_df.loc[IWSR_PRICE_BAND_CATEGORIES[name], IWSR_VOLUME_COLUMNS[index]]
+            np.testing.assert_array_equal(df.loc[f'{prefix}_{index}'].to_numpy(),
+                                          volume * table[f'{name}_{index}'].to_numpy())
+
+
+def test_product_descriptions_match_the_longest_keyword_and_the_keywords_inside_it():
+    descriptions = pd.Series(['CASTLE LITE 330ML', 'castle 440ml', 'AMSTEL 330ML', None])
+    hits = match_product_descriptions(descriptions, ['CASTLE', 'CASTLE LITE', '330ML', '440ML'])
+    np.testing.assert_array_equal(hits.to_numpy(), [[True, True, True, False], [False, False, False, False],
+                                                    [False, False, True, False], [False, False, False, False]])
+
+    hits = match_product_descriptions(descriptions, ['CASTLE', '440ML'], case=False)
+    np.testing.assert_array_equal(hits.to_numpy(), [[True, False], [True, True], [False, False], [False, False]])
+
+    tags = tag_product_descriptions(descriptions, {'440ML': '440ml', '330ML': '330ml'}, case=False)
+    assert tags.tolist()[:3] == ['330ml', '440ml', '330ml'] and pd.isna(tags.iloc[3])
+
+
+def test_empty_keywords_match_no_description():
+    descriptions = pd.Series(['CASTLE LITE 330ML', 'AMSTEL 440ML'])
+    assert re.fullmatch(keyword_pattern(['', ' ', '330ML']), '330ML')
+    assert not re.search(keyword_pattern(['', ' ', '330ML']), 'CASTLE LITE')
+
+    hits = match_product_descriptions(descriptions, ['', ' ', '330ML'])
+    np.testing.assert_array_equal(hits.to_numpy(), [[False, False, True], [False, False, False]])
+    assert not match_product_descriptions(descriptions, ['', '  ']).to_numpy().any()
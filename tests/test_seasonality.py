@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from utils.seasonality import *
+from utils.utils import *
+
+
+def test_SALBA_months_come_from_the_quarterly_volumes():
+    months = get_SALBA_months('2020')
+    df = transform_SALBA_df(get_SALBA_data('2020'))
+
+    # every quarter is spread evenly over its months, the quarters add up to the volumes of transform_SALBA_df
+    quarters = months.xs(2020, level='year').to_numpy().reshape(len(df), 4, 3)
+    np.testing.assert_allclose(quarters, np.repeat(quarters[:, :, :1], 3, axis=2))
+    np.testing.assert_allclose(quarters.sum(axis=2), df.loc[months.xs(2020, level='year').index, SALBA_QUARTERS],
+                               rtol=1e-12)
+
+
+def test_periods_within_halves_or_quarters_are_not_resolved(tmp_path):
+    cube = get_seasonality_cube(cache_dir=tmp_path)
+
+    # quarters cut the SARS halves, months cut the SALBA quarters as well
+    assert get_unresolved_sources(['SARS', 'SAWIS', 'SALBA', 'EPOS'], 7, 3) == ['SARS']
+    assert get_unresolved_sources(['SARS', 'SAWIS', 'SALBA', 'EPOS'], 1, 1) == ['SARS', 'SALBA']
+
+    df = get_period_proportions(cube, 7, 3)
+    assert df.loc['SARS'].isna().all().all()
+    assert df.drop(index='SARS').notna().any(axis=1).all()
+    np.testing.assert_allclose(df.drop(index='SARS').sum(axis=1), 1.0)
+
+
+def test_fiscal_year_proportions_need_a_start_month_on_the_halves(tmp_path):
+    df_base, df_2020 = get_fiscal_year_proportions(1, cache_dir=tmp_path)
+    np.testing.assert_array_equal(df_base['H1'], 1.0)
+    np.testing.assert_array_equal(df_2020['H2'], 0.0)
+
+    with pytest.raises(ValueError, match='SARS'):
+        get_fiscal_year_proportions(4, cache_dir=tmp_path)
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+from utils import utils
+from utils.estimates import get_estimates, get_run_requests
+from utils.pipeline import load_stage
+from utils.sources import SourceRegistry
+from utils.utils import get_data_orbis, read_sheet_chunks
+
+
+def test_read_sheet_chunks_keeps_the_requested_columns(tmp_path):
+    path = tmp_path / 'book.xlsx'
+    df = pd.DataFrame({'A': range(10), 'B': [f'b{i}' for i in range(10)], 'C': np.arange(10) * 0.5})
+    df.to_excel(path, sheet_name='Sheet1', index=False)
+
+    chunks = list(read_sheet_chunks(path, 'Sheet1', ['C', 'A'], 4))
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), df[['C', 'A']], check_dtype=False)
+
+
+def test_streamed_data_orbis_matches_the_sheet():
+    df = get_data_orbis('2020', chunksize=0)
+    streamed = get_data_orbis('2020', chunksize=3)
+
+    pd.testing.assert_frame_equal(streamed.sort_values(['PRODUCTCATEGORY', 'PRODUCTSUBCATEGORY'], ignore_index=True),
+                                  df.sort_values(['PRODUCTCATEGORY', 'PRODUCTSUBCATEGORY'], ignore_index=True),
+                                  check_dtype=False, rtol=1e-12)
+
+
+def test_streamed_data_orbis_is_not_loaded_into_the_registry(monkeypatch):
+    assert any('data_orbis' in str(base_dir) for base_dir, _, _ in get_run_requests())
+    expected = get_estimates(sources=SourceRegistry())
+
+    monkeypatch.setattr(utils, 'DATA_ORBIS_CHUNKSIZE', 3)
+    assert not any('data_orbis' in str(base_dir) for base_dir, _, _ in get_run_requests())
+
+    sources = SourceRegistry()
+    assert load_stage('data_orbis', '2020', sources).build().suffix == '.xlsx'
+    df = get_estimates(sources=sources)
+    assert not any(source.startswith('data_orbis') for source, _, _ in sources.frames)
+    pd.testing.assert_frame_equal(df, expected, rtol=1e-12)
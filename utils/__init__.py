@@ -0,0 +1,5 @@
+from pathlib import Path
+
+# folder the stages and the pipeline write their csv files to, relative to the working directory and created by main.
+# Kept here so that main.py can use it without importing the heavy modules of the stages
+OUTPUT_DIRECTORY = Path('out')
@@ -0,0 +1,144 @@
+
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from utils.mappings import iwsr_mappings
+from utils.sources import SourceRegistry
+from utils.mapping_matrix import project_to_base
+from utils.estimates import STATS_GROUPS, get_estimates, get_run_requests
+from utils.utils import *
+
+# sources read for a (current year, last year) pair, with the years of the pair they are read for
+BACKTEST_SOURCES = {
+    'income_statement': ['current_year', 'last_year'],
+    'IWSR': ['current_year', 'last_year'],
+    'SALBA': ['current_year'],
+    'SAWIS': ['current_year'],
+    'GLOBAL_data': ['current_year'],
+    'data_orbis': ['current_year', 'last_year'],
+}
+
+BACKTEST_ESTIMATES = ['IWSR Estimate', 'SALBA Estimate', 'SAWIS Estimate', 'GLOBAL Estimate', 'Data Orbis Estimate',
+                      'Avg Estimate']
+
+# registry of the worker process, filled once per worker by _init_worker
+_worker_sources = None
+
+
+def get_year_pairs():
+    """ Method to find every (current year, last year) pair for which all sources are in the data directory.
+    The IWSR data of the current year is needed as well, since the estimates are compared against it
+
+    : return: list of (current year, last year) tuples, e.g. [('2019', '2018'), ('2020', '2019')]
+    """
+
+    years = {}
+    for source in BACKTEST_SOURCES:
+        source_dir = DATA_DIRECTORY / source
+        if source_dir.is_dir():
+            years[source] = {x.name for x in source_dir.iterdir() if x.is_dir() and x.name.isdigit()}
+        else:
+            years[source] = set()
+
+    missing = [source for source, source_years in years.items() if not source_years]
+    if missing:
+        raise ValueError(f'No year folders of {", ".join(missing)} found in {DATA_DIRECTORY}')
+
+    pairs = []
+    for current_year in sorted(set.intersection(*years.values())):
+        last_year = str(int(current_year) - 1)
+        if all(last_year in years[source] for source, needed in BACKTEST_SOURCES.items() if 'last_year' in needed):
+            pairs.append((current_year, last_year))
+    return pairs
+
+
+def load_sources(year_pairs, sources=None, max_workers=None):
+    """ Method to read all source sheets needed for the year pairs. Every source year is read once,
+    also when it is needed by several overlapping pairs, and the workbooks are loaded in parallel
+
+    param year_pairs: list of (current year, last year) tuples
+    param sources: optional SourceRegistry to fill, a new one is used by default
+    param max_workers: number of threads used to load the workbooks
+    : return: SourceRegistry holding every sheet needed for the backtest
+    """
+
+    if sources is None:
+        sources = SourceRegistry()
+
+    requests = []
+    for current_year, last_year in year_pairs:
+        requests += get_run_requests(current_year, last_year) + [get_source_request('IWSR', current_year)]
+    sources.prefetch(requests, max_workers)
+
+    # wait for every sheet, so that the workers receive all of them
+    for base_dir, sheet_name, read_kwargs in requests:
+        sources.read_sheet(base_dir, sheet_name, **read_kwargs)
+    return sources
+
+
+def _init_worker(frames):
+    """ Method to set up the registry of a worker process with the sheets loaded by the parent process
+
+    param frames: dictionary of loaded sheets of a SourceRegistry
+    """
+
+    global _worker_sources
+    _worker_sources = SourceRegistry()
+    _worker_sources.frames = frames
+
+
+def get_backtest_errors(current_year, last_year, sources=None):
+    """ Method to compare the estimates of a year against the actual IWSR data of that year
+
+    param current_year: year that is estimated
+    param last_year: year before current year
+    param sources: optional SourceRegistry holding the loaded sheets, the registry of the worker by default
+    : return: tidy dataframe with the estimate, actual volume and error per stats group and source
+    """
+
+    sources = sources if sources is not None else _worker_sources
+    base_df = get_estimates(current_year, last_year, sources).loc[STATS_GROUPS]
+
+    # the actual IWSR volumes of the current year, mapped onto the stats groups
+    actual = project_to_base(pd.Series(base_df.index, index=base_df.index), get_IWSR_data(current_year, sources),
+                             iwsr_mappings)
+
+    df = base_df[BACKTEST_ESTIMATES].rename_axis('Category').reset_index()
+    df = df.melt(id_vars='Category', var_name='Source', value_name='Estimate')
+    df['Source'] = df['Source'].str.replace(' Estimate', '')
+    df['Year'] = current_year
+    df['Actual'] = df['Category'].map(actual)
+    df['Error'] = abs((df['Estimate'] / df['Actual']) - 1)
+    return df[['Category', 'Source', 'Year', 'Estimate', 'Actual', 'Error']]
+
+
+def _backtest_pair(pair):
+    """ Method to run the backtest of a single (current year, last year) pair in a worker process """
+
+    return get_backtest_errors(*pair)
+
+
+def backtest_IWSR_estimates(year_pairs=None, max_workers=None):
+    """ Method to backtest the estimates of every year in the data history against the actual IWSR data.
+    All source years are read once in the parent process and shared with a pool of worker processes,
+    which estimate the year pairs in parallel
+
+    param year_pairs: list of (current year, last year) tuples, defaults to every pair found in the data directory
+    param max_workers: number of worker processes, 1 runs the pairs in the current process
+    : return: tidy dataframe with the error per stats group (Category), source and year
+    """
+
+    if year_pairs is None:
+        year_pairs = get_year_pairs()
+    if not year_pairs:
+        raise ValueError(f'No years with all backtest sources found in {DATA_DIRECTORY}')
+
+    sources = load_sources(year_pairs, max_workers=max_workers)
+
+    if max_workers == 1:
+        results = [get_backtest_errors(current_year, last_year, sources) for current_year, last_year in year_pairs]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(sources.frames,)) as executor:
+            results = list(executor.map(_backtest_pair, year_pairs))
+
+    return pd.concat(results, ignore_index=True)
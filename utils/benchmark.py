@@ -0,0 +1,250 @@
+
+import os
+import sys
+import json
+import time
+import hashlib
+import shutil
+import platform
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from datetime import datetime
+from utils.cache import STORE_FOLDER
+from utils.synthetic import SCALES, generate_synthetic_data
+
+MAIN_PATH = Path(__file__).resolve().parent.parent / 'main.py'
+
+# stages timed by the benchmark, with their arguments of main.py. all-stages runs main.py without a command,
+# i.e. the estimate, price-bands and fiscal-volume stages one after the other
+BENCHMARK_STAGES = {
+    'estimate': ['estimate'],
+    'price-bands': ['price-bands'],
+    'price-bands-long': ['price-bands', '--long'],
+    'fiscal-volume': ['fiscal-volume'],
+    'fiscal-value': ['fiscal-value'],
+    'seasonality': ['seasonality'],
+    'backtest': ['backtest', '--workers', '1'],
+    'all-stages': [],
+    'pipeline': ['pipeline'],
+}
+
+# a stage is reported as a regression when it is this much slower than the baseline
+REGRESSION_TOLERANCE = 0.25
+
+# cache states every stage is timed in. cold starts with an empty cache folder, warm keeps the parsed sheets but not
+# the objects built from them (the proportions, the seasonality cube and the pipeline stages), cached keeps both
+CACHE_STATES = ['cold', 'warm', 'cached']
+
+
+def clear_stores(cache_dir):
+    """ Method to remove the stored objects from a cache folder and keep the parsed sheets. The objects are kept in
+    the store folder of the cache, see STORE_FOLDER and get_store_path
+
+    param cache_dir: cache folder of the run
+    : return: number of removed entries
+    """
+
+    store_dir = Path(cache_dir) / STORE_FOLDER
+    entries = list(store_dir.glob('*.pkl')) if store_dir.exists() else []
+    shutil.rmtree(store_dir, ignore_errors=True)
+    return len(entries)
+
+
+def prepare_cache(cache_dir, cache):
+    """ Method to bring the cache folder of a run into a cache state, see CACHE_STATES. The states are prepared in
+    order, warm and cached start from the cache folder left by the run before them
+
+    param cache_dir: cache folder of the run
+    param cache: cache state, one of CACHE_STATES
+    : return: None
+    """
+
+    if cache == 'cold':
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    elif cache == 'warm':
+        clear_stores(cache_dir)
+    elif cache != 'cached':
+        raise ValueError(f'Unknown cache state {cache}')
+
+
+def check_outputs(out_dir):
+    """ Method to check the csv files written by a run, so that a stage that fails quietly (e.g. writes only NaN)
+    does not benchmark as fast. A run has to write at least one file, and every file needs rows and a value in
+    every column
+
+    param out_dir: out folder of the run, emptied before the run
+    : return: dictionary of file name to its sha256 digest, number of rows and number of missing values
+    """
+
+    outputs = {}
+    for path in sorted(Path(out_dir).glob('*.csv')):
+        df = pd.read_csv(path, index_col=0)
+        empty = [str(column) for column in df.columns if df[column].isna().all()]
+        if df.empty or empty:
+            raise RuntimeError(f'{path.name} has no rows or columns without values: {empty}')
+        outputs[path.name] = {'sha256': hashlib.sha256(path.read_bytes()).hexdigest(), 'rows': len(df),
+                              'missing': int(df.isna().sum().sum())}
+
+    if not outputs:
+        raise RuntimeError(f'No csv files written to {out_dir}')
+    return outputs
+
+
+def time_stage(arguments, data_dir, cache_dir, work_dir):
+    """ Method to time a stage of main.py in a new process, so every run pays for the imports and starts without
+    the sheets of earlier runs in memory. The out folder is emptied before the run and its files are checked after it
+
+    param arguments: arguments of main.py, e.g. ['estimate']
+    param data_dir: data folder of the run
+    param cache_dir: cache folder of the run, prepared by prepare_cache
+    param work_dir: working directory of the run, the out folder is created in it
+    : return: tuple of the wall clock time of the run in seconds and the outputs, see check_outputs
+    """
+
+    out_dir = Path(work_dir, 'out')
+    shutil.rmtree(out_dir, ignore_errors=True)
+    out_dir.mkdir(parents=True)
+    env = dict(os.environ, MARKET_SIZING_CACHE=str(cache_dir))
+    command = [sys.executable, str(MAIN_PATH), '--data-dir', str(data_dir)] + arguments
+
+    start = time.perf_counter()
+    process = subprocess.run(command, cwd=work_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                             universal_newlines=True)
+    seconds = time.perf_counter() - start
+
+    if process.returncode != 0:
+        raise RuntimeError(f'{" ".join(arguments) or "all-stages"} failed:\n{process.stderr[-2000:]}')
+    return seconds, check_outputs(out_dir)
+
+
+def summarise(seconds):
+    """ Method to summarise the times of the repeats of a benchmark
+
+    param seconds: list of times in seconds
+    : return: dictionary with the times, the best and the median time
+    """
+
+    return {'seconds': [round(s, 4) for s in seconds], 'best': round(min(seconds), 4),
+            'median': round(float(np.median(seconds)), 4)}
+
+
+def run_benchmarks(scales=SCALES, stages=None, repeat=3, work_dir=None, seed=0):
+    """ Method to time every stage on synthetic data of every scale. Every stage is timed cold, with an empty cache
+    folder so all workbooks are parsed, warm, with the parsed sheets but without the stored proportions and stages,
+    and cached, with everything stored by the runs before. The outputs of every run are checked and have to be the
+    same in every cache state and repeat. The synthetic data of a scale is written once and reused by later
+    benchmarks with the same work_dir
+
+    param scales: row count multipliers of the synthetic data, see generate_synthetic_data
+    param stages: names of the stages to time, see BENCHMARK_STAGES, all stages by default
+    param repeat: number of runs of every stage in every cache state
+    param work_dir: folder of the synthetic data and the runs, a temporary folder by default
+    param seed: seed of the synthetic data
+    : return: dictionary with the environment and a list of results per scale, stage and cache state
+    """
+
+    stages = list(BENCHMARK_STAGES) if stages is None else stages
+    work_dir = Path(work_dir or tempfile.mkdtemp(prefix='market_sizing_benchmark_'))
+
+    results = []
+    for scale in scales:
+        scale_dir = work_dir / f'scale_{scale}'
+        data_dir = scale_dir / 'data'
+        if not data_dir.exists():
+            start = time.perf_counter()
+            generate_synthetic_data(data_dir, scale, seed=seed)
+            results.append(dict(scale=scale, stage='generate', cache='none',
+                                **summarise([time.perf_counter() - start])))
+
+        for stage in stages:
+            timings = {cache: [] for cache in CACHE_STATES}
+            outputs = None
+            for _ in range(repeat):
+                cache_dir = scale_dir / 'cache'
+                for cache in CACHE_STATES:
+                    prepare_cache(cache_dir, cache)
+                    seconds, run_outputs = time_stage(BENCHMARK_STAGES[stage], data_dir, cache_dir, scale_dir)
+                    if outputs is not None and run_outputs != outputs:
+                        raise RuntimeError(f'{stage} wrote different outputs in the {cache} run')
+                    outputs = run_outputs
+                    timings[cache].append(seconds)
+            for cache, seconds in timings.items():
+                results.append(dict(scale=scale, stage=stage, cache=cache, outputs=outputs, **summarise(seconds)))
+                print(f'scale {scale:>4} {stage:<18}{cache:<7}{min(seconds):9.3f}s')
+
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': repeat,
+        'seed': seed,
+        'results': results,
+    }
+
+
+def write_benchmarks(benchmarks, output_path):
+    """ Method to write the results of run_benchmarks as JSON
+
+    param benchmarks: dictionary from run_benchmarks
+    param output_path: path of the JSON file
+    : return: path of the JSON file
+    """
+
+    with open(output_path, 'w') as f:
+        json.dump(benchmarks, f, indent=2)
+    return output_path
+
+
+def read_benchmarks(path):
+    """ Method to read the results written by write_benchmarks
+
+    param path: path of the JSON file
+    : return: dictionary with the environment and the results
+    """
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def get_output_digests(benchmarks):
+    """ Method to get the digests of the files written by every benchmark, results of earlier versions of the
+    benchmark without outputs have no digests
+
+    param benchmarks: dictionary from run_benchmarks or read_benchmarks
+    : return: list of the file names and their sha256 digest per result, None for results without outputs
+    """
+
+    return [None if result.get('outputs') is None else
+            sorted((name, output['sha256']) for name, output in result['outputs'].items())
+            for result in benchmarks['results']]
+
+
+def compare_benchmarks(baseline, benchmarks, tolerance=REGRESSION_TOLERANCE):
+    """ Method to compare the best times of two benchmark runs, e.g. of a change against the results of master.
+    With the same seed both runs read the same synthetic data, so their outputs have to be the same as well
+
+    param baseline: dictionary from run_benchmarks or read_benchmarks to compare against
+    param benchmarks: dictionary from run_benchmarks or read_benchmarks
+    param tolerance: relative slow down that is reported as a regression
+    : return: dataframe with the baseline and current best time, their ratio, whether it is a regression and whether
+        the outputs changed (None if either run has no outputs), for every scale, stage and cache state in both runs
+    """
+
+    keys = ['scale', 'stage', 'cache']
+    df_baseline = pd.DataFrame(baseline['results'])[keys + ['best']].assign(outputs=get_output_digests(baseline))
+    df = pd.DataFrame(benchmarks['results'])[keys + ['best']].assign(outputs=get_output_digests(benchmarks))
+
+    df = df_baseline.merge(df, on=keys, suffixes=['_baseline', '_current'])
+    df['ratio'] = df['best_current'] / df['best_baseline']
+    df['regression'] = df['ratio'] > 1 + tolerance
+
+    same_seed = baseline.get('seed') == benchmarks.get('seed')
+    df['outputs_changed'] = [None if not same_seed or a is None or b is None else a != b
+                             for a, b in zip(df.pop('outputs_baseline'), df.pop('outputs_current'))]
+    return df
@@ -0,0 +1,360 @@
+
+import os
+import ast
+import pickle
+import hashlib
+import threading
+import importlib.util
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+full_path = Path().resolve()
+CACHE_DIRECTORY = Path(os.environ.get('MARKET_SIZING_CACHE', full_path.parent / 'Market Sizing' / 'cache'))
+CACHE_SIZE_BUDGET = 2 * 1024 ** 3 # bytes kept on disk before the least recently used entries are evicted
+# subfolder of the cache directory with the objects built from the sheets (proportions, seasonality cube, pipeline
+# stages), see get_store_path. They are kept apart from the parsed sheets and do not count against CACHE_SIZE_BUDGET
+STORE_FOLDER = 'store'
+# modules of the utils package holding data rather than code. Code is fingerprinted on the entries of these modules
+# it refers to instead of on their whole file, so that a change of one mapping only affects the code using it
+DATA_MODULES = ['mappings']
+
+_COLUMNS_KEY = b'market_sizing.columns'
+_content_hashes = {}
+_code_hashes = {}
+
+
+def file_fingerprint(path):
+    """ Method to fingerprint a source file on path, size, modification time and content hash.
+    The content hash is only recomputed within a run when the size or modification time changes
+
+    param path: path of the file to fingerprint
+    : return: tuple of (resolved path, size in bytes, modification time in ns, sha256 of the content)
+    """
+
+    path = Path(path).resolve()
+    stat = path.stat()
+    stamp = (str(path), stat.st_size, stat.st_mtime_ns)
+
+    if stamp not in _content_hashes:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(block)
+        _content_hashes[stamp] = sha.hexdigest()
+
+    return stamp + (_content_hashes[stamp],)
+
+
+def get_module_imports(name, directory):
+    """ Method to get the modules of a package that a module imports, at the top or inside its functions
+
+    param name: name of the module in the package, e.g. 'estimates', or '__init__' for the package itself
+    param directory: directory of the package
+    : return: set of the names of the imported modules of the package
+    """
+
+    tree = ast.parse((directory / f'{name}.py').read_text(encoding='utf-8'))
+    imports = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            parts = node.module.split('.')
+            if parts[0] == directory.name:
+                imports.add(parts[1] if len(parts) > 1 else '__init__')
+        elif isinstance(node, ast.Import):
+            imports.update(alias.name.split('.')[1] for alias in node.names
+                           if alias.name.startswith(f'{directory.name}.'))
+    return imports
+
+
+def get_module_closure(modules, directory):
+    """ Method to get the modules of a package that are used by a set of modules, i.e. the modules themselves, the
+    package and every module they import directly or through other modules of the package
+
+    param modules: names of the modules, e.g. ['utils.estimates']
+    param directory: directory of the package
+    : return: sorted list of the names of the modules in the package, e.g. ['__init__', 'cache', 'estimates', ...]
+    """
+
+    pending = ['__init__'] + [module.split('.', 1)[1] if '.' in module else '__init__' for module in modules]
+    closure = set()
+    while pending:
+        name = pending.pop()
+        if name not in closure and (directory / f'{name}.py').exists():
+            closure.add(name)
+            pending += get_module_imports(name, directory)
+    return sorted(closure)
+
+
+def get_referenced_names(name, directory):
+    """ Method to get every name a module refers to, as a variable or as an attribute, e.g. iwsr_mappings
+
+    param name: name of the module in the package
+    param directory: directory of the package
+    : return: set of names
+    """
+
+    tree = ast.parse((directory / f'{name}.py').read_text(encoding='utf-8'))
+    return ({node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+            | {node.attr for node in ast.walk(tree) if isinstance(node, ast.Attribute)})
+
+
+def code_fingerprint(modules, directory=None):
+    """ Method to fingerprint the code a calculation uses. Objects that are built by the code and kept in the store
+    are keyed on it, so they are built again after a change of the code they use, e.g. of a mapping or a
+    transformation, but not after a change of unrelated modules such as the benchmark. The fingerprint covers the
+    source of every module the given modules use (see get_module_closure) and, for the data modules (see
+    DATA_MODULES), only the entries these modules refer to
+
+    param modules: names of the modules the calculation calls, e.g. ['utils.estimates']
+    param directory: directory of the package, defaults to the utils package
+    : return: sha256 of the names and contents of the modules and of the data entries
+    """
+
+    directory = Path(directory or Path(__file__).parent).resolve()
+    memo_key = (directory, tuple(sorted(modules)))
+    if memo_key not in _code_hashes:
+        closure = get_module_closure(modules, directory)
+        code = [name for name in closure if name not in DATA_MODULES]
+
+        sha = hashlib.sha256()
+        for name in code:
+            sha.update(name.encode('utf-8'))
+            sha.update((directory / f'{name}.py').read_bytes())
+
+        referenced = set().union(*[get_referenced_names(name, directory) for name in code])
+        for name in [name for name in closure if name in DATA_MODULES]:
+            spec = importlib.util.spec_from_file_location(f'{directory.name}.{name}', directory / f'{name}.py')
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            entries = sorted(entry for entry in vars(module) if entry in referenced and not entry.startswith('_'))
+            sha.update(repr([(name, entry, getattr(module, entry)) for entry in entries]).encode('utf-8'))
+        _code_hashes[memo_key] = sha.hexdigest()
+
+    return _code_hashes[memo_key]
+
+
+def _entry_key(path, sheet_name, read_kwargs):
+    """ Method to build the cache key of a parsed sheet from the file fingerprint and the read arguments
+
+    param path: path of the workbook
+    param sheet_name: name of the sheet that is parsed
+    param read_kwargs: keyword arguments passed on to pd.read_excel, e.g. skiprows and nrows
+    : return: hex digest identifying the cache entry
+    """
+
+    key = repr((file_fingerprint(path), sheet_name, sorted(read_kwargs.items())))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _parquet():
+    """ Method to import pyarrow lazily, parquet entries are only written when it is installed
+
+    : return: tuple of the pyarrow and pyarrow.parquet modules, or None if pyarrow is not installed
+    """
+
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None
+    return pa, pq
+
+
+def get_temporary_path(path):
+    """ Method to get a temporary path next to a cache entry that is unique to the process and thread writing it,
+    so that the threads of a prefetch writing the same entry never write to the same temporary file
+
+    param path: path of the cache entry
+    : return: path of the temporary file
+    """
+
+    return path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+
+
+def _write_entry(df, stem):
+    """ Method to write a parsed sheet to the cache. Parquet is used when pyarrow is available and the frame
+    converts cleanly, otherwise the frame is pickled (e.g. object columns mixing '-' and numbers)
+
+    param df: parsed sheet
+    param stem: cache path without suffix
+    : return: path of the written entry
+    """
+
+    path, writer = stem.with_suffix('.pkl'), df.to_pickle
+
+    modules = _parquet()
+    if modules is not None:
+        pa, pq = modules
+        # parquet only accepts string column names, the original labels (e.g. int years) are kept in the metadata
+        frame = df.copy()
+        frame.columns = [str(i) for i in range(frame.shape[1])]
+        try:
+            table = pa.Table.from_pandas(frame)
+        except (pa.ArrowException, TypeError, ValueError):
+            table = None
+        if table is not None:
+            metadata = dict(table.schema.metadata or {})
+            metadata[_COLUMNS_KEY] = pickle.dumps(df.columns)
+            table = table.replace_schema_metadata(metadata)
+            path, writer = stem.with_suffix('.parquet'), lambda p: pq.write_table(table, p)
+
+    # write to a temporary file first so that concurrent readers never see a partial entry
+    tmp_path = get_temporary_path(path)
+    writer(tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _read_entry(path):
+    """ Method to read a cache entry written by _write_entry
+
+    param path: path of the cache entry
+    : return: parsed sheet as a pandas dataframe
+    """
+
+    if path.suffix == '.pkl':
+        return pd.read_pickle(path)
+
+    _, pq = _parquet()
+    table = pq.read_table(path)
+    df = table.to_pandas()
+    df.columns = pickle.loads(table.schema.metadata[_COLUMNS_KEY])
+
+    # pyarrow returns empty cells of text columns as None, pd.read_excel returns NaN
+    for i in np.flatnonzero(df.dtypes == object):
+        df.iloc[:, i] = df.iloc[:, i].where(df.iloc[:, i].notna(), np.nan)
+    return df
+
+
+def _load_entry(stem):
+    """ Method to load a cache entry of a parsed sheet, if there is a readable one
+
+    param stem: cache path of the entry without suffix
+    : return: parsed sheet as a pandas dataframe, or None if the sheet is not in the cache
+    """
+
+    for suffix in ['.parquet', '.pkl']:
+        entry = stem.with_suffix(suffix)
+        if entry.exists():
+            try:
+                df = _read_entry(entry)
+                os.utime(entry) # mark entry as recently used for eviction
+            except Exception:
+                # unreadable entry (e.g. written by another pyarrow version) or an entry evicted concurrently,
+                # parse the workbook again
+                return None
+            return df
+    return None
+
+
+def read_excel_cached(path, sheet_name, cache_dir=None, **read_kwargs):
+    """ Drop-in replacement for pd.read_excel of a single sheet. The parsed sheet is stored in a columnar
+    disk cache so that later runs over the same file load the frame instead of re-parsing the workbook.
+
+    param path: path of the workbook
+    param sheet_name: name of the sheet to parse
+    param cache_dir: directory of the cache, defaults to CACHE_DIRECTORY
+    param read_kwargs: further keyword arguments for pd.read_excel, e.g. skiprows and nrows
+    : return: parsed sheet as a pandas dataframe
+    """
+
+    cache_dir = Path(cache_dir or CACHE_DIRECTORY)
+    stem = cache_dir / _entry_key(path, sheet_name, read_kwargs)
+
+    df = _load_entry(stem)
+    if df is not None:
+        return df
+
+    df = pd.read_excel(path, sheet_name=sheet_name, **read_kwargs)
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    _write_entry(df, stem)
+    evict_cache(cache_dir)
+    return df
+
+
+def read_excel_sheets_cached(path, sheets, cache_dir=None):
+    """ Method to read several sheets of a workbook through the disk cache. The sheets that are not in the cache
+    are all parsed from a single opening of the workbook
+
+    param path: path of the workbook
+    param sheets: list of (sheet name, read arguments) tuples, see read_excel_cached
+    param cache_dir: directory of the cache, defaults to CACHE_DIRECTORY
+    : return: list of parsed sheets, in the order of sheets
+    """
+
+    cache_dir = Path(cache_dir or CACHE_DIRECTORY)
+    stems = [cache_dir / _entry_key(path, sheet_name, read_kwargs) for sheet_name, read_kwargs in sheets]
+    frames = [_load_entry(stem) for stem in stems]
+
+    missing = [i for i, df in enumerate(frames) if df is None]
+    if missing:
+        with pd.ExcelFile(path) as workbook:
+            for i in missing:
+                sheet_name, read_kwargs = sheets[i]
+                frames[i] = workbook.parse(sheet_name, **read_kwargs)
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        for i in missing:
+            _write_entry(frames[i], stems[i])
+        evict_cache(cache_dir)
+
+    return frames
+
+
+def evict_cache(cache_dir=None, budget=CACHE_SIZE_BUDGET):
+    """ Method to remove the least recently used cache entries until the cache fits in the size budget. Only the
+    parsed sheets count, the objects in the store folder (see STORE_FOLDER) are left alone
+
+    param cache_dir: directory of the cache, defaults to CACHE_DIRECTORY
+    param budget: maximum size of the cache in bytes
+    : return: list of paths of the removed entries
+    """
+
+    cache_dir = Path(cache_dir or CACHE_DIRECTORY)
+    if not cache_dir.exists():
+        return []
+
+    entries = []
+    for entry in cache_dir.iterdir():
+        if entry.suffix in ['.parquet', '.pkl']:
+            # entries can be removed by a concurrent prefetch or eviction between iterdir and stat
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+
+    total = sum(size for _, size, _ in entries)
+    removed = []
+    for _, size, entry in sorted(entries, key=lambda e: e[0]):
+        if total <= budget:
+            break
+        try:
+            entry.unlink()
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed.append(entry)
+
+    return removed
+
+
+def clear_cache(cache_dir=None):
+    """ Method to remove every entry from the cache, the parsed sheets as well as the stored objects
+
+    param cache_dir: directory of the cache, defaults to CACHE_DIRECTORY
+    : return: list of paths of the removed entries
+    """
+
+    removed = evict_cache(cache_dir, budget=-1)
+    store_dir = Path(cache_dir or CACHE_DIRECTORY) / STORE_FOLDER
+    if store_dir.exists():
+        for entry in store_dir.glob('*.pkl'):
+            try:
+                entry.unlink()
+            except FileNotFoundError:
+                continue
+            removed.append(entry)
+    return removed
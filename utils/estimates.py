@@ -0,0 +1,288 @@
+
+import pandas as pd
+from utils.mappings import *
+from utils.sources import SourceRegistry
+from utils.mapping_matrix import project_to_base
+from utils.utils import *
+
+
+def get_base_df(current_year, sources=None):
+    """ Method to get starting point for estimating market size from income statement data for CY
+    
+    param current_year: current year (which is the last full calendar year experienced)
+    param sources: optional SourceRegistry of the current run
+    : return: pandas dataframe with transformed income statement data
+    """
+    base_df = get_income_statement_data(current_year, sources)
+    base_df = transform_BIP_data(base_df)
+    base_df = base_df.rename(columns = {'Volume': 'Income CY'})
+    return base_df
+
+
+def get_IWSR_estimate(base_df, iwsr_mappings, last_year, sources=None):
+    """ Method to get market estimate from IWSR LY data
+
+    param base_df: dataframe containing income statement data and other estimates
+    param iwsr_mappings: dict detailing mapping between IWSR and Income Statement stats groups
+    param last_year: year prior to current year (which is the last full calendar year experienced)
+    param sources: optional SourceRegistry of the current run
+    : return: pandas series containing market estimate for relevant stats groups with index compatible to base_df
+    
+    """
+
+    iwsr_df = get_IWSR_data(last_year, sources)
+
+    # map IWSR data to base df 
+    IWSR_LY = project_to_base(base_df['index'], iwsr_df, iwsr_mappings)
+
+    # calculate income statement to IWSR ratio for LY data
+    ratio_LY = base_df['Income LY']/IWSR_LY
+    return base_df['Income CY']/ratio_LY
+
+
+def get_SALBA_estimate(base_df, salba_mappings, current_year, sources=None):
+    """ Method to get market estimate from SALBA CY data
+
+    param base_df: dataframe containing income statement data and other estimates
+    param salba_mappings: dict detailing mapping between SALBA and Income Statement stats groups
+    param current_year: current year (which is the last full calendar year experienced)
+    param sources: optional SourceRegistry of the current run
+    : return: pandas series containing market estimate for relevant stats groups with index compatible to base_df
+    
+    """
+
+    salba_df = get_SALBA_data(current_year, sources)
+    salba_df = transform_SALBA_df(salba_df)
+    return project_to_base(base_df['index'], salba_df, salba_mappings)
+
+
+def get_SAWIS_estimate(base_df, sawis_mappings, current_year, sources=None):
+    """ Method to get market estimate from SAWIS CY data
+
+    param base_df: dataframe containing income statement data and other estimates
+    param sawis_mapping: dict detailing mapping between SAWIS and Income Statement stats groups
+    param current_year: current year (which is the last full calendar year experienced)
+    param sources: optional SourceRegistry of the current run
+    : return: pandas series containing market estimate for relevant stats groups with index compatible to base_df
+    
+    """
+
+    sawis_df = get_SAWIS_data(current_year, sources)
+    return project_to_base(base_df['index'], sawis_df, sawis_mappings)
+
+
+def get_GLOBAL_estimate(base_df, global_mappings, current_year, sources=None):
+    """ Method to get market estimate from GLOBAL CY data
+
+    param base_df: dataframe containing income statement data and other estimates
+    param global_mappings: dict detailing mapping between GLOBAL and Income Statement stats groups
+    param current_year: current year (which is the last full calendar year experienced)
+    param sources: optional SourceRegistry of the current run
+    : return: pandas series containing market estimate for relevant stats groups with index compatible to base_df
+    
+    """
+
+    global_df = get_global_data(current_year, sources)
+    return project_to_base(base_df['index'], global_df, global_mappings)
+
+
+def get_data_orbis_estimate(base_df, data_orbis_mappings, iwsr_mappings, current_year = '2020', last_year = '2019',
+                            sources=None):
+
+    """ Method to get market estimate from data orbis data.
+    It assumed that Data Orbis represents only about 30-40% of total domestic alcohol sales. 
+    To estimate the market size from Data Orbis, we look at what proportion each stats group was of the IWSR data in LY.
+    We use that ratio to scale the current year Data Orbis volumes per stats group
+    
+    param base_df: dataframe containing income statement data and other estimates
+    param epos_mapping: dict detailing mapping between Data Orbis and Income Statement stats groups
+    param iwsr_mapping: dict detailing mapping between IWSR and Income Statement stats groups
+    param current_year: current year (which is the last full calendar year experienced)
+    param sources: optional SourceRegistry of the current run
+    : return: pandas series containing market estimate for relevant stats groups with index compatible to base_df
+    
+    """
+    iwsr_df = get_IWSR_data(last_year, sources)
+    IWSR_LY = project_to_base(base_df['index'], iwsr_df, iwsr_mappings)
+
+    df_LY = get_data_orbis(last_year, sources)
+    df_CY = get_data_orbis(current_year, sources)
+
+    # roll up every year on its own rows, so the sums are not reordered by a merge of the years
+    df_years = pd.concat({'LY': transform_data_orbis(df_LY)['Volume'], 'CY': transform_data_orbis(df_CY)['Volume']},
+                         axis=1)
+
+    df_years['LY'] = df_years['LY']*(12/11) # to account for missing january data in 2019 
+
+    # map LY and CY onto the base df with a single matrix product
+    data_orbis = project_to_base(base_df['index'], df_years, data_orbis_mappings, columns=['LY', 'CY'])
+    data_orbis_LY = data_orbis['LY']
+    data_orbis_CY = data_orbis['CY']
+
+    # calculate ratio of data orbis volume to IWSR volume for last year
+    ratio_LY = data_orbis_LY/IWSR_LY
+    return data_orbis_CY/ratio_LY
+
+# stats groups reported in the output of the estimates
+STATS_GROUPS = ['Brandy', 'Gin', 'Vodka', 'Liqueurs', 'Whisky', 'Beer', 'Sparkling Wine', 'Wine Aperitif',
+                'Fortified Wine 1', 'Still Wine', 'Fortified Wine 2', 'CIDER & RTDs', 'Ciders', 'FABs']
+
+
+def get_run_requests(current_year='2020', last_year='2019'):
+    """Function to list the source sheets read by the estimates of a run, e.g. to prefetch them. Streamed sources
+    are left out, as they are read in chunks by the estimate itself
+        param current_year: current year of analysis
+        param last_year: year before current year
+        : return list of (directory, sheet name, read arguments) tuples
+    """
+
+    run_sources = [('income_statement', current_year), ('income_statement', last_year), ('IWSR', last_year),
+                   ('SALBA', current_year), ('SAWIS', current_year), ('GLOBAL_data', current_year),
+                   ('data_orbis', last_year), ('data_orbis', current_year)]
+    return [get_source_request(source, year) for source, year in run_sources if not is_streamed(source)]
+
+
+def get_income_df(current_year='2020', last_year='2019', sources=None):
+    """Function to get the income statement volumes of CY and LY and the IWSR volumes of LY per stats group,
+    the starting point of the estimates of every source
+        param current_year: current year of analysis
+        param last_year: year before current year
+        param sources: optional SourceRegistry of the current run
+        : return dataframe with the stats groups in the index column and the Income CY, Income LY and IWSR LY columns
+    """
+
+    # get starting point, which is income statement
+    base_df = get_base_df(current_year, sources)
+    # Create a new column with last year's income volumes
+    base_df['Income LY'] = transform_BIP_data(get_income_statement_data(last_year, sources))
+    base_df = base_df.reset_index()
+
+    # get IWSR for previous year (most accurate estimate)
+    base_df['IWSR LY'] = project_to_base(base_df['index'], get_IWSR_data(last_year, sources), iwsr_mappings)
+    return base_df
+
+
+def get_SALBA_amarula_estimate(base_df, current_year='2020', sources=None):
+    """Function to get the SALBA estimate with the amarula volumes of the income statement added to liqueurs
+        param base_df: dataframe from get_income_df
+        param current_year: current year of analysis
+        param sources: optional SourceRegistry of the current run
+        : return pandas series containing market estimate for relevant stats groups with index compatible to base_df
+    """
+
+    estimate = get_SALBA_estimate(base_df, salba_mappings, current_year, sources)
+    return estimate.where(base_df['index'] != 'Liqueurs', estimate + get_amarula_data(current_year, sources))
+
+
+def adjust_estimates(base_df, estimates):
+    """Function to add the estimates of every source and their adjusted mean to the base df
+        param base_df: dataframe from get_income_df
+        param estimates: dictionary of estimate column (e.g. 'SAWIS Estimate') to the estimate of the source
+        : return dataframe with the income, the estimate of every source and the adjusted mean per stats group
+    """
+
+    base_df = base_df.assign(**{column: estimates[column] for column in ESTIMATE_COLUMNS})
+
+    # Get the adjusted average estimate (discard furthest data point and recalcuate mean)
+    adjusted = get_adjusted_mean_estimates(base_df)
+    base_df['Avg Estimate'] = adjusted['Avg Estimate']
+    base_df['Discarded Estimate'] = adjusted['Discarded Estimate']
+
+    return base_df.set_index('index')
+
+
+def get_estimates(current_year='2020', last_year='2019', sources=None):
+    """Function to estimate the market size of every stats group from all sources
+        param current_year: current year of analysis
+        param last_year: year before current year
+        param sources: optional SourceRegistry to share loaded sheets with other runs, a new one is used by default
+        : return dataframe with the income, the estimate of every source and the adjusted mean per stats group
+    """
+
+    # every (source, year, sheet) is read once and shared between the estimates below
+    if sources is None:
+        sources = SourceRegistry()
+
+    base_df = get_income_df(current_year, last_year, sources)
+
+    estimates = {
+        # Estimate IWSR 2020 data using 2019 income-iwsr ratio per stats group and 2020 Income data
+        'IWSR Estimate': get_IWSR_estimate(base_df, iwsr_mappings, last_year, sources),
+        # Get estimates for brandy, gin, whisky, vodka and liqueurs from SALBA
+        'SALBA Estimate': get_SALBA_amarula_estimate(base_df, current_year, sources),
+        # Get estimates for still, fortified, and sparkling wine from SAWIS
+        'SAWIS Estimate': get_SAWIS_estimate(base_df, sawis_mappings, current_year, sources),
+        # Get estimate for beer from GLOBAL data
+        'GLOBAL Estimate': get_GLOBAL_estimate(base_df, global_mappings, current_year, sources),
+        # Get data orbis estimate for brandy, gin, whisky, vodka, liqueurs, beer, all wines, Ciders & RTDS
+        'Data Orbis Estimate': get_data_orbis_estimate(base_df, data_orbis_mappings, iwsr_mappings, current_year,
+                                                       last_year, sources),
+    }
+
+    return adjust_estimates(base_df, estimates)
+
+
+def result(current_year='2020', last_year='2019', sources=None, prefetch=False, max_workers=None, executor='thread'):
+    """Function to produce the estimates
+        param current_year: current year of analysis
+        param last_year: year before current year
+        param sources: optional SourceRegistry to share loaded sheets with other runs, a new one is used by default
+        param prefetch: load all source sheets of the run in parallel before estimating
+        param max_workers: number of threads or processes used to prefetch the sheets
+        param executor: 'thread' or 'process' pool used to prefetch the sheets
+        : return IWSR estimates for current year
+    """
+
+    if sources is None:
+        sources = SourceRegistry()
+
+    # the estimates below start as soon as the first sheets are in and wait only for the sheets they need
+    if prefetch:
+        sources.prefetch(get_run_requests(current_year, last_year), max_workers, executor)
+
+    base_df = get_estimates(current_year, last_year, sources)
+    print(f'Workbook reads: {sources.workbook_reads}')
+    if prefetch:
+        print(sources.report().to_string(index=False))
+
+    output_path = OUTPUT_DIRECTORY / f'market_size_test{current_year}.csv'
+    # base_df.loc[['Brandy', 'Gin', 'Vodka', 'Liqueurs', 'Whisky', 'Beer', 'Sparkling Wine', 'Wine Aperitif',
+    #              'Fortified Wine 1', 'Still Wine', 'Fortified Wine 2', 'CIDER & RTDs', 'Ciders',
+    #              'FABs']].to_csv(output_path)
+    df = base_df.loc[STATS_GROUPS].to_csv(output_path)
+    return df
+
+# def test_IWSR_estimates(current_year='2020', last_year='2019'):
+#     """Function to compare current year IWSR estimates to actual IWSR data for current year
+#
+#         param current_year: current year of analysis
+#         param last_year: year before current year
+#         : return : difference between the two as errors
+#     """
+#     IWSR_df = get_IWSR_data_estimates(current_year)
+#     result_df = result(current_year, last_year)
+#     # fortified_aperitif_s = result_df.loc['Fortified Wine 1'] + result_df.loc['Fortified Wine 2']\
+#     #                        + result_df.loc['Wine Aperitif']
+#     # fortified_aperitif_s = (pd.DataFrame(data=fortified_aperitif_s, columns=['Fortified Wine & Wine Aperitifs'])).T
+#     # result_df = pd.concat([result_df, fortified_aperitif_s])
+#
+#     brandy_df = abs((result_df.loc['Brandy']['Avg Estimate'] / IWSR_df.loc['Brandy']['Sales Volume']) - 1)
+#     gin_df = abs((result_df.loc['Gin']['Avg Estimate'] / IWSR_df.loc['Gin and Genever']['Sales Volume']) - 1)
+#     #cane_df = abs((result_df.loc['Brandy']['Avg Estimate'] / IWSR_df.loc['Brandy']['Sales Volume']) - 1)
+#     vodka_df = abs((result_df.loc['Vodka']['Avg Estimate'] / IWSR_df.loc['Vodka']['Sales Volume']) - 1)
+#     liqueurs_df = abs((result_df.loc['Liqueurs']['Avg Estimate'] / IWSR_df.loc['Liqueurs']['Sales Volume']) - 1)
+#     whisky_df = abs((result_df.loc['Whisky']['Avg Estimate'] / IWSR_df.loc['Whisky']['Sales Volume']) - 1)
+#     #rum_df = abs((result_df.loc['Rum']['Avg Estimate'] / IWSR_df.loc['Rum']['Sales Volume']) - 1)
+#     #tequila_df = abs((result_df.loc['Brandy']['Avg Estimate'] / IWSR_df.loc['Brandy']['Sales Volume']) - 1)
+#     spark_df = abs((result_df.loc['Sparkling Wine']['Avg Estimate'] / IWSR_df.loc['Sparkling Wine']['Sales Volume']) - 1)
+#     still_df = abs((result_df.loc['Still Wine']['Avg Estimate'] / IWSR_df.loc['Still Wine']['Sales Volume']) - 1)
+#     fort_df = abs((result_df.loc['Fortified Wine 2']['Avg Estimate'] / IWSR_df.loc['Fortified Wine & Wine Aperitifs']['Sales Volume']) - 1)
+#     cider_fabs_df = abs((result_df.loc['CIDER & RTDs']['Avg Estimate'] / IWSR_df.loc['Cider & FABs']['Sales Volume']) - 1)
+#     beer_df = abs((result_df.loc['Beer']['Avg Estimate'] / IWSR_df.loc['Beer']['Sales Volume']) - 1)
+#
+#     df = pd.DataFrame(data=[brandy_df, gin_df, vodka_df, liqueurs_df, whisky_df,
+#                             spark_df, still_df, fort_df, cider_fabs_df, beer_df], columns=['Error of Estimates'],
+#                       index=['Brandy', 'Gin', 'Vodka', 'Liqueurs', 'Whisky', 'Sparkling Wine', 'Still Wine',
+#                              'Fortified Wine & Wine Aperitifs', 'Cider & FABs', 'Beer'])
+#
+#     return df
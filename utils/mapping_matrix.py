@@ -0,0 +1,121 @@
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def _compile(frozen_mappings, groups):
+    """ Method to build the mapping matrix of a frozen mapping, see compile_mappings """
+
+    categories = list(dict.fromkeys(category for _, mapped in frozen_mappings for category in mapped))
+    category_position = {category: i for i, category in enumerate(categories)}
+    mapping = dict(frozen_mappings)
+
+    # the row of a stats group lists its categories in mapping order, so the matrix product adds them up in the
+    # same order as map_to_base_data. indptr and indices are built directly, as a COO conversion would sort the
+    # categories of a row by their position and sum duplicate categories, which changes the floating point sums
+    indptr, indices = [0], []
+    for group in groups:
+        indices.extend(category_position[category] for category in mapping.get(group, ()))
+        indptr.append(len(indices))
+
+    data = np.ones(len(indices))
+    matrix = sparse.csr_matrix((data, np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int32)),
+                               shape=(len(groups), len(categories)))
+    return matrix, tuple(categories)
+
+
+def compile_mappings(mappings, groups):
+    """ Method to compile a mapping dictionary into a sparse 0/1 matrix of stats groups by source categories.
+    Compiled matrices are kept, so every mapping is only compiled once per set of stats groups
+
+    param mappings: dictionary that details the mapping of the indexes of the base df with the indexes of the external datasources.
+                    E.g. {'Gin': ['Gin and Genever']}
+    param groups: stats groups of the base df, in order
+    : return: tuple of (sparse matrix of shape (groups, categories), tuple of source categories)
+    """
+
+    frozen_mappings = tuple((group, tuple(mapped)) for group, mapped in mappings.items())
+    return _compile(frozen_mappings, tuple(groups))
+
+
+def _unmapped(matrix):
+    """ Method to flag the stats groups without any mapped source category
+
+    param matrix: compiled mapping matrix
+    : return: boolean array, True for the stats groups without a mapping
+    """
+
+    return np.diff(matrix.indptr) == 0
+
+
+def _source_values(df, columns, matrix, categories):
+    """ Method to get the values of the source categories of a mapping matrix, in the column order of the matrix
+
+    param df: external datasource with the source categories as index
+    param columns: column of df, or list of columns
+    param matrix: compiled mapping matrix
+    param categories: source categories of the matrix
+    : return: numpy array with a row per source category
+    """
+
+    # like df.loc in map_to_base_data, a category a stats group is mapped onto has to be in the source
+    used = [categories[i] for i in np.unique(matrix.indices)]
+    missing = [category for category in used if category not in df.index]
+    if missing:
+        raise KeyError(missing)
+    return df[columns].reindex(list(categories)).to_numpy(dtype=float)
+
+
+def project_to_base(groups, df, mappings, columns='Volume'):
+    """ Vectorised replacement of groups.apply(map_to_base_data, args=[df, mappings]). The source volumes
+    are projected onto the stats groups of the base df with one sparse matrix product.
+
+    param groups: pandas series with the stats groups of the base df, e.g. base_df['index']
+    param df: external datasource, e.g. GLOBAL_data to be overlayed with base df
+    param mappings: dictionary that details the mapping of the indexes of the base df with the indexes of the external datasources.
+    param columns: column of df to project, or a list of columns which are projected with one matrix-matrix product
+    : return: pandas series (or dataframe for a list of columns) with the volume per stats group, NaN for unmapped groups.
+              Raises a KeyError for mapped categories that are missing from df, like map_to_base_data
+    """
+
+    matrix, categories = compile_mappings(mappings, groups)
+
+    values = _source_values(df, columns, matrix, categories)
+    projected = np.asarray(matrix @ values, dtype=float)
+    projected[_unmapped(matrix)] = np.nan
+
+    if isinstance(columns, list):
+        return pd.DataFrame(data=projected, index=groups.index, columns=columns)
+    return pd.Series(data=projected, index=groups.index, name=groups.name)
+
+
+def project_sources(groups, sources, column='Volume'):
+    """ Method to project several sources onto the stats groups of the base df with one matrix-matrix product. The
+    mapping matrices of all sources are stacked side by side, so every row keeps the categories of a stats group in
+    mapping order, and multiplied with a block diagonal matrix with the volumes of a source per column
+
+    param groups: pandas series with the stats groups of the base df, e.g. base_df['index']
+    param sources: dictionary of name: (source df, mappings), e.g. {'IWSR LY': (iwsr_df, iwsr_mappings)}
+    param column: column of the source dfs to project
+    : return: pandas dataframe with the stats groups as rows and a column per source, NaN for unmapped groups.
+              Raises a KeyError for mapped categories that are missing from a source, like map_to_base_data
+    """
+
+    matrices, values = [], []
+    for df, mappings in sources.values():
+        matrix, categories = compile_mappings(mappings, groups)
+        matrices.append(matrix)
+        values.append(_source_values(df, column, matrix, categories))
+
+    # the volumes of source k fill column k of the rows of its categories, the other columns are 0 and add nothing
+    volumes = np.zeros((sum(len(v) for v in values), len(values)))
+    offsets = np.cumsum([0] + [len(v) for v in values])
+    for k, v in enumerate(values):
+        volumes[offsets[k]:offsets[k + 1], k] = v
+
+    projected = np.asarray(sparse.hstack(matrices, format='csr') @ volumes, dtype=float)
+    projected[np.column_stack([_unmapped(matrix) for matrix in matrices])] = np.nan
+    return pd.DataFrame(data=projected, index=groups.index, columns=list(sources.keys()))
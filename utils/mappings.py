@@ -74,4 +74,105 @@ data_Epos_mappings = {
                 'CIDER & RTDs': ['CIDER & RTDs'],
 
 
-}
\ No newline at end of file
+}
+
+# rollup of the Data Orbis (PRODUCTCATEGORY, PRODUCTSUBCATEGORY) pairs onto the stats groups, in output order.
+# None matches any value, a pair that matches several rules is counted in every group it matches
+data_orbis_rules = [
+    ('Beer', None, 'Beer'),
+    ('Rtds', 'Flavoured Beer', 'Beer'),
+    (None, 'Brandy', 'Brandy'),
+    (None, 'Cane', 'Cane'),
+    (None, 'Cider', 'Cider'),
+    ('Rtds', 'Non-Alcoholic', 'Cider'),
+    (None, 'Cocktails', 'Cocktails'),
+    (None, 'Cognac', 'Cognac'),
+    (None, 'Fabs', 'Fabs'),
+    (None, 'Fortified', 'Fortified Wine'),
+    (None, 'Gin', 'Gin'),
+    (None, 'Liqueurs', 'Liqueurs'),
+    (None, 'Rum', 'Rum'),
+    (None, 'Sparkling', 'Sparkling Wine'),
+    (None, 'Spirit Cooler', 'Spirit Cooler'),
+    (None, 'Unfortified', 'Still Wine'),
+    (None, 'BIB', 'Still Wine'),
+    (None, 'Perle', 'Still Wine'),
+    (None, 'Vodka', 'Vodka'),
+    (None, 'Whisky', 'Whisky'),
+]
+
+# hierarchy specs of the derived stats groups per source, see utils.rollup. Members are rows of the source
+# or groups defined earlier in the same spec, so shared partial sums are only computed once
+bip_rollup = [
+    ('Fortified Wine 1', ['HP Fortified', 'SP Fortified']),
+    ('Still Wine', ['HP Wine', 'MP Wine', 'SP Wine', 'Perle Wine', 'Flavoured Wines']),
+    ('Fortified Wine 2', ['Fortified Wine 1', 'Wine Aperitif']),
+    ('CIDER & RTDs', ['Other Flavoured Beverages', 'Ciders', 'Spirit Cooler']),
+    ('FABs', ['Other Flavoured Beverages', 'Spirit Cooler']),
+]
+
+salba_rollup = [
+    ('Brandy', ['Brandy (Premium and Cognac)', 'Brandy (Prop and Non-Prop)']),
+    ('Gin', ['Gin']),
+    ('Vodka and Cane Spirits', ['Vodka and Cane Spirits']),
+    ('Whisky', ['Whisky (Premium)', 'Whisky (Prop and Non-Prop)']),
+    ('Liqueurs', ['Liqueurs']),
+    ('Sparkling Wine', ['Sparkling Wine']),
+    ('Still Wine', ['Standard Still and Perlé Wine', 'Super Premium Red Wine', 'Super Premium Rosé Wine',
+                    'Super Premium White Wine', 'Premium Wine']),
+    ('Fortified Wine', ['Total Fortified Wines and Aperitifs']),
+    ('AFB', ['Alcoholic Fruit Beverages']),
+    ('Spirit Cooler', ['Spirit Coolers']),
+]
+
+epos_rollup = [
+    ('Beer', ['BEER', 'BEER FLAVOURED']),
+    ('BIB', ['BIB']),
+    ('Brandy', ['BRANDY']),
+    ('Cane', ['CANE']),
+    ('Cider', ['CIDER']),
+    ('Cocktails', ['COCKTAILS']),
+    ('Cognac', ['COGNAC']),
+    ('Fabs', ['FABS']),
+    ('Fortified Wine', ['FORTIFIED']),
+    ('Gift Pack', ['GIFT PACK']),
+    ('Gin', ['GIN']),
+    ('Gin Enhancer', ['GIN ENHANCER']),
+    ('Liqueurs', ['LIQUEURS']),
+    ('Still Wine', ['PERLE', 'RED', 'ROSE', 'WHITE', 'BIB', 'FRUIT']),
+    ('Rum', ['RUM']),
+    ('Sparkling Wine', ['SPARKLING']),
+    ('Spirit Cooler', ['SPIRIT COOLER']),
+    ('Vodka', ['VODKA']),
+    ('Whisky', ['WHISKY']),
+    ('CIDER & RTDs', ['Fabs', 'Cider']),
+]
+
+# price bands in order of price, the codes of the classified price bands index into this list
+PRICE_BANDS = ['Low Price', 'Affordable', 'Value', 'Accessible Premium', 'Premium', 'Super Premium', 'Ultra Premium']
+
+# price band thresholds per category or pack size, as (upper bounds, price bands). A price above the n-th bound and
+# up to the next one is in the n-th band, a price above the last bound in the last band, prices up to 0 in none
+price_band_tables = {
+    'Spirits': ([0, 100, 150, 200, 300, 400],
+                ['Low Price', 'Value', 'Accessible Premium', 'Premium', 'Super Premium', 'Ultra Premium']),
+    'Still Wine': ([0, 30, 40, 60, 85, 120, 300],
+                   ['Low Price', 'Affordable', 'Value', 'Accessible Premium', 'Premium', 'Super Premium',
+                    'Ultra Premium']),
+    'Sparkling Wine': ([0, 80, 120, 200, 400],
+                       ['Value', 'Accessible Premium', 'Premium', 'Super Premium', 'Ultra Premium']),
+    '330ml': ([0, 60, 70, 80, 90, 110],
+              ['Low Price', 'Affordable', 'Accessible Premium', 'Premium', 'Super Premium', 'Ultra Premium']),
+    '500ml': ([0, 85, 100, 115, 130, 150],
+              ['Low Price', 'Affordable', 'Accessible Premium', 'Premium', 'Super Premium', 'Ultra Premium']),
+    '660ml': ([0, 200, 240, 250, 260, 280],
+              ['Low Price', 'Affordable', 'Accessible Premium', 'Premium', 'Super Premium', 'Ultra Premium']),
+}
+
+# pack sizes of beer and RTDs as (smallest size in ml, pack, units per pack), in order of size. The pack names are
+# the price band tables of the packs, see price_band_tables
+beer_pack_sizes = [
+    (0, '330ml', 6),
+    (400, '500ml', 6),
+    (570, '660ml', 12),
+]
@@ -0,0 +1,411 @@
+
+import time
+import types
+import hashlib
+from pathlib import Path
+import pandas as pd
+from utils.cache import code_fingerprint, file_fingerprint
+from utils.sources import SourceRegistry
+from utils.estimates import *
+from utils.price_bands import (PRICE_BAND_SOURCES, category_to_priceband, get_IWSR_data_estimates, get_price_band_data,
+                               get_price_band_shares, price_band_table)
+from utils.proportions import (H1_H2_base, PROPORTION_SOURCES, fiscal_year_engine, get_forecasts_volume, is_stored,
+                               load_stored, save_stored)
+from utils.seasonality import get_fiscal_year_proportions
+from utils.utils import *
+
+# kinds of stages, in the order they follow each other in the pipeline
+STAGE_KINDS = ['load', 'transform', 'map', 'estimate', 'adjust', 'write']
+
+
+class Stage:
+    """ A stage of the pipeline. The output of a stage is memoized in the store under a key built from the
+    fingerprint of the workbook it loads, its parameters, the fingerprint of the code it uses and the keys of its
+    inputs, so a stage is only run again when something upstream of it changed
+    """
+
+    def __init__(self, name, kind, build, inputs=(), params=None, source=None, output=None, persist=True, modules=()):
+        """
+        param name: name of the stage, e.g. 'estimate_SAWIS'
+        param kind: kind of the stage, one of STAGE_KINDS
+        param build: function building the output of the stage from the outputs of its inputs
+        param inputs: names of the stages whose outputs are passed on to build, in order
+        param params: dictionary of the parameters of the stage, e.g. the year
+        param source: (source, year) of the workbook read by a load stage, see SOURCE_SCHEMAS
+        param output: path of the file written by a write stage, the stage runs again when
+                       the file is missing or changed
+        param persist: whether the output is kept in the store, the sheets of load stages are in the disk cache
+        param modules: modules of the utils package whose functions build calls, e.g. ['utils.estimates']. The code
+                       they use is part of the key, see code_fingerprint
+        """
+
+        self.name = name
+        self.kind = kind
+        self.build = build
+        self.inputs = list(inputs)
+        self.params = params or {}
+        self.source = source
+        self.output = output
+        self.persist = persist
+        self.modules = list(modules)
+
+    def __repr__(self):
+        return f'Stage({self.name!r}, {self.kind!r}, inputs={self.inputs!r})'
+
+
+def write_csv(df, output_path):
+    """ Method to write the output of a stage to a csv file
+
+    param df: dataframe to write
+    param output_path: path of the csv file
+    : return: path of the csv file
+    """
+
+    df.to_csv(output_path)
+    return output_path
+
+
+def load_stage(source, year, sources):
+    """ Method to get the stage loading the sheet of a source into the registry of the run. A streamed source is
+    not loaded, its stage only finds the workbook, which the later stages read in chunks (see is_streamed). The key
+    of the stage is the content hash of the workbook either way
+
+    param source: name of the source, e.g. 'SAWIS'
+    param year: year of the data, None for the sources without a folder per year
+    param sources: SourceRegistry of the run, the later stages take the sheet from it
+    : return: Stage named load_<source>[_<year>]
+    """
+
+    name = f'load_{source}' if year is None else f'load_{source}_{year}'
+    if is_streamed(source):
+        build = lambda: get_file_in_directory(get_source_request(source, year)[0])
+    else:
+        build = lambda: read_source(source, year, sources)
+    return Stage(name, 'load', build, source=(source, year), persist=False, modules=['utils.utils'])
+
+
+def get_estimate_stages(current_year='2020', last_year='2019', sources=None):
+    """ Method to get the stages of the estimates of the market size of every stats group
+
+    param current_year: current year of analysis
+    param last_year: year before current year
+    param sources: SourceRegistry of the run
+    : return: list of stages, the last one writes out/market_size_test<current year>.csv
+    """
+
+    loads = {(source, year): load_stage(source, year, sources) for source, year in
+             [('income_statement', current_year), ('income_statement', last_year), ('IWSR', last_year),
+              ('SALBA', current_year), ('SAWIS', current_year), ('GLOBAL_data', current_year),
+              ('data_orbis', last_year), ('data_orbis', current_year)]}
+    name = {key: stage.name for key, stage in loads.items()}
+    years = {'current_year': current_year, 'last_year': last_year}
+    modules = ['utils.estimates']
+
+    # every estimate starts from the income statements and the IWSR volumes of last year, the sheets are taken
+    # from the registry filled by the load stages
+    stages = list(loads.values()) + [
+        Stage('income', 'transform', lambda *_: get_income_df(current_year, last_year, sources),
+              [name['income_statement', current_year], name['income_statement', last_year], name['IWSR', last_year]],
+              years, modules=modules),
+        Stage('estimate_IWSR', 'map',
+              lambda base_df, *_: get_IWSR_estimate(base_df, iwsr_mappings, last_year, sources),
+              ['income', name['IWSR', last_year]], years, modules=modules),
+        Stage('estimate_SALBA', 'map',
+              lambda base_df, *_: get_SALBA_amarula_estimate(base_df, current_year, sources),
+              ['income', name['SALBA', current_year], name['income_statement', current_year]], years, modules=modules),
+        Stage('estimate_SAWIS', 'map',
+              lambda base_df, *_: get_SAWIS_estimate(base_df, sawis_mappings, current_year, sources),
+              ['income', name['SAWIS', current_year]], years, modules=modules),
+        Stage('estimate_GLOBAL', 'map',
+              lambda base_df, *_: get_GLOBAL_estimate(base_df, global_mappings, current_year, sources),
+              ['income', name['GLOBAL_data', current_year]], years, modules=modules),
+        Stage('estimate_Data_Orbis', 'map',
+              lambda base_df, *_: get_data_orbis_estimate(base_df, data_orbis_mappings, iwsr_mappings, current_year,
+                                                          last_year, sources),
+              ['income', name['IWSR', last_year], name['data_orbis', last_year], name['data_orbis', current_year]],
+              # the streamed sums are merged per chunk, which can change the last digits
+              {**years, 'orbis_chunksize': DATA_ORBIS_CHUNKSIZE}, modules=modules),
+        Stage('estimates', 'estimate',
+              lambda base_df, *estimates: adjust_estimates(base_df, dict(zip(ESTIMATE_COLUMNS, estimates))),
+              ['income', 'estimate_IWSR', 'estimate_SALBA', 'estimate_SAWIS', 'estimate_GLOBAL', 'estimate_Data_Orbis'],
+              years, modules=modules),
+        Stage('estimates_stats_groups', 'adjust', lambda df: df.loc[STATS_GROUPS], ['estimates'],
+              {'stats_groups': STATS_GROUPS}, modules=modules),
+    ]
+
+    output_path = OUTPUT_DIRECTORY / f'market_size_test{current_year}.csv'
+    stages.append(Stage('write_estimates', 'write', lambda df: write_csv(df, output_path),
+                        ['estimates_stats_groups'], {'output_path': str(output_path)}, output=output_path))
+    return stages
+
+
+def get_price_band_stages(year='2020', measure='SALESVOLUME', sources=None):
+    """ Method to get the stages of the price band conversions
+
+    param year: year of analysis
+    param measure: either SALESVOLUME or SALESVALUE
+    param sources: SourceRegistry of the run
+    : return: list of stages, writing out/price_band_Final_probably_not<year>.csv and the allocation of the IWSR
+        volumes to out/price_band_allocation<year>.csv
+    """
+
+    loads = [load_stage(source, None, sources) for source in PRICE_BAND_SOURCES.values()]
+    iwsr = load_stage('IWSR_estimates', year, sources)
+    params = {'year': year, 'measure': measure}
+    modules = ['utils.price_bands']
+
+    # the price band workbook is read and prepared once, the sheets are aggregated in a single pass
+    stages = loads + [
+        Stage('price_band_shares', 'transform',
+              lambda *_: get_price_band_shares(year, measure, get_price_band_data(year, sources)),
+              [stage.name for stage in loads], params, modules=modules),
+        Stage('price_bands', 'adjust', price_band_table, ['price_band_shares'], params, modules=modules),
+    ]
+
+    output_path = OUTPUT_DIRECTORY / f'price_band_Final_probably_not{year}.csv'
+    stages.append(Stage('write_price_bands', 'write', lambda df: write_csv(df, output_path),
+                        ['price_bands'], {'output_path': str(output_path)}, output=output_path))
+
+    # the IWSR volumes are split with the share cube of the same shares
+    allocation_path = OUTPUT_DIRECTORY / f'price_band_allocation{year}.csv'
+    stages += [
+        iwsr,
+        Stage('price_band_allocation', 'estimate',
+              lambda shares, _: category_to_priceband(get_IWSR_data_estimates(year, sources), shares),
+              ['price_band_shares', iwsr.name], params, modules=modules),
+        Stage('write_price_band_allocation', 'write', lambda df: write_csv(df, allocation_path),
+              ['price_band_allocation'], {'output_path': str(allocation_path)}, output=allocation_path),
+    ]
+    return stages
+
+
+def get_fiscal_volume_stages(year='all_years', sources=None, start_month=7):
+    """ Method to get the stages of the fiscal year conversions of the volume forecasts
+
+    param year: year of analysis
+    param sources: SourceRegistry of the run
+    param start_month: first month of the fiscal year, other months than July take the proportions from the
+                       seasonality cube, see get_fiscal_year_proportions
+    : return: list of stages, the last one writes out/Forecast_Fiscal_Year.csv
+    """
+
+    loads = [load_stage(source, year if per_year else None, sources) for source, per_year in PROPORTION_SOURCES.items()]
+    forecasts = load_stage('forecasts_volume', None, sources)
+    modules = ['utils.proportions']
+
+    # the H1 and H2 proportions are built from the sheets of all proportion sources, which are the sheets of the
+    # seasonality cube as well
+    stages = loads + [
+        forecasts,
+        Stage('proportions', 'transform',
+              lambda *_: (H1_H2_base(year, sources) if start_month == 7 else
+                          get_fiscal_year_proportions(start_month, year, sources=sources)),
+              [stage.name for stage in loads], {'year': year, 'start_month': start_month}, modules=modules),
+        Stage('forecasts_volume', 'transform', lambda _: get_forecasts_volume(sources), [forecasts.name],
+              modules=modules),
+        Stage('fiscal_volume', 'estimate', lambda proportions, df: fiscal_year_engine(df, *proportions),
+              ['proportions', 'forecasts_volume'], modules=modules),
+    ]
+
+    output_path = OUTPUT_DIRECTORY / 'Forecast_Fiscal_Year.csv'
+    stages.append(Stage('write_fiscal_volume', 'write', lambda df: write_csv(df, output_path),
+                        ['fiscal_volume'], {'output_path': str(output_path)}, output=output_path))
+    return stages
+
+
+def get_pipeline(current_year='2020', last_year='2019', price_band_year='2020', measure='SALESVOLUME',
+                 fiscal_year='all_years', start_month=7, sources=None):
+    """ Method to get the stages of the estimates, price band conversions and fiscal year conversions as one DAG.
+    A load stage that is listed by several conversions appears once
+
+    param current_year: current year of the estimates
+    param last_year: year before current year
+    param price_band_year: year of the price band conversions
+    param measure: measure of the price band conversions, either SALESVOLUME or SALESVALUE
+    param fiscal_year: year of the fiscal year conversions
+    param start_month: first month of the fiscal years
+    param sources: SourceRegistry of the run, a new one is used by default
+    : return: dictionary of stage name to stage, in topological order
+    """
+
+    if sources is None:
+        sources = SourceRegistry()
+
+    stages = {}
+    for stage in (get_estimate_stages(current_year, last_year, sources)
+                  + get_price_band_stages(price_band_year, measure, sources)
+                  + get_fiscal_volume_stages(fiscal_year, sources, start_month)):
+        stages.setdefault(stage.name, stage)
+    return stages
+
+
+def _code_digest(code, sha):
+    """ Method to add the instructions, names and constants of a code object and of the code objects nested in it
+    (e.g. the lambdas and comprehensions of a function) to a hash """
+
+    sha.update(code.co_code)
+    sha.update(repr(code.co_names).encode('utf-8'))
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _code_digest(const, sha)
+        else:
+            sha.update(repr(const).encode('utf-8'))
+
+
+def build_fingerprint(build):
+    """ Method to fingerprint the build function of a stage together with the functions of this module it calls,
+    e.g. write_csv. The functions of the other modules are covered by the modules of the stage
+
+    param build: build function of a stage
+    : return: sha256 of the code
+    """
+
+    sha = hashlib.sha256()
+    pending, seen = [build], set()
+    while pending:
+        function = pending.pop()
+        if function.__code__ in seen:
+            continue
+        seen.add(function.__code__)
+        _code_digest(function.__code__, sha)
+        for name in function.__code__.co_names:
+            called = function.__globals__.get(name)
+            if isinstance(called, types.FunctionType) and called.__module__ == __name__:
+                pending.append(called)
+    return sha.hexdigest()
+
+
+def get_stage_keys(stages):
+    """ Method to get the store key of every stage. The key of a load stage is the content hash of its workbook,
+    the key of every other stage is built from its name, parameters and the keys of its inputs. Every key includes
+    the fingerprint of the code the stage uses, i.e. of its build function and of its modules with the mappings
+    they refer to. A change in a workbook changes the keys of all stages downstream of it, and a change in the
+    code only changes the keys of the stages using that code (and of the stages downstream of them)
+
+    param stages: dictionary of stage name to stage, in topological order
+    : return: dictionary of stage name to hex digest
+    """
+
+    keys = {}
+    for name, stage in stages.items():
+        code = (code_fingerprint(stage.modules), build_fingerprint(stage.build))
+        if stage.source is not None:
+            base_dir, sheet_name, read_kwargs = get_source_request(*stage.source)
+            # only the content hash, a workbook that is copied or touched without changes keeps its key
+            content_hash = file_fingerprint(get_file_in_directory(base_dir))[-1]
+            key = (name, code, content_hash, sheet_name, sorted(read_kwargs.items()))
+        else:
+            key = (name, code, sorted(stage.params.items()), [keys[input_name] for input_name in stage.inputs])
+        keys[name] = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+    return keys
+
+
+def is_stage_cached(stage, key, cache_dir=None):
+    """ Method to check whether the output of a stage is in the store. For a write stage the store holds the content
+    hash of the written file, and the file on disk has to be that file, not one written by another run or command
+
+    param stage: the stage
+    param key: store key of the stage, see get_stage_keys
+    param cache_dir: directory of the store, defaults to CACHE_DIRECTORY
+    : return: True if the stage does not have to run
+    """
+
+    if not stage.persist or not is_stored(f'stage_{stage.name}', key, cache_dir):
+        return False
+    if stage.output is None:
+        return True
+    if not Path(stage.output).exists():
+        return False
+    return load_stored(f'stage_{stage.name}', key, cache_dir) == file_fingerprint(stage.output)[-1]
+
+
+def plan_pipeline(stages, targets=None, cache_dir=None):
+    """ Method to find the stages that have to run to produce the targets. A stage runs when its output is not in the
+    store, and then its inputs are needed as well. Stages upstream of a cached stage are not needed
+
+    param stages: dictionary of stage name to stage, in topological order
+    param targets: names of the stages to produce, defaults to every write stage
+    param cache_dir: directory of the store, defaults to CACHE_DIRECTORY
+    : return: dataframe with the stage, kind, status (run, cached or skip) and key of every stage
+    """
+
+    if targets is None:
+        targets = [name for name, stage in stages.items() if stage.kind == 'write']
+
+    keys = get_stage_keys(stages)
+    status = {}
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name in status:
+            continue
+        if is_stage_cached(stages[name], keys[name], cache_dir):
+            status[name] = 'cached'
+        else:
+            status[name] = 'run'
+            pending += stages[name].inputs
+
+    return pd.DataFrame({'Stage': list(stages), 'Kind': [stage.kind for stage in stages.values()],
+                         'Status': [status.get(name, 'skip') for name in stages],
+                         'Key': [keys[name] for name in stages]})
+
+
+def run_stage(stages, name, keys, outputs, seconds, cache_dir=None):
+    """ Method to run a stage and keep its output in the store. The outputs of its inputs are taken from this run or
+    from the store, and an input whose entry left the store after planning (e.g. evicted by another run) is run again
+
+    param stages: dictionary of stage name to stage
+    param name: name of the stage to run
+    param keys: dictionary of stage name to store key, see get_stage_keys
+    param outputs: dictionary of the outputs of the stages of this run, the output of the stage is added
+    param seconds: dictionary of the run times of the stages of this run, the time of the stage is added
+    param cache_dir: directory of the store, defaults to CACHE_DIRECTORY
+    : return: output of the stage
+    """
+
+    stage = stages[name]
+    values = []
+    for input_name in stage.inputs:
+        if input_name not in outputs and stages[input_name].persist:
+            outputs[input_name] = load_stored(f'stage_{input_name}', keys[input_name], cache_dir)
+        if outputs.get(input_name) is None:
+            run_stage(stages, input_name, keys, outputs, seconds, cache_dir)
+        values.append(outputs[input_name])
+
+    start = time.perf_counter()
+    outputs[name] = stage.build(*values)
+    seconds[name] = time.perf_counter() - start
+    if stage.persist:
+        # a write stage keeps the content hash of its file, so a file overwritten later is detected
+        stored = outputs[name] if stage.output is None else file_fingerprint(stage.output)[-1]
+        save_stored(stored, f'stage_{name}', keys[name], cache_dir)
+    return outputs[name]
+
+
+def run_pipeline(stages, targets=None, dry_run=False, cache_dir=None):
+    """ Method to run the pipeline incrementally. Only the stages downstream of a changed workbook, parameter or
+    piece of code are run. The outputs of all other stages are loaded from the store when they are needed
+
+    param stages: dictionary of stage name to stage, in topological order, see get_pipeline
+    param targets: names of the stages to produce, defaults to every write stage
+    param dry_run: only report which stages would run
+    param cache_dir: directory of the store, defaults to CACHE_DIRECTORY
+    : return: dataframe with the stage, kind, status, key and run time in seconds of every stage
+    """
+
+    plan = plan_pipeline(stages, targets, cache_dir)
+    plan['Seconds'] = 0.0
+    if dry_run:
+        return plan
+
+    keys = dict(zip(plan['Stage'], plan['Key']))
+    outputs, seconds = {}, {}
+    for name in plan.loc[plan['Status'] == 'run', 'Stage']:
+        if name not in outputs:
+            run_stage(stages, name, keys, outputs, seconds, cache_dir)
+
+    # stages that were run again because their stored output was gone are reported as run
+    ran = plan['Stage'].isin(list(seconds))
+    plan.loc[ran, 'Status'] = 'run'
+    plan.loc[ran, 'Seconds'] = plan.loc[ran, 'Stage'].map(seconds)
+    return plan
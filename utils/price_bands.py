@@ -1,144 +1,187 @@
 import pandas as pd
 import numpy as np
 from utils.utils import *
+from utils.mappings import PRICE_BANDS, price_band_tables, beer_pack_sizes
 #from mappings import *
 import re
-def get_product_category(year, sheet):
-    """" Function to get the data and filter by product category
 
-        : param year: year of data analysis
-        : param sheet: product category sheet
-        : return: data frame processed by product category
-        """
-    base_dir = DATA_DIRECTORY / 'data_orbis_low_level' / 'Data_Orbis_Socilla'
-    path = get_file_in_directory(base_dir)
+# source schema of every product category sheet of the Data Orbis price band workbook
+PRICE_BAND_SOURCES = {'CHARL RTD MAT DEC': 'price_bands_rtds',
+                      'Charl WINE MAT DEC 2020': 'price_bands_wine',
+                      'CHARL SPIRIT MAT DEC': 'price_bands_spirits'}
 
+# names of the alcohol indices, any other index is counted as blank
+INDEX_NAMES = {'Low-Alcohol': 'Low_Alcohol', 'No-Alcohol': 'No_Alcohol', 'Alcohol': 'Alcohol',
+               'Low-AlcoholEnergy': 'Low_AlcoholEnergy', 'No-AlcoholEnergy': 'No_AlcoholEnergy', 'Energy': 'Energy'}
 
-    if sheet == 'CHARL RTD MAT DEC' or sheet == 'Charl WINE MAT DEC 2020':
-        df = pd.read_excel(path, sheet_name=sheet, skiprows=2)
-    elif sheet == 'CHARL SPIRIT MAT DEC':
-        df = pd.read_excel(path, sheet_name=sheet, skiprows=3)
+def prepare_product_category(df, year):
+    """" Function to select the sales volume and value of the year of a product category sheet
+    and normalize its alcohol indices
 
+        : param df: product category sheet of the Data Orbis price band workbook
+        : param year: year of data analysis
+        : return: data frame processed by product category
+        """
     if year == '2020':
-        df = df.iloc[:, [5, 6, 8, 10, 12]]
+        df = df.iloc[:, [5, 6, 8, 10, 12]].copy()
         df['SALESVOLUME'] = df['CY 12 Mths']
         df['SALESVALUE'] = df['CY 12 Mths.1']
     elif year == '2019':
-        df = df.iloc[:, [5, 6, 8, 11, 13]]
+        df = df.iloc[:, [5, 6, 8, 11, 13]].copy()
         df['SALESVOLUME'] = df['PY 12 Mths']
         df['SALESVALUE'] = df['PY 12 Mths.1']
 
-
-
-
     # Filtered by Product category for wine
     #df = df[df['PRODUCTCATEGORY'] == product_category]
 
     # Rename Low-Alchol to Low_Alcohol and No-Alcohol to No_Alcohol
-    df['INDEX'] = df['INDEX'].apply(lambda x: 'Low_Alcohol' if x == 'Low-Alcohol' else
-    'No_Alcohol' if x == 'No-Alcohol' else
-    'Alcohol' if x == 'Alcohol' else
-    'Low_AlcoholEnergy' if x == 'Low-AlcoholEnergy' else
-    'No_AlcoholEnergy' if x == 'No-AlcoholEnergy' else
-    'Energy' if x == 'Energy' else 'blank')
+    df['INDEX'] = df['INDEX'].map(INDEX_NAMES).fillna('blank')
 
     return df
 
-def get_spark_wine_price_band(year, Value_Volume):
-    """Function to read in and preprocess the Data Orbis file and split the data's sub categories
-        into price bands for wines
+def get_price_band_data(year, sources=None):
+    """" Function to read all product category sheets of the Data Orbis price band workbook.
+    The workbook is opened once and every sheet is parsed and prepared once
+
+        : param year: year of data analysis
+        : param sources: optional SourceRegistry of the current run
+        : return: dictionary of product category sheet to data frame processed by product category
+        """
+    frames = read_sources(list(PRICE_BAND_SOURCES.values()), sources=sources)
+
+    return {sheet: prepare_product_category(frames[source], year) for sheet, source in PRICE_BAND_SOURCES.items()}
+
+def get_product_category(year, sheet, frames=None):
+    """" Function to get the data and filter by product category
+
+        : param year: year of data analysis
+        : param sheet: product category sheet
+        : param frames: optional prepared sheets of the workbook from get_price_band_data
+        : return: data frame processed by product category
+        """
+    if frames is not None:
+        return frames[sheet].copy()
+
+    return prepare_product_category(read_source(PRICE_BAND_SOURCES[sheet]), year)
+
+# alcohol indices of the price band columns, in column order
+ALCOHOL_INDICES = ['Alcohol', 'Low_Alcohol', 'No_Alcohol', 'Energy', 'Low_AlcoholEnergy', 'No_AlcoholEnergy']
+
+# subcategories of every product category sheet with the name of their price band columns, cognac is counted as brandy
+PRICE_BAND_SUBCATEGORIES = {
+    'Charl WINE MAT DEC 2020': {'Still wine': 'Still_Wine', 'Fortified': 'Fortified_Wine', 'Aperitif': 'Aperitif',
+                                'Sparkling': 'Sparkling_Wine'},
+    'CHARL RTD MAT DEC': {'Cider': 'Cider', 'Fabs': 'Fabs', 'Beer': 'Beer'},
+    'CHARL SPIRIT MAT DEC': {'Brandy': 'Brandy', 'Cognac': 'Brandy', 'Cane': 'Cane', 'Gin': 'Gin',
+                             'Liqueurs': 'Liqueurs', 'Rum': 'Rum', 'Tequila': 'Tequila', 'Vodka': 'Vodka',
+                             'Whisky': 'Whisky'},
+}
+
+# price band rows and subcategories of every category family, in output order
+PRICE_BAND_FAMILIES = {
+    'still_wine': (['Accessible Premium', 'Low Price', 'Premium', 'Super Premium', 'Ultra Premium', 'Affordable',
+                    'Value'], ['Still_Wine', 'Fortified_Wine', 'Aperitif']),
+    'sparkling_wine': (['Accessible Premium', 'Premium', 'Super Premium', 'Ultra Premium', 'Value'],
+                       ['Sparkling_Wine']),
+    'rtds': (['Accessible Premium', 'Low Price', 'Premium', 'Super Premium', 'Ultra Premium', 'Affordable'],
+             ['Cider', 'Fabs']),
+    'beer': (['Accessible Premium', 'Low Price', 'Premium', 'Super Premium', 'Ultra Premium', 'Affordable'],
+             ['Beer']),
+    'spirits': (['Accessible Premium', 'Low Price', 'Premium', 'Super Premium', 'Ultra Premium', 'Value'],
+                ['Brandy', 'Cane', 'Gin', 'Liqueurs', 'Rum', 'Tequila', 'Vodka', 'Whisky']),
+}
+
+# the totals of the wines leave out the rows without an alcohol index, and the still wine shares divide
+# the unrounded volumes by the rounded total
+BLANK_EXCLUDED_SHEETS = ['Charl WINE MAT DEC 2020']
+UNROUNDED_SUBCATEGORIES = ['Still_Wine']
+
+def get_price_band_shares(year, Value_Volume, frames=None):
+    """" Function to compute the share of every subcategory, alcohol index and price band in the sales volume of
+    its subcategory, for all category families at once. The sheets are aggregated with a single groupby and
+    divided by the subcategory totals in one step
 
     : param year: year of data analysis
-    : param Value_Volume: Either sales volume or sales value, depending on analysis
-    : return: data frame of price band splits per sub category
+    : param Value_Volume: Either sales volume or sales value, depending on analysis,
+        or a list of both to compute the shares of every measure in the same pass
+    : param frames: optional prepared sheets of the workbook from get_price_band_data
+    : return: series of shares with (subcategory, alcohol index, price band) as index,
+        or a data frame with a column per measure when Value_Volume is a list
     """
-    # get wine dataframe
-    df = get_product_category(year, 'Charl WINE MAT DEC 2020')
+    frames = get_price_band_data(year) if frames is None else frames
 
-    # Seperate the data by Still wine, aperitif, fortified wine, sparkling wine
-    sparkling_wine_df = df[df['SUBCATEGORY'] == 'Sparkling']
+    df = pd.concat([frames[sheet].assign(NAME=frames[sheet]['SUBCATEGORY'].map(names),
+                                         TOTAL=sheet not in BLANK_EXCLUDED_SHEETS or frames[sheet]['INDEX'] != 'blank')
+                    for sheet, names in PRICE_BAND_SUBCATEGORIES.items()], ignore_index=True)
 
-    # Totals of volumes per sub category
-    # sparkling_wine_total = sparkling_wine_df['SALESVOLUME'].sum()
-    sparkling_wine_total = sparkling_wine_df[sparkling_wine_df['INDEX'] != 'blank']['SALESVOLUME'].sum()
+    # Aggregate by subcategory, alcohol presence and price band, the totals are always sales volumes
+    measures = [Value_Volume] if isinstance(Value_Volume, str) else list(Value_Volume)
+    df_sum = df.groupby(['NAME', 'INDEX', 'PRICE BAND CORRECT'])[measures].sum()
+    totals = df[df['TOTAL']].groupby('NAME')['SALESVOLUME'].sum()
 
-    df = df.groupby(['SUBCATEGORY', 'INDEX', 'PRICE BAND CORRECT']).agg('sum')[[Value_Volume]]
-    # Get the aggregated subcategories and apply classifier (low alc, no alc, etc) and rename columns
-    sparkling_df = (df.T.Sparkling)
-    df_mod = pd.DataFrame(data=np.zeros(5), columns=['Zeros'], index=['Accessible Premium',
-                                                                    'Premium',
-                                                                    'Super Premium',
-                                                                    'Ultra Premium',
-                                                                    'Value'])
+    names = df_sum.index.get_level_values(0)
+    values = df_sum.to_numpy(dtype=float)
+    values = np.where(names.isin(UNROUNDED_SUBCATEGORIES)[:, np.newaxis], values, np.round(values))
+    shares = values / np.round(totals.reindex(names).to_numpy(dtype=float))[:, np.newaxis]
 
-    df_mod = alcohol_type_classifier('Sparkling_Wine', sparkling_df, df_mod)
-    df_mod.drop('Zeros', axis='columns', inplace=True)
+    shares = pd.DataFrame(data=shares, index=df_sum.index, columns=measures)
+    return shares[Value_Volume] if isinstance(Value_Volume, str) else shares
 
-    df_mod = df_mod.fillna(0)
-    # calculate proportions of all subcategories
-    for col in df_mod.columns:
-        df_mod[col] = df_mod[col].apply(lambda x: round(x) / round(sparkling_wine_total))
+def price_band_family_frame(shares, family):
+    """" Function to get the price band shares of a category family as a data frame with the price bands as rows
+    and a column per subcategory and alcohol index (e.g. Cider_Low_Alcohol)
 
-    df_mod = df_mod.fillna(0)
+    : param shares: price band shares from get_price_band_shares
+    : param family: name of the family in PRICE_BAND_FAMILIES, e.g. 'rtds'
+    : return: data frame of price band splits per sub category
+    """
+    bands, names = PRICE_BAND_FAMILIES[family]
+    present = set(zip(shares.index.get_level_values(0), shares.index.get_level_values(1)))
 
-    return df_mod
+    data = {}
+    for name in names:
+        for index in ALCOHOL_INDICES:
+            if (name, index) in present:
+                data[f'{name}_{index}'] = shares.loc[(name, index)].reindex(bands).fillna(0).to_numpy()
+
+    return pd.DataFrame(data=data, index=bands)
+
+def price_band_share_array(shares):
+    """" Function to get the price band shares as a dense array of subcategories, alcohol indices and price bands.
+    Like price_band_family_frame, only the price bands of the family of a subcategory are kept, the others are 0
 
-def get_still_wine_price_band(year, Value_Volume):
+    : param shares: price band shares from get_price_band_shares
+    : return: tuple of (array of shape (subcategories, ALCOHOL_INDICES, PRICE_BANDS), list of subcategories)
+    """
+    names = [name for _, family_names in PRICE_BAND_FAMILIES.values() for name in family_names]
+    index = pd.MultiIndex.from_product([names, ALCOHOL_INDICES, PRICE_BANDS])
+    array = shares.reindex(index).fillna(0).to_numpy().reshape(len(names), len(ALCOHOL_INDICES), len(PRICE_BANDS))
+
+    in_family = np.array([[band in bands for band in PRICE_BANDS]
+                          for bands, family_names in PRICE_BAND_FAMILIES.values() for _ in family_names])
+    return np.where(in_family[:, np.newaxis, :], array, 0.0), names
+
+def get_spark_wine_price_band(year, Value_Volume, frames=None):
     """Function to read in and preprocess the Data Orbis file and split the data's sub categories
         into price bands for wines
 
     : param year: year of data analysis
     : param Value_Volume: Either sales volume or sales value, depending on analysis
+    : param frames: optional prepared sheets of the workbook from get_price_band_data
     : return: data frame of price band splits per sub category
     """
-    # get wine dataframe
-    df = get_product_category(year, 'Charl WINE MAT DEC 2020')
-
-    #Seperate the data by Still wine, aperitif, fortified wine, sparkling wine
-    still_wine_df = df[df['SUBCATEGORY'] == 'Still wine']
-    still_wine_df['SUBCATEGORY'] = df['SUBCATEGORY'].apply(lambda x: 'Unfortified')
-    fotified_wine_df = df[df['SUBCATEGORY'] == 'Fortified']
-
-    aperitif_wine_df = df[df['SUBCATEGORY'] == 'Aperitif']
-
-    df = pd.concat([still_wine_df, aperitif_wine_df, fotified_wine_df])
-
-    #Totals of volumes per sub category
-    still_wine_total = still_wine_df[still_wine_df['INDEX'] != 'blank']['SALESVOLUME'].sum()
-    aperitif_wine_total = aperitif_wine_df[aperitif_wine_df['INDEX'] != 'blank']['SALESVOLUME'].sum()
-    fortified_wine_total = fotified_wine_df[fotified_wine_df['INDEX'] != 'blank']['SALESVOLUME'].sum()
-
-    # Get the aggregated subcategories and apply classifier (low alc, no alc, etc) and rename columns
-    df = df.groupby(['SUBCATEGORY', 'INDEX', 'PRICE BAND CORRECT']).agg('sum')[[Value_Volume]]
-
-    still_df = (df.T.Unfortified)
-    df_mod = pd.DataFrame(data=np.zeros(7), columns=['Zeros'], index=['Accessible Premium',
-                                                                    'Low Price',
-                                                                    'Premium',
-                                                                    'Super Premium',
-                                                                    'Ultra Premium',
-                                                                    'Affordable',
-                                                                    'Value'])
-    df_mod = alcohol_type_classifier('Still_Wine', still_df, df_mod)
-    df_mod.drop('Zeros', axis='columns', inplace=True)
-    fortified_df = (df.T.Fortified)
-    df_mod = alcohol_type_classifier('Fortified_Wine', fortified_df, df_mod)
-    aperitif_df = df.T.Aperitif
-    df_mod = alcohol_type_classifier('Aperitif', aperitif_df, df_mod)
-
-    df_mod = df_mod.fillna(0)
-    # calculate proportions of all subcategories
-    for col in df_mod.columns:
-        if col[:len('Aperitif')] == 'Aperitif':
-            df_mod[col] = df_mod[col].apply(lambda x: round(x) / round(aperitif_wine_total))
-        elif col[:len('Fortified_Wine')] == 'Fortified_Wine':
-            df_mod[col] = df_mod[col].apply(lambda x: round(x) / round(fortified_wine_total))
-        elif col[:len('Still_Wine')] == 'Still_Wine':
-            df_mod[col] = df_mod[col].apply(lambda x: x / round(still_wine_total))
-
-    df_mod = df_mod.fillna(0)
+    return price_band_family_frame(get_price_band_shares(year, Value_Volume, frames), 'sparkling_wine')
 
-    return df_mod
+def get_still_wine_price_band(year, Value_Volume, frames=None):
+    """Function to read in and preprocess the Data Orbis file and split the data's sub categories
+        into price bands for wines
+
+    : param year: year of data analysis
+    : param Value_Volume: Either sales volume or sales value, depending on analysis
+    : param frames: optional prepared sheets of the workbook from get_price_band_data
+    : return: data frame of price band splits per sub category
+    """
+    return price_band_family_frame(get_price_band_shares(year, Value_Volume, frames), 'still_wine')
 
 def alcohol_type_classifier(name, category, df_mod):
     """" Function to classify the dataset as either low alcohol, no alcohol, alchol and energy
@@ -164,109 +207,56 @@ def alcohol_type_classifier(name, category, df_mod):
     return df_mod
 
 
-def get_beer_price_band(year, Value_Volume):
+def get_beer_price_band(year, Value_Volume, frames=None):
     """" Function to read in and preprocess the Data Orbis file and split the data's sub categories
         into price bands for beers
 
         : param year: year of data analysis
         : param Value_Volume: Either sales volume or sales value, depending on analysis
+        : param frames: optional prepared sheets of the workbook from get_price_band_data
         : return: data frame of price band splits per sub category
         """
-    # get Beer dataframe
-    df = get_product_category(year, 'CHARL RTD MAT DEC')
-
-    total_beers = df[df['SUBCATEGORY'] == 'Beer']['SALESVOLUME'].sum()
-
-    # # Aggregate by subcategory, alcohol presence and price band
-    df = df.groupby(['SUBCATEGORY', 'INDEX', 'PRICE BAND CORRECT']).agg('sum')[[Value_Volume]]
-
-    # Get the aggregated subcategories and apply classifier (low alc, no alc, etc) and rename columns
-    beer_df = df.T.Beer
-    df_mod = pd.DataFrame(data=np.zeros(6), columns=['Zeros'], index=['Accessible Premium',
-                                                                      'Low Price',
-                                                                      'Premium',
-                                                                      'Super Premium',
-                                                                      'Ultra Premium',
-                                                                      'Affordable'])
-    df_mod = alcohol_type_classifier('Beer', beer_df, df_mod)
-    df_mod.drop('Zeros', axis='columns', inplace=True)
-
-    df_mod = df_mod.fillna(0)
-    # calculate proportions of all subcategories
-    for col in df_mod.columns:
-        df_mod[col] = df_mod[col].apply(lambda x: round(x) / round(total_beers))
-
-    df_mod = df_mod.fillna(0)
+    return price_band_family_frame(get_price_band_shares(year, Value_Volume, frames), 'beer')
 
-    return df_mod
-
-def get_Rtds_price_band(year, Value_Volume):
+def get_Rtds_price_band(year, Value_Volume, frames=None):
     """Function to read in and preprocess the Data Orbis file and split the data's sub categories
         into price bands for RTDs
 
         : param year: year of data analysis
         : param Value_Volume: Either sales volume or sales value, depending on analysis
+        : param frames: optional prepared sheets of the workbook from get_price_band_data
         : return: data frame of price band splits per sub category
         """
-    # get RTDs dataframe
-    df = get_product_category(year, 'CHARL RTD MAT DEC')
-
-    cider_total = df[df['SUBCATEGORY'] == 'Cider']['SALESVOLUME'].sum()
-    fabs_total = df[df['SUBCATEGORY'] == 'Fabs']['SALESVOLUME'].sum()
-
-    # # Aggregate by subcategory, alcohol presence and price band
-    df = df.groupby(['SUBCATEGORY', 'INDEX', 'PRICE BAND CORRECT']).agg('sum')[[Value_Volume]]
-    # #
-    # Get the aggregated subcategories and apply classifier (low alc, no alc, etc) and rename columns
-    cider_df = df.T.Cider
-    df_mod = pd.DataFrame(data=np.zeros(6), columns=['Zeros'], index=['Accessible Premium',
-                                                                      'Low Price',
-                                                                      'Premium',
-                                                                      'Super Premium',
-                                                                      'Ultra Premium',
-                                                                      'Affordable'])
-    df_mod = alcohol_type_classifier('Cider', cider_df, df_mod)
-    df_mod.drop('Zeros', axis='columns', inplace=True)
-    fabs_df = df.T.Fabs
-    df_mod = alcohol_type_classifier('Fabs', fabs_df, df_mod)
-
-    df_mod = df_mod.fillna(0)
-    # calculate proportions of all subcategories
-    for col in df_mod.columns:
-        if col[:len('Cider')] == 'Cider':
-            df_mod[col] = df_mod[col].apply(lambda x: round(x) / round(cider_total))
-        elif col[:len('Fabs')] == 'Fabs':
-            df_mod[col] = df_mod[col].apply(lambda x: round(x) / round(fabs_total))
-
-    df_mod = df_mod.fillna(0)
+    return price_band_family_frame(get_price_band_shares(year, Value_Volume, frames), 'rtds')
 
-    return df_mod
+def convert_product_description_beer_and_rtds(df, pack_sizes=beer_pack_sizes, tables=None):
+    """" Function to bucket the beers and RTDs into pack sizes by their size in ml (Look up), and classify the
+    price per pack into the price bands of the pack. All rows are converted at once, in place
 
-def convert_product_description_beer_and_rtds(df):
-    """..."""
+    : param df: Data Orbis SKU data with the Look up, SALESVALUEINCL and SALESVOLUME columns
+    : param pack_sizes: list of (smallest size in ml, pack, units per pack) tuples, see beer_pack_sizes
+    : param tables: price band tables of the packs, defaults to price_band_tables
+    : return: data frame with the pack (description), units per pack, price per pack and price band of every row
+    """
     #df['PRODUCTDESCRIPTION'] = df['PRODUCTDESCRIPTION'].apply(lambda x: re.split('\s', x)[-1])
-    df['description'] = df['Look up'].apply(lambda x: '330ml'
-        if x >= 0 and x < 400 else
-        '500ml'
-         if x >= 400 and x < 570 else
-        '660ml'
-        )
+    bounds = [size for size, _, _ in pack_sizes]
+    packs = [pack for _, pack, _ in pack_sizes]
+    multipliers = np.array([multiplier for _, _, multiplier in pack_sizes])
 
-    df_330ml = df[df["description"] == "330ml"]
-    df_500ml = df[df["description"] == "500ml"]
-    df_660ml = df[df["description"] == "660ml"]
+    # the pack of a size is the largest pack starting at or below it,
+    # sizes below the smallest pack and missing sizes are counted in the last pack
+    sizes = df['Look up'].to_numpy(dtype=float)
+    codes = np.searchsorted(bounds, sizes, side='right') - 1
+    codes[(codes < 0) | np.isnan(sizes)] = len(packs) - 1
 
-    # Create a price per subcategory column to get a unit price for every subcategory
-    df_330ml['Price_per_subcategory'] = df['SALESVALUEINCL'] / (df['SALESVOLUME'] / (df['Look up'] / 1000)) * 6
-    df_500ml['Price_per_subcategory'] = df['SALESVALUEINCL'] / (df['SALESVOLUME'] / (df['Look up'] / 1000)) * 6
-    df_660ml['Price_per_subcategory'] = df['SALESVALUEINCL'] / (df['SALESVOLUME'] / (df['Look up'] / 1000)) * 12
+    df['description'] = pd.Categorical.from_codes(codes, categories=packs)
+    df['Pack_multiplier'] = multipliers[codes]
 
-    # Apply price band conversion and price column
-    df_330ml['Price_band'] = df_330ml['Price_per_subcategory'].apply(price_band_beer_conversion, args=['330ml'])
-    df_500ml['Price_band'] = df_500ml['Price_per_subcategory'].apply(price_band_beer_conversion, args=['500ml'])
-    df_660ml['Price_band'] = df_660ml['Price_per_subcategory'].apply(price_band_beer_conversion, args=['660ml'])
+    # Create a price per subcategory column to get a unit price for every subcategory
+    df['Price_per_subcategory'] = df['SALESVALUEINCL'] / (df['SALESVOLUME'] / (df['Look up'] / 1000)) * df['Pack_multiplier']
 
-    df = pd.concat([df_330ml, df_500ml, df_660ml])
+    # Apply price band conversion of the pack of every row
+    df['Price_band'] = classify_price_bands(df['Price_per_subcategory'], df['description'], tables)
 
     return df
 
@@ -281,82 +271,131 @@ def search_product_description(search, txt):
         else:
             return False
 
-def get_spirits_price_band(year, Value_Volume):
+def keyword_pattern(keywords):
+    """" Function to compile a set of keywords into a single regular expression shaped as a prefix tree,
+    so that the keywords sharing a prefix are tried together. At every position the longest keyword wins
+
+    : param keywords: list of keywords, matched literally. Empty and blank keywords are left out, they would match
+        every description
+    : return: pattern string matching any of the keywords
+    """
+    tree = {}
+    for keyword in filter(str.strip, keywords):
+        node = tree
+        for character in keyword:
+            node = node.setdefault(character, {})
+        node[''] = {}
+
+    def branch(node):
+        branches = [re.escape(character) + branch(child) for character, child in node.items() if character != '']
+        if not branches:
+            return ''
+        if len(branches) == 1 and '' not in node:
+            return branches[0]
+        return '(?:' + '|'.join(branches) + ')' + ('?' if '' in node else '')
+
+    return branch(tree)
+
+def match_product_descriptions(descriptions, keywords, case=True):
+    """" Function to match a whole column of product descriptions against a set of keywords in one pass.
+    The keywords are compiled once into a single pattern that finds the longest keyword at every position of a
+    description, a keyword inside a longer keyword that matched is counted as a hit as well
+
+    : param descriptions: product descriptions, e.g. the PRODUCTDESCRIPTION column of the Data Orbis SKU list
+    : param keywords: list of keywords, matched literally. Empty and blank keywords match no description
+    : param case: match upper and lower case exactly
+    : return: data frame of booleans with a row per description and a column per keyword
+    """
+    keywords = list(dict.fromkeys(keywords))
+    descriptions = pd.Series(descriptions)
+    hits = np.zeros((len(descriptions), len(keywords)), dtype=bool)
+
+    fold = (lambda x: x) if case else str.lower
+    folded = list(dict.fromkeys(fold(k) for k in keywords if k.strip()))
+    if not folded:
+        return pd.DataFrame(data=hits, index=descriptions.index, columns=keywords)
+
+    # the lookahead finds a match at every position, also where matches overlap
+    pattern = re.compile(f'(?=({keyword_pattern(folded)}))', 0 if case else re.IGNORECASE)
+    text = pd.Series(descriptions.to_numpy(), dtype=object).where(descriptions.notna().to_numpy(), '')
+    matches = text.astype(str).str.findall(pattern).explode().dropna()
+
+    # every matched keyword counts for all keywords it contains
+    codes, matched = pd.factorize(matches.map(fold).to_numpy())
+    rows = matches.index.to_numpy()
+    for code, keyword in enumerate(matched):
+        columns = [i for i, other in enumerate(keywords) if other.strip() and fold(other) in keyword]
+        hits[np.ix_(np.unique(rows[codes == code]), columns)] = True
+
+    return pd.DataFrame(data=hits, index=descriptions.index, columns=keywords)
+
+def tag_product_descriptions(descriptions, tags, case=True):
+    """" Function to tag product descriptions with an attribute (e.g. pack size, sub-brand or flavour)
+    through their keywords, see match_product_descriptions
+
+    : param descriptions: product descriptions, e.g. the PRODUCTDESCRIPTION column
+    : param tags: dictionary of keyword to tag, e.g. {'330ml': '330ml', '340ml': '330ml', '440ml': '440ml'}.
+        When several keywords match, the tag of the first one in the dictionary is used
+    : param case: match upper and lower case exactly
+    : return: series with the tag of every description, missing when no keyword matches
+    """
+    hits = match_product_descriptions(descriptions, list(tags), case)
+    first = hits.to_numpy().argmax(axis=1)
+    values = np.array(list(tags.values()), dtype=object)[first]
+    return pd.Series(values, index=hits.index).where(hits.to_numpy().any(axis=1))
+
+def get_spirits_price_band(year, Value_Volume, frames=None):
     """Function to read in and preprocess the Data Orbis file and split the data's sub categories
         into price bands for wines
 
     : param year: year of data analysis
     : param Value_Volume: Either sales volume or sales value, depending on analysis
+    : param frames: optional prepared sheets of the workbook from get_price_band_data
     : return: data frame of price band splits per sub category
     """
-    # get Spirits dataframe
-    df = get_product_category(year, 'CHARL SPIRIT MAT DEC')
-
-    # Convert all cognac's to brandy
-    df['SUBCATEGORY'] = df['SUBCATEGORY'].replace(['Cognac'], 'Brandy')
-
-    #Total
-    brandy_total = df[df['SUBCATEGORY'] == 'Brandy']['SALESVOLUME'].sum()
-    cane_total = df[df['SUBCATEGORY'] == 'Cane']['SALESVOLUME'].sum()
-    gin_total = df[df['SUBCATEGORY'] == 'Gin']['SALESVOLUME'].sum()
-    liqueurs_total = df[df['SUBCATEGORY'] == 'Liqueurs']['SALESVOLUME'].sum()
-    rum_total = df[df['SUBCATEGORY'] == 'Rum']['SALESVOLUME'].sum()
-    tequila_total = df[df['SUBCATEGORY'] == 'Tequila']['SALESVOLUME'].sum()
-    vodka_total = df[df['SUBCATEGORY'] == 'Vodka']['SALESVOLUME'].sum()
-    whisky_total = df[df['SUBCATEGORY'] == 'Whisky']['SALESVOLUME'].sum()
-
-    # Aggregate by subcategory, alcohol presence and price band
-    df = df.groupby(['SUBCATEGORY', 'INDEX', 'PRICE BAND CORRECT']).agg('sum')[[Value_Volume]]
-
-    # Get the aggregated subcategories and apply classifier (low alc, no alc, etc) and rename columns
-    brandy_df = df.T.Brandy
-    df_mod = pd.DataFrame(data=np.zeros(6), columns=['Zeros'], index=['Accessible Premium',
-                                                                      'Low Price',
-                                                                      'Premium',
-                                                                      'Super Premium',
-                                                                      'Ultra Premium',
-                                                                      'Value'])
-    df_mod = alcohol_type_classifier('Brandy', brandy_df, df_mod)
-    df_mod.drop('Zeros', axis='columns', inplace=True)
-    cane_df = df.T.Cane
-    df_mod = alcohol_type_classifier('Cane', cane_df, df_mod)
-    gin_df = df.T.Gin
-    df_mod = alcohol_type_classifier('Gin', gin_df, df_mod)
-    liqueurs_df = df.T.Liqueurs
-    df_mod = alcohol_type_classifier('Liqueurs', liqueurs_df, df_mod)
-    rum_df = df.T.Rum
-    df_mod = alcohol_type_classifier('Rum', rum_df, df_mod)
-    tequila_df = df.T.Tequila
-    df_mod = alcohol_type_classifier('Tequila', tequila_df, df_mod)
-    vodka_df = df.T.Vodka
-    df_mod = alcohol_type_classifier('Vodka', vodka_df, df_mod)
-    whisky_df = df.T.Whisky
-    df_mod = alcohol_type_classifier('Whisky', whisky_df, df_mod)
-
-    df_mod = df_mod.fillna(0)
-    # calculate proportions of all subcategories
-    for col in df_mod.columns:
-        if col[:len('Brandy')] == 'Brandy':
-            df_mod[col] = df_mod[col].apply(lambda x: round(x) / round(brandy_total))
-        elif col[:len('Cane')] == 'Cane':
-            df_mod[col] = df_mod[col].apply(lambda x: round(x) / round(cane_total))
-        elif col[:len('Gin')] == 'Gin':
-            df_mod[col] = df_mod[col].apply(lambda x: round(x) / round(gin_total))
-        elif col[:len('Liqueurs')] == 'Liqueurs':
-            df_mod[col] = df_mod[col].apply(lambda x: round(x) / round(liqueurs_total))
-        elif col[:len('Rum')] == 'Rum':
-            df_mod[col] = df_mod[col].apply(lambda x: round(x) / round(rum_total))
-        elif col[:len('Tequila')] == 'Tequila':
-            df_mod[col] = df_mod[col].apply(lambda x: round(x) / round(tequila_total))
-        elif col[:len('Vodka')] == 'Vodka':
-            df_mod[col] = df_mod[col].apply(lambda x: round(x) / round(vodka_total))
-        elif col[:len('Whisky')] == 'Whisky':
-            df_mod[col] = df_mod[col].apply(lambda x: round(x) / round(whisky_total))
-
-
-    df_mod = df_mod.fillna(0)
+    return price_band_family_frame(get_price_band_shares(year, Value_Volume, frames), 'spirits')
 
-    return df_mod
+def classify_price_bands(prices, table, tables=None):
+    """" Function to classify prices into price bands with the threshold tables, for all prices at once.
+    Every price is bucketed with a binary search on the bounds of its table
+
+    : param prices: prices per unit, a pandas series or array
+    : param table: name of the threshold table in price_band_tables (e.g. 'Spirits' or '330ml'),
+        or an array of table names with one name per price
+    : param tables: threshold tables by name, defaults to price_band_tables
+    : return: categorical of the price bands (categories PRICE_BANDS), missing for prices up to 0 and missing prices
+    """
+    tables = price_band_tables if tables is None else tables
+    values = np.asarray(prices, dtype=float)
+    if isinstance(table, str):
+        table_codes, names = np.zeros(values.shape, dtype=np.intp), [table]
+    else:
+        table_codes, names = pd.factorize(table)
+        table_codes = np.asarray(table_codes)
+    codes = np.full(values.shape, -1, dtype=np.int8)
+
+    for i, name in enumerate(names):
+        bounds, bands = tables[name]
+        rows = (table_codes == i) & ~np.isnan(values)
+        # position of the first bound at or above the price, the band starts at the bound before it
+        position = np.searchsorted(bounds, values[rows], side='left') - 1
+        band_codes = np.array([-1] + [PRICE_BANDS.index(band) for band in bands], dtype=np.int8)
+        codes[rows] = band_codes[position + 1]
+
+    bands = pd.Categorical.from_codes(codes, categories=PRICE_BANDS, ordered=True)
+    if isinstance(prices, pd.Series):
+        return pd.Series(bands, index=prices.index, name=prices.name)
+    return bands
+
+def classify_price_band(x, table):
+    """" Function to classify a single price into its price band, see classify_price_bands
+
+    : param x: price per unit
+    : param table: name of the threshold table in price_band_tables
+    : return: price band, or None for prices up to 0
+    """
+    band = classify_price_bands([x], table)[0]
+    return None if pd.isna(band) else band
 
 def price_band_spirit_conversion(x):
     """" Function to convert the subcategories in the data orbis dataset to
@@ -365,18 +404,8 @@ def price_band_spirit_conversion(x):
         param x: dataset
         : return: price band
         """
-    if x > 0 and x <= 100:
-        return 'Low Price'
-    elif x > 100 and x <= 150:
-        return 'Value'
-    elif x > 150 and x <= 200:
-        return 'Accessible Premium'
-    elif x > 200 and x <= 300:
-        return 'Premium'
-    elif x > 300 and x <= 400:
-        return 'Super Premium'
-    elif x > 400:
-        return 'Ultra Premium'
+    return classify_price_band(x, 'Spirits')
+
 def price_band_wine_conversion(x, category):
     """" Function to convert the subcategories in the data orbis dataset to
     price bands
@@ -385,33 +414,8 @@ def price_band_wine_conversion(x, category):
     : param category: type of wine (fortified, still, etc)
     : return: price band
     """
-    if category == 'Still Wine':
-        if x > 0 and x <= 30:
-            return 'Low Price'
-        elif x > 30 and x <= 40:
-            return 'Affordable'
-        elif x > 40 and x <= 60:
-            return 'Value'
-        elif x > 60 and x <= 85:
-            return 'Accessible Premium'
-        elif x > 85 and x <= 120:
-            return 'Premium'
-        elif x > 120 and x <= 300:
-            return 'Super Premium'
-        elif x > 300:
-            return 'Ultra Premium'
-
-    if category == 'Sparkling Wine':
-        if x > 0 and x <= 80:
-            return 'Value'
-        elif x > 80 and x <= 120:
-            return 'Accessible Premium'
-        elif x > 120 and x <= 200:
-            return 'Premium'
-        elif x > 200 and x <= 400:
-            return 'Super Premium'
-        elif x > 400:
-            return 'Ultra Premium'
+    if category in ['Still Wine', 'Sparkling Wine']:
+        return classify_price_band(x, category)
 
 def price_band_beer_conversion(x, category):
     """" Function to convert the subcategories in the data orbis dataset to
@@ -421,61 +425,20 @@ def price_band_beer_conversion(x, category):
     : param category: type of wine (fortified, still, etc)
     : return: price band
     """
-    if category == '330ml':
-        if x > 0 and x <= 60:
-            return 'Low Price'
-        elif x > 60 and x <= 70:
-            return 'Affordable'
-        elif x > 70 and x <= 80:
-            return 'Accessible Premium'
-        elif x > 80 and x <= 90:
-            return 'Premium'
-        elif x > 90 and x <= 110:
-            return 'Super Premium'
-        elif x > 110:
-            return 'Ultra Premium'
-
-    if category == '500ml':
-        if x > 0 and x <= 85:
-            return 'Low Price'
-        elif x > 85 and x <= 100:
-            return 'Affordable'
-        elif x > 100 and x <= 115:
-            return 'Accessible Premium'
-        elif x > 115 and x <= 130:
-            return 'Premium'
-        elif x > 130 and x <= 150:
-            return 'Super Premium'
-        elif x > 150:
-            return 'Ultra Premium'
-
-    if category == '660ml':
-        if x > 0 and x <= 200:
-            return 'Low Price'
-        elif x > 200 and x <= 240:
-            return 'Affordable'
-        elif x > 240 and x <= 250:
-            return 'Accessible Premium'
-        elif x > 250 and x <= 260:
-            return 'Premium'
-        elif x > 260 and x <= 280:
-            return 'Super Premium'
-        elif x > 280:
-            return 'Ultra Premium'
-
-
-def get_IWSR_data_estimates(year):
+    if category in ['330ml', '500ml', '660ml']:
+        return classify_price_band(x, category)
+
+
+def get_IWSR_data_estimates(year, sources=None):
     """"
        Function to read in and preprocess the IWSR file
 
        param year:
+       param sources: optional SourceRegistry of the current run
        : return: preprocessed df with IWSR data with stats group as index
        """
 
-    base_dir = DATA_DIRECTORY / 'Estimates' / year / 'Nikki_estimates'
-    path = get_file_in_directory(base_dir)
-
-    df = pd.read_excel(path, sheet_name='Porportions')
+    df = read_source('IWSR_estimates', year, sources)
     df_name = df['IWSR_Category2.1']
     df = df.iloc[:18, 15:]
     df['Unnamed: 15'] = df['Unnamed: 15'] * 1000
@@ -488,182 +451,88 @@ def get_IWSR_data_estimates(year):
 
     return df
 
-def category_to_priceband(category_df, priceband_spirits, priceband_beer, priceband_rtds, priceband_wine,
-                          priceband_still_wine):
-    """..."""
-    # RTDS
-    cider_alcohol_df = category_df.loc['Cider']['Alcohol_volume'] * priceband_rtds['Cider_Alcohol']
-    cider_low_alcohol_df = category_df.loc['Cider']['Low_Alcohol_volume'] * priceband_rtds['Cider_Low_Alcohol']
-    cider_no_alcohol_df = category_df.loc['Cider']['No_Alcohol_volume'] * priceband_rtds['Cider_No_Alcohol']
-    fabs_alcohol_df = category_df.loc['RTDs']['Alcohol_volume'] * priceband_rtds['Fabs_Alcohol']
-    fabs_low_alcohol_df = category_df.loc['RTDs']['Low_Alcohol_volume'] * priceband_rtds['Fabs_Low_Alcohol']
-    fabs_no_alcohol_df = category_df.loc['RTDs']['No_Alcohol_volume'] * priceband_rtds['Fabs_No_Alcohol']
-
-    # Beers
-    beer_alcohol_df = category_df.loc['Beer']['Alcohol_volume'] * priceband_beer['Beer_Alcohol']
-    beer_low_alcohol_df = category_df.loc['Beer']['Low_Alcohol_volume'] * priceband_beer['Beer_Low_Alcohol']
-    beer_no_alcohol_df = category_df.loc['Beer']['No_Alcohol_volume'] * priceband_beer['Beer_No_Alcohol']
-
-    # Spirits
-    brandy_alcohol_df = category_df.loc['Brandy']['Alcohol_volume'] * priceband_spirits['Brandy_Alcohol']
-    brandy_low_alcohol_df = category_df.loc['Brandy']['Low_Alcohol_volume'] * priceband_spirits['Brandy_Low_Alcohol']
-    # brandy_no_alcohol_df = category_df.loc['Brandy']['No_Alcohol_volume'] * priceband_spirits['Brandy_No_Alcohol']
-
-    cane_alcohol_df = category_df.loc['Cane']['Alcohol_volume'] * priceband_spirits['Cane_Alcohol']
-    # cane_low_alcohol_df = category_df.loc['Cane']['Low_Alcohol_volume'] * priceband_spirits['Cane_Low_Alcohol']
-    # cane_no_alcohol_df = category_df.loc['Cane']['No_Alcohol_volume'] * priceband_spirits['Cane_No_Alcohol']
-
-    gin_alcohol_df = category_df.loc['Gin and Genever']['Alcohol_volume'] * priceband_spirits['Gin_Alcohol']
-    gin_low_alcohol_df = category_df.loc['Gin and Genever']['Low_Alcohol_volume'] * priceband_spirits['Gin_Low_Alcohol']
-    # gin_no_alcohol_df = category_df.loc['Gin and Genever']['No_Alcohol_volume'] * priceband_spirits['Gin_No_Alcohol']
-
-    liqueurs_alcohol_df = category_df.loc['Liquers']['Alcohol_volume'] * priceband_spirits['Liqueurs_Alcohol']
-    # liqueurs_low_alcohol_df = category_df.loc['Liquers']['Low_Alcohol_volume'] * priceband_spirits['Liqueurs_Low_Alcohol']
-    # liqueurs_no_alcohol_df = category_df.loc['Liquers']['No_Alcohol_volume'] * priceband_spirits['Liqueurs_No_Alcohol']
-
-    rum_alcohol_df = category_df.loc['Rum']['Alcohol_volume'] * priceband_spirits['Rum_Alcohol']
-    # rum_low_alcohol_df = category_df.loc['Rum']['Low_Alcohol_volume'] * priceband_spirits['Rum_Low_Alcohol']
-    # rum_no_alcohol_df = category_df.loc['Rum']['No_Alcohol_volume'] * priceband_spirits['Rum_No_Alcohol']
-
-    tequila_alcohol_df = category_df.loc['Tequila']['Alcohol_volume'] * priceband_spirits['Tequila_Alcohol']
-    tequila_low_alcohol_df = category_df.loc['Tequila']['Low_Alcohol_volume'] * priceband_spirits['Tequila_Low_Alcohol']
-    # tequila_no_alcohol_df = category_df.loc['Tequila']['No_Alcohol_volume'] * priceband_spirits['Tequila_No_Alcohol']
-
-    vodka_alcohol_df = category_df.loc['Vodka']['Alcohol_volume'] * priceband_spirits['Vodka_Alcohol']
-    vodka_low_alcohol_df = category_df.loc['Vodka']['Low_Alcohol_volume'] * priceband_spirits['Vodka_Low_Alcohol']
-    # vodka_no_alcohol_df = category_df.loc['Vodka']['No_Alcohol_volume'] * priceband_spirits['Vodka_No_Alcohol']
-
-    whisky_alcohol_df = category_df.loc['Whisky']['Alcohol_volume'] * priceband_spirits['Whisky_Alcohol']
-    # whisky_low_alcohol_df = category_df.loc['Whisky']['Low_Alcohol_volume'] * priceband_spirits['Whisky_Low_Alcohol']
-    # whisky_no_alcohol_df = category_df.loc['Whisky']['No_Alcohol_volume'] * priceband_spirits['Whisky_No_Alcohol']
-
-    # Wine
-    # aperitif_alcohol_df = category_df.loc['Light Aperitifs']['Alcohol_volume'] \
-    #                       * priceband_wine['Aperitif_Alcohol']
-    aperitif_low_alcohol_df = category_df.loc['Light Aperitifs']['Low_Alcohol_volume'] \
-                              * priceband_wine['Aperitif_Low_Alcohol']
-    # aperitif_no_alcohol_df = category_df.loc['Light Aperitifs']['No_Alcohol_volume'] \
-    #                           * priceband_wine['Aperitif_No_Alcohol']
-
-    fortified_alcohol_df = category_df.loc['Fortified Wine']['Alcohol_volume'] \
-                           * priceband_wine['Fortified_Wine_Alcohol']
-    # fortified_low_alcohol_df = category_df.loc['Fortified Wine']['Low_Alcohol_volume'] \
-    #                            * priceband_wine['Fortified_Wine_Low_Alcohol']
-    # fortified_no_alcohol_df = category_df.loc['Fortified Wine']['No_Alcohol_volume'] \
-    #                            * priceband_wine['Fortified_Wine_No_Alcohol']
-
-    spark_alcohol_df = category_df.loc['Sparkling Wine']['Alcohol_volume'] \
-                           * priceband_wine['Sparkling_Wine_Alcohol']
-    # spark_low_alcohol_df = category_df.loc['Sparkling Wine']['Low_Alcohol_volume'] \
-    #                            * priceband_wine['Sparkling_Wine_Low_Alcohol']
-    spark_no_alcohol_df = category_df.loc['Sparkling Wine']['No_Alcohol_volume'] \
-                               * priceband_wine['Sparkling_Wine_No_Alcohol']
-
-    still_alcohol_df = category_df.loc['Still Wine']['Alcohol_volume'] \
-                           * priceband_still_wine['Still_Wine_Alcohol']
-    still_low_alcohol_df = category_df.loc['Still Wine']['Low_Alcohol_volume'] \
-                               * priceband_still_wine['Still_Wine_Low_Alcohol']
-    still_no_alcohol_df = category_df.loc['Still Wine']['No_Alcohol_volume'] \
-                               * priceband_still_wine['Still_Wine_No_Alcohol']
-
-
-    # RTDs
-
-    cider_alcohol_df = pd.DataFrame(cider_alcohol_df)
-    cider_alcohol_df = cider_alcohol_df.rename(columns={0: 'Cider_Alcohol'})
-    cider_low_alcohol_df = pd.DataFrame(cider_low_alcohol_df)
-    cider_low_alcohol_df = cider_low_alcohol_df.rename(columns={0: 'Cider_Low_Alcohol'})
-    cider_no_alcohol_df = pd.DataFrame(cider_no_alcohol_df)
-    cider_no_alcohol_df = cider_no_alcohol_df.rename(columns={0: 'Cider_No_Alcohol'})
-
-    fabs_alcohol_df = pd.DataFrame(fabs_alcohol_df)
-    fabs_alcohol_df = fabs_alcohol_df.rename(columns={0: 'Fabs_Alcohol'})
-    fabs_low_alcohol_df = pd.DataFrame(fabs_low_alcohol_df)
-    fabs_low_alcohol_df = fabs_low_alcohol_df.rename(columns={0: 'Fabs_Low_Alcohol'})
-    fabs_no_alcohol_df = pd.DataFrame(fabs_no_alcohol_df)
-    fabs_no_alcohol_df = fabs_no_alcohol_df.rename(columns={0: 'Fabs_No_Alcohol'})
-
-    # Beers
-
-    beer_alcohol_df = pd.DataFrame(beer_alcohol_df)
-    beer_alcohol_df = beer_alcohol_df.rename(columns={0: 'Beer_Alcohol'})
-    beer_low_alcohol_df = pd.DataFrame(beer_low_alcohol_df)
-    beer_low_alcohol_df = beer_low_alcohol_df.rename(columns={0: 'Beer_Low_Alcohol'})
-    beer_no_alcohol_df = pd.DataFrame(beer_no_alcohol_df)
-    beer_no_alcohol_df = beer_no_alcohol_df.rename(columns={0: 'Beer_No_Alcohol'})
-
-    # Spirits
-
-    brandy_alcohol_df = pd.DataFrame(brandy_alcohol_df)
-    brandy_alcohol_df = brandy_alcohol_df.rename(columns={0: 'Brandy_Alcohol'})
-    brandy_low_alcohol_df = pd.DataFrame(brandy_low_alcohol_df)
-    brandy_low_alcohol_df = brandy_low_alcohol_df.rename(columns={0: 'Brandy_Low_Alcohol'})
-
-    cane_alcohol_df = pd.DataFrame(cane_alcohol_df)
-    cane_alcohol_df = cane_alcohol_df.rename(columns={0: 'Cane_Alcohol'})
-
-    gin_alcohol_df = pd.DataFrame(gin_alcohol_df)
-    gin_alcohol_df = gin_alcohol_df.rename(columns={0: 'Gin_Alcohol'})
-    gin_low_alcohol_df = pd.DataFrame(gin_low_alcohol_df)
-    gin_low_alcohol_df = gin_low_alcohol_df.rename(columns={0: 'Gin_Low_Alcohol'})
-
-    liqueurs_alcohol_df = pd.DataFrame(liqueurs_alcohol_df)
-    liqueurs_alcohol_df = liqueurs_alcohol_df.rename(columns={0: 'Liqueurs_Alcohol'})
-
-    rum_alcohol_df = pd.DataFrame(rum_alcohol_df)
-    rum_alcohol_df = rum_alcohol_df.rename(columns={0: 'Rum_Alcohol'})
-
-    tequila_alcohol_df = pd.DataFrame(tequila_alcohol_df)
-    tequila_alcohol_df = tequila_alcohol_df.rename(columns={0: 'Tequila_Alcohol'})
-    tequila_low_alcohol_df = pd.DataFrame(tequila_low_alcohol_df)
-    tequila_low_alcohol_df = tequila_low_alcohol_df.rename(columns={0: 'Tequila_Low_Alcohol'})
-
-    vodka_alcohol_df = pd.DataFrame(vodka_alcohol_df)
-    vodka_alcohol_df = vodka_alcohol_df.rename(columns={0: 'Vodka_Alcohol'})
-    vodka_low_alcohol_df = pd.DataFrame(vodka_low_alcohol_df)
-    vodka_low_alcohol_df = vodka_low_alcohol_df.rename(columns={0: 'Vodka_Low_Alcohol'})
-
-    whisky_alcohol_df = pd.DataFrame(whisky_alcohol_df)
-    whisky_alcohol_df = whisky_alcohol_df.rename(columns={0: 'Whisky_Alcohol'})
-
-    # Wine
-
-    aperitif_low_alcohol_df = pd.DataFrame(aperitif_low_alcohol_df)
-    aperitif_low_alcohol_df = aperitif_low_alcohol_df.rename(columns={0: 'Aperitif_Low_Alcohol'})
-
-    fortified_alcohol_df = pd.DataFrame(fortified_alcohol_df)
-    fortified_alcohol_df = fortified_alcohol_df.rename(columns={0: 'Fortified_Alcohol'})
-
-    spark_alcohol_df = pd.DataFrame(spark_alcohol_df)
-    spark_alcohol_df = spark_alcohol_df.rename(columns={0: 'Sparkling_Alcohol'})
-    spark_no_alcohol_df = pd.DataFrame(spark_no_alcohol_df)
-    spark_no_alcohol_df = spark_no_alcohol_df.rename(columns={0: 'Sparkling_No_Alcohol'})
-
-    still_alcohol_df = pd.DataFrame(still_alcohol_df)
-    still_alcohol_df = still_alcohol_df.rename(columns={0: 'Still_Alcohol'})
-    still_low_alcohol_df = pd.DataFrame(still_low_alcohol_df)
-    still_low_alcohol_df = still_low_alcohol_df.rename(columns={0: 'Still_Low_Alcohol'})
-    still_no_alcohol_df = pd.DataFrame(still_no_alcohol_df)
-    still_no_alcohol_df = still_no_alcohol_df.rename(columns={0: 'Still_No_Alcohol'})
-
-
-    frames = [still_alcohol_df.T, still_low_alcohol_df.T, still_no_alcohol_df.T,
-              spark_alcohol_df.T, spark_no_alcohol_df.T,
-              fortified_alcohol_df.T,
-              aperitif_low_alcohol_df.T,
-              brandy_alcohol_df.T, brandy_low_alcohol_df.T,
-              cane_alcohol_df.T,
-              gin_alcohol_df.T, gin_low_alcohol_df.T,
-              liqueurs_alcohol_df.T,
-              rum_alcohol_df.T,
-              tequila_alcohol_df.T, tequila_low_alcohol_df.T,
-              vodka_alcohol_df.T, vodka_low_alcohol_df.T,
-              whisky_alcohol_df.T,
-              cider_alcohol_df.T, cider_low_alcohol_df.T, cider_no_alcohol_df.T,
-              fabs_alcohol_df.T, fabs_low_alcohol_df.T, fabs_no_alcohol_df.T,
-              beer_alcohol_df.T, beer_low_alcohol_df.T, beer_no_alcohol_df.T]
-
-    df = pd.concat(frames)
+# IWSR categories of the price band subcategories, and the IWSR volume columns of the alcohol indices
+IWSR_PRICE_BAND_CATEGORIES = {'Still_Wine': 'Still Wine', 'Sparkling_Wine': 'Sparkling Wine',
+                              'Fortified_Wine': 'Fortified Wine', 'Aperitif': 'Light Aperitifs', 'Brandy': 'Brandy',
+                              'Cane': 'Cane', 'Gin': 'Gin and Genever', 'Liqueurs': 'Liquers', 'Rum': 'Rum',
+                              'Tequila': 'Tequila', 'Vodka': 'Vodka', 'Whisky': 'Whisky', 'Cider': 'Cider',
+                              'Fabs': 'RTDs', 'Beer': 'Beer'}
+IWSR_VOLUME_COLUMNS = {'Alcohol': 'Alcohol_volume', 'Low_Alcohol': 'Low_Alcohol_volume',
+                       'No_Alcohol': 'No_Alcohol_volume'}
+# rows of the price band allocation, in order: the label prefix of every subcategory (e.g. Still_Alcohol) and its
+# alcohol indices with an IWSR volume
+IWSR_PRICE_BAND_ROWS = {'Still_Wine': ('Still', ['Alcohol', 'Low_Alcohol', 'No_Alcohol']),
+                        'Sparkling_Wine': ('Sparkling', ['Alcohol', 'No_Alcohol']),
+                        'Fortified_Wine': ('Fortified', ['Alcohol']),
+                        'Aperitif': ('Aperitif', ['Low_Alcohol']),
+                        'Brandy': ('Brandy', ['Alcohol', 'Low_Alcohol']),
+                        'Cane': ('Cane', ['Alcohol']),
+                        'Gin': ('Gin', ['Alcohol', 'Low_Alcohol']),
+                        'Liqueurs': ('Liqueurs', ['Alcohol']),
+                        'Rum': ('Rum', ['Alcohol']),
+                        'Tequila': ('Tequila', ['Alcohol', 'Low_Alcohol']),
+                        'Vodka': ('Vodka', ['Alcohol', 'Low_Alcohol']),
+                        'Whisky': ('Whisky', ['Alcohol']),
+                        'Cider': ('Cider', ['Alcohol', 'Low_Alcohol', 'No_Alcohol']),
+                        'Fabs': ('Fabs', ['Alcohol', 'Low_Alcohol', 'No_Alcohol']),
+                        'Beer': ('Beer', ['Alcohol', 'Low_Alcohol', 'No_Alcohol'])}
+
+def allocate_price_bands(volumes, shares):
+    """Function to allocate the volume of every subcategory and alcohol index into its price bands
+
+    : param volumes: array of shape (subcategories, alcohol indices) with the volumes
+    : param shares: array of shape (subcategories, alcohol indices, price bands) with the price band shares
+    : return: array of shape (subcategories, alcohol indices, price bands) with the allocated volumes
+    """
+    return volumes[:, :, np.newaxis] * shares
+
+def category_to_priceband(category_df, shares):
+    """Function to split the IWSR volumes of every category and alcohol index into price bands.
+    The volumes are aligned with the share cube of price_band_share_array and allocated in one step.
+    The rows are those of IWSR_PRICE_BAND_ROWS that have both a volume and price band shares
+
+    : param category_df: IWSR estimates from get_IWSR_data_estimates
+    : param shares: price band shares of a single measure from get_price_band_shares
+    : return: data frame with a row per subcategory and alcohol index (e.g. Still_Alcohol) and the price bands as columns
+    """
+    cube, names = price_band_share_array(shares)
+    subcategories = list(IWSR_PRICE_BAND_CATEGORIES)
+    cube = cube[[names.index(name) for name in subcategories]]
+    has_shares = pd.MultiIndex.from_product([subcategories, ALCOHOL_INDICES]).isin(shares.index.droplevel(2))
+
+    # IWSR volumes of every subcategory and alcohol index, NaN for the indices without an IWSR volume column
+    category_df = category_df[~category_df.index.duplicated()]
+    categories = [IWSR_PRICE_BAND_CATEGORIES[name] for name in subcategories]
+    columns = [IWSR_VOLUME_COLUMNS.get(index) for index in ALCOHOL_INDICES]
+    volumes = category_df.reindex(index=categories, columns=columns).to_numpy(dtype=float)
+    has_volumes = np.isin(categories, category_df.index)[:, np.newaxis] & pd.notna(columns)[np.newaxis, :]
+
+    allocation = allocate_price_bands(volumes, cube).reshape(-1, len(PRICE_BANDS))
+    has_rows = (has_shares.reshape(has_volumes.shape) & has_volumes).ravel()
+
+    # positions of the rows in the (subcategory, alcohol index) order of the allocation
+    positions, labels = [], []
+    for name, (prefix, indices) in IWSR_PRICE_BAND_ROWS.items():
+        for index in indices:
+            position = subcategories.index(name) * len(ALCOHOL_INDICES) + ALCOHOL_INDICES.index(index)
+            if has_rows[position]:
+                positions.append(position)
+                labels.append(f'{prefix}_{index}')
+    return pd.DataFrame(data=allocation[positions], index=labels, columns=PRICE_BANDS)
+
+def price_band_table(shares):
+    """Function to concatenate the price band splits of all category families
+
+    : param shares: price band shares of a single measure from get_price_band_shares
+    : return dataframe of concatenated categories
+    """
+    df_spirits = price_band_family_frame(shares, 'spirits')
+    df_beer = price_band_family_frame(shares, 'beer')
+    df_rtds = price_band_family_frame(shares, 'rtds')
+    df_wine = price_band_family_frame(shares, 'sparkling_wine')
+    df_still_wine = price_band_family_frame(shares, 'still_wine')
+    df = pd.concat([df_still_wine, df_wine, df_rtds, df_beer, df_spirits], axis=1)
+    df = df.fillna(0)
 
     return df
 
@@ -674,18 +543,42 @@ def price_band_conversions(year, Value_Volume):
     : param Value_Volume: Either sales volume or sales value, depending on analysis
     : return dataframe of concatenated categories
     """
-    df_spirits = get_spirits_price_band(year, Value_Volume)
-    df_beer = get_beer_price_band(year, Value_Volume)
-    df_rtds = get_Rtds_price_band(year, Value_Volume)
-    df_wine = get_spark_wine_price_band(year, Value_Volume)
-    df_still_wine = get_still_wine_price_band(year, Value_Volume)
-    df = pd.concat([df_still_wine, df_wine, df_rtds, df_beer, df_spirits], axis=1)
-    df = df.fillna(0)
+    # the workbook is read once and the shares of all categories come from a single aggregation
+    df = price_band_table(get_price_band_shares(year, Value_Volume))
 
-    output_path = f'out\price_band_Final_probably_not{year}.csv'
+    output_path = OUTPUT_DIRECTORY / f'price_band_Final_probably_not{year}.csv'
     df.to_csv(output_path)
     return df
 
+def price_band_conversions_long(years=('2020', '2019'), measures=('SALESVOLUME', 'SALESVALUE')):
+    """Function to split all categories into price bands for several years and measures at once.
+    The workbook is read once, and the shares of both measures of a year come from a single aggregation
+
+    : param years: years of analysis, the workbook holds the current (2020) and previous (2019) year
+    : param measures: sales volume and/or sales value
+    : return long dataframe with a row per year, measure, subcategory, alcohol index and price band
+    """
+    frames = read_sources(list(PRICE_BAND_SOURCES.values()))
+    columns = {f'{name}_{index}': (name, index)
+               for _, names in PRICE_BAND_FAMILIES.values() for name in names for index in ALCOHOL_INDICES}
+
+    tables = []
+    for year in years:
+        prepared = {sheet: prepare_product_category(frames[source].copy(), year)
+                    for sheet, source in PRICE_BAND_SOURCES.items()}
+        shares = get_price_band_shares(year, list(measures), prepared)
+        for measure in measures:
+            df = price_band_table(shares[measure]).rename_axis('PRICE BAND').reset_index()
+            df = df.melt(id_vars='PRICE BAND', var_name='COLUMN', value_name='SHARE')
+            df['YEAR'] = year
+            df['MEASURE'] = measure
+            tables.append(df)
+
+    df = pd.concat(tables, ignore_index=True)
+    df['SUBCATEGORY'] = df['COLUMN'].map({column: name for column, (name, _) in columns.items()})
+    df['INDEX'] = df['COLUMN'].map({column: index for column, (_, index) in columns.items()})
+    return df[['YEAR', 'MEASURE', 'SUBCATEGORY', 'INDEX', 'PRICE BAND', 'SHARE']]
+
 
 # volumes output
 # df_volume = final_output_to_csv('2019', 'SALESVOLUME')
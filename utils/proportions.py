@@ -2,6 +2,10 @@ import os
 import pathlib
 import pandas as pd
 import numpy as np
+import re
+import hashlib
+from utils.cache import CACHE_DIRECTORY, STORE_FOLDER, code_fingerprint, file_fingerprint, get_temporary_path
+from utils.schemas import YEAR_PATTERN
 from utils.utils import *
 
 def map_to_base_data_prop(group, df, mappings, prop):
@@ -30,19 +34,18 @@ def map_to_base_data_prop(group, df, mappings, prop):
     return None
 
 
-def H1_H2_SALBA(year):
+def H1_H2_SALBA(year, sources=None):
     """ Function to read in and convert the SAlBA dates to h1 and h2 proportions where
     h1 maps Jan - June and h2 maps July - december data
 
     param year: year of analysis
+    param sources: optional SourceRegistry of the current run
     : return: H1 and H2 proportions of SALBA data i.e. (Gin, Vodka, Brandy, etc)
     """
-    base_dir = DATA_DIRECTORY / 'SALBA' / year / ''
-    path = get_file_in_directory(base_dir)
-
-    df = pd.read_excel(path, sheet_name='SUMMARY')
-    df_2020 = df.iloc[:, [1, 21]]
-    df = df.iloc[:, [1, 18, 19, 20]]
+    # label column, the shares of the three base years and of the current year
+    df = read_source('SALBA_summary', year, sources)
+    df_2020 = df.iloc[:, [0, 4]]
+    df = df.iloc[:, [0, 1, 2, 3]]
 
     # df = transform_SALBA_df(df)
     # df['H1'] = df['1st Quarter'] + df['2nd Quarter']
@@ -100,129 +103,76 @@ def H1_H2_SALBA(year):
 
     return df_base, df_2020
 
-def H1_H2_Epos(year):
-    """ Function to read in and convert the EPOS dates to h1 and h2 proportions where
-        h1 maps Jan - June and h2 maps July - december data. Remember Epos provides all categories.
-        The categories that are not available in SALBA, SAWIS and SARS are taken from these results
+# EPOS subcategories with the name of their group in the H1 and H2 proportions, in output order
+EPOS_SUBCATEGORIES = {'Aperitif': 'Aperitif', 'Beer': 'Beer', 'Brandy': 'Brandy', 'Cane': 'Cane', 'Cider': 'Cider',
+                      'Fabs': 'Fabs', 'Fortified': 'Fortified Wine', 'Gin': 'Gin', 'Liqueurs': 'Liqueurs', 'Rum': 'Rum',
+                      'Sparkling': 'Sparkling Wine', 'Still wine': 'Still Wine', 'Tequila': 'Tequila',
+                      'Vodka': 'Vodka', 'Whisky': 'Whisky'}
 
-    param year: year of analysis
-    : return: H1 and H2 proportions of EPOS data
+
+def H1_H2_Epos_all_years(df=None, sources=None):
+    """ Function to read in and convert the EPOS dates to h1 and h2 proportions for every year in the file at once.
+        The file is read once and the proportions come from a single pass over the rows
+
+    param df: optional monthly EPOS data, read from the Data_Orbis_Charl file by default
+    param sources: optional SourceRegistry of the current run
+    : return: H1 and H2 proportions of EPOS data with the categories as rows and (year, H1/H2) as columns
         """
     # Read in the data
-    base_dir = DATA_DIRECTORY / 'data_orbis_low_level' / 'Data_Orbis_Charl'
-    path = get_file_in_directory(base_dir)
-    df = pd.read_excel(path, sheet_name='Sheet1')
+    if df is None:
+        df = read_source('data_orbis_monthly', None, sources)
 
     #filter for South Africa
     df = df[df['COUNTRYNAME'] == 'South Africa']
 
-    # seperate the data by subcategory
-    df['PRODUCTSUBCATEGORY'] = df['PRODUCTSUBCATEGORY'].replace(['Cognac'], 'Brandy')
-    df['month'] = df['Realigned YYYYMM'].apply(lambda x: int(str(x)[5:]))
-    df['year'] = df['Realigned YYYYMM'].apply(lambda x: str(x)[:4])
-
-    #filter by year 2020
-    df = df[df['year'] == year]
-
-    aperitif_df = df[df['PRODUCTSUBCATEGORY'] == 'Aperitif']
-    beer_df = df[df['PRODUCTSUBCATEGORY'] == 'Beer']
-    brandy_df = df[df['PRODUCTSUBCATEGORY'] == 'Brandy']
-    cane_df = df[df['PRODUCTSUBCATEGORY'] == 'Cane']
-    cider_df = df[df['PRODUCTSUBCATEGORY'] == 'Cider']
-    fabs_df = df[df['PRODUCTSUBCATEGORY'] == 'Fabs']
-    fortified_df = df[df['PRODUCTSUBCATEGORY'] == 'Fortified']
-    gin_df = df[df['PRODUCTSUBCATEGORY'] == 'Gin']
-    liqueurs_df = df[df['PRODUCTSUBCATEGORY'] == 'Liqueurs']
-    rum_df = df[df['PRODUCTSUBCATEGORY'] == 'Rum']
-    sparkling_df = df[df['PRODUCTSUBCATEGORY'] == 'Sparkling']
-    still_df = df[df['PRODUCTSUBCATEGORY'] == 'Still wine']
-    tequila_df = df[df['PRODUCTSUBCATEGORY'] == 'Tequila']
-    vodka_df = df[df['PRODUCTSUBCATEGORY'] == 'Vodka']
-    whisky_df = df[df['PRODUCTSUBCATEGORY'] == 'Whisky']
-
-    # get total sales volume by H1 and H2
-    h1_aperitif = aperitif_df[aperitif_df['month'] <= 6]['SALESVOLUME'].sum()
-    h2_aperitif = aperitif_df[aperitif_df['month'] > 6]['SALESVOLUME'].sum()
-    h1_beer = beer_df[beer_df['month'] <= 6]['SALESVOLUME'].sum()
-    h2_beer = beer_df[beer_df['month'] > 6]['SALESVOLUME'].sum()
-    h1_brandy = brandy_df[brandy_df['month'] <= 6]['SALESVOLUME'].sum()
-    h2_brandy = brandy_df[brandy_df['month'] > 6]['SALESVOLUME'].sum()
-    h1_cane = cane_df[cane_df['month'] <= 6]['SALESVOLUME'].sum()
-    h2_cane = cane_df[cane_df['month'] > 6]['SALESVOLUME'].sum()
-    h1_cider = cider_df[cider_df['month'] <= 6]['SALESVOLUME'].sum()
-    h2_cider = cider_df[cider_df['month'] > 6]['SALESVOLUME'].sum()
-    h1_fabs = fabs_df[fabs_df['month'] <= 6]['SALESVOLUME'].sum()
-    h2_fabs = fabs_df[fabs_df['month'] > 6]['SALESVOLUME'].sum()
-    h1_fortified = fortified_df[fortified_df['month'] <= 6]['SALESVOLUME'].sum()
-    h2_fortified = fortified_df[fortified_df['month'] > 6]['SALESVOLUME'].sum()
-    h1_gin = gin_df[gin_df['month'] <= 6]['SALESVOLUME'].sum()
-    h2_gin = gin_df[gin_df['month'] > 6]['SALESVOLUME'].sum()
-    h1_liqueurs = liqueurs_df[liqueurs_df['month'] <= 6]['SALESVOLUME'].sum()
-    h2_liqueurs = liqueurs_df[liqueurs_df['month'] > 6]['SALESVOLUME'].sum()
-    h1_rum = rum_df[rum_df['month'] <= 6]['SALESVOLUME'].sum()
-    h2_rum = rum_df[rum_df['month'] > 6]['SALESVOLUME'].sum()
-    h1_sparkling = sparkling_df[sparkling_df['month'] <= 6]['SALESVOLUME'].sum()
-    h2_sparkling = sparkling_df[sparkling_df['month'] > 6]['SALESVOLUME'].sum()
-    h1_still = still_df[still_df['month'] <= 6]['SALESVOLUME'].sum()
-    h2_still = still_df[still_df['month'] > 6]['SALESVOLUME'].sum()
-    h1_tequila = tequila_df[tequila_df['month'] <= 6]['SALESVOLUME'].sum()
-    h2_tequila = tequila_df[tequila_df['month'] > 6]['SALESVOLUME'].sum()
-    h1_vodka = vodka_df[vodka_df['month'] <= 6]['SALESVOLUME'].sum()
-    h2_vodka = vodka_df[vodka_df['month'] > 6]['SALESVOLUME'].sum()
-    h1_whisky = whisky_df[whisky_df['month'] <= 6]['SALESVOLUME'].sum()
-    h2_whisky = whisky_df[whisky_df['month'] > 6]['SALESVOLUME'].sum()
-
-    # Create a dataframe
-
-    df_mod = pd.DataFrame(data={
-        'H1': [(h1_aperitif / (h1_aperitif + h2_aperitif)),
-               (h1_beer / (h1_beer + h2_beer)),
-               (h1_brandy / (h1_brandy + h2_brandy)),
-               (h1_cane / (h1_cane + h2_cane)),
-               (h1_cider / (h1_cider + h2_cider)),
-               (h1_fabs / (h1_fabs + h2_fabs)),
-               (h1_fortified / (h1_fortified + h2_fortified)),
-               (h1_gin / (h1_gin + h2_gin)),
-               (h1_liqueurs / (h1_liqueurs + h2_liqueurs)),
-               (h1_rum / (h1_rum + h2_rum)),
-               (h1_sparkling / (h1_sparkling + h2_sparkling)),
-               (h1_still / (h1_still + h2_still)),
-               (h1_tequila / (h1_tequila + h2_tequila)),
-               (h1_vodka / (h1_vodka + h2_vodka)),
-               (h1_whisky / (h1_whisky + h2_whisky)),],
-
-        'H2': [(h2_aperitif / (h1_aperitif + h2_aperitif)),
-               (h2_beer / (h1_beer + h2_beer)),
-               (h2_brandy / (h1_brandy + h2_brandy)),
-               (h2_cane / (h1_cane + h2_cane)),
-               (h2_cider / (h1_cider + h2_cider)),
-               (h2_fabs / (h1_fabs + h2_fabs)),
-               (h2_fortified / (h1_fortified + h2_fortified)),
-               (h2_gin / (h1_gin + h2_gin)),
-               (h2_liqueurs / (h1_liqueurs + h2_liqueurs)),
-               (h2_rum / (h1_rum + h2_rum)),
-               (h2_sparkling / (h1_sparkling + h2_sparkling)),
-               (h2_still / (h1_still + h2_still)),
-               (h2_tequila / (h1_tequila + h2_tequila)),
-               (h2_vodka / (h1_vodka + h2_vodka)),
-               (h2_whisky / (h1_whisky + h2_whisky))]
-
-    }, index=['Aperitif', 'Beer', 'Brandy', 'Cane', 'Cider', 'Fabs', 'Fortified Wine', 'Gin',
-              'Liqueurs', 'Rum', 'Sparkling Wine', 'Still Wine', 'Tequila', 'Vodka', 'Whisky'])
-
+    # parse the period (YYYY-MM) of every row at once, cognac is counted as brandy
+    period = df['Realigned YYYYMM'].astype(str)
+    year = period.str[:4]
+    half = np.where(period.str[5:].astype(int) <= 6, 'H1', 'H2')
+    subcategory = df['PRODUCTSUBCATEGORY'].replace(['Cognac'], 'Brandy')
+
+    # total sales volume per year, half and subcategory, summed in row order, see sum_in_row_order
+    codes, groups = pd.MultiIndex.from_arrays([year.values, half, subcategory.values]).factorize()
+    totals = pd.Series(data=sum_in_row_order(df['SALESVOLUME'].to_numpy(dtype=float), codes, len(groups)),
+                       index=groups)
+    totals = totals.unstack([0, 1]).reindex(index=list(EPOS_SUBCATEGORIES))
+    years = sorted(set(totals.columns.get_level_values(0)))
+    totals = totals.reindex(columns=pd.MultiIndex.from_product([years, ['H1', 'H2']])).fillna(0)
+
+    # proportion of every half of the year
+    h1 = totals.xs('H1', axis=1, level=1)
+    h2 = totals.xs('H2', axis=1, level=1)
+    df_mod = pd.concat({'H1': h1 / (h1 + h2), 'H2': h2 / (h1 + h2)}, axis=1).swaplevel(axis=1)
+    df_mod = df_mod.reindex(columns=totals.columns)
+    df_mod.index = list(EPOS_SUBCATEGORIES.values())
     return df_mod
 
-def H1_H2_SAWIS(year):
+
+def H1_H2_Epos(year, df_all_years=None):
+    """ Function to read in and convert the EPOS dates to h1 and h2 proportions where
+        h1 maps Jan - June and h2 maps July - december data. Remember Epos provides all categories.
+        The categories that are not available in SALBA, SAWIS and SARS are taken from these results
+
+    param year: year of analysis
+    param df_all_years: optional proportions of all years from H1_H2_Epos_all_years, computed by default
+    : return: H1 and H2 proportions of EPOS data
+        """
+    if df_all_years is None:
+        df_all_years = H1_H2_Epos_all_years()
+
+    if year not in df_all_years.columns.get_level_values(0):
+        return pd.DataFrame(data=np.nan, index=df_all_years.index, columns=['H1', 'H2'])
+    return df_all_years[year].copy()
+
+def H1_H2_SAWIS(year, sources=None):
     """ Function to read in and convert the SAWIS dates to h1 and h2 proportions where
             h1 maps Jan - June and h2 maps July - december data
 
         param year: year of analysis
+        param sources: optional SourceRegistry of the current run
     : return: H1 and H2 proportions of SALBA data i.e. (still, fortified and sparkling wine)
             """
-    base_dir = DATA_DIRECTORY / 'SAWIS' / year / ''
-    path = get_file_in_directory(base_dir)
-
-    sawis_df = pd.read_excel(path, sheet_name='Local', skiprows=2)
+    sawis_df = read_source('SAWIS_monthly', year, sources)
     still_wine = sawis_df.T[:5].T[1:].iloc[:13]
     spark_wine = sawis_df.T[5:10].T[1:].iloc[:13]
     fortified_wine = sawis_df.T[10:].T[1:].iloc[:13]
@@ -283,17 +233,15 @@ def H1_H2_SAWIS(year):
 
     return df_base, df_2020
 
-def H1_H2_SARS(year):
+def H1_H2_SARS(year, sources=None):
     """ Function to read in and convert the SARS dates to h1 and h2 proportions where
                 h1 maps Jan - June and h2 maps July - december data
 
         param year: year of analysis
+        param sources: optional SourceRegistry of the current run
         : return: proportions of H1 and H2 of the various groups (such as Beer)"""
 
-    base_dir = DATA_DIRECTORY / 'SARS' / year / ''
-    path = get_file_in_directory(base_dir)
-
-    sars_df = pd.read_excel(path, sheet_name='Sheet1', skiprows=1)
+    sars_df = read_source('SARS', year, sources)
     sars_df = sars_df.iloc[:20,14:]
     sars_df = sars_df.fillna(0)
     sars_df["Unnamed: 14"] = sars_df["Unnamed: 14"].apply(lambda x: str(round(x)))
@@ -322,15 +270,16 @@ def H1_H2_SARS(year):
 
     return df_base, df_2020
 
-def H1_H2_base(year):
+def H1_H2_base(year, sources=None):
     """ Function to concat all proportions
 
         param year: year of analysis
+        param sources: optional SourceRegistry of the current run
         : return: concatenated dataframes
     """
-    df_base_sars, df_2020_sars = H1_H2_SARS(year)
-    df_base_sawis, df_2020_sawis = H1_H2_SAWIS(year)
-    df_base_salba, df_2020_salba = H1_H2_SALBA(year)
+    df_base_sars, df_2020_sars = H1_H2_SARS(year, sources)
+    df_base_sawis, df_2020_sawis = H1_H2_SAWIS(year, sources)
+    df_base_salba, df_2020_salba = H1_H2_SALBA(year, sources)
     df_base = pd.concat([df_base_sars, df_base_sawis, df_base_salba])
     df_2020 = pd.concat([df_2020_sars, df_2020_sawis, df_2020_salba])
 
@@ -338,8 +287,10 @@ def H1_H2_base(year):
     df_base.rename(index={'Gin': 'Gin and Genever'}, inplace=True)
     df_2020.rename(index={'Gin': 'Gin and Genever'}, inplace=True)
 
-    df_2020_epos = H1_H2_Epos('2020')
-    df_2019_epos = H1_H2_Epos('2019')
+    # the EPOS file is read and grouped once for both years
+    df_epos = H1_H2_Epos_all_years(sources=sources)
+    df_2020_epos = H1_H2_Epos('2020', df_epos)
+    df_2019_epos = H1_H2_Epos('2019', df_epos)
 
     # add missing categories
     df_addition = pd.DataFrame(data={'H1': [
@@ -367,12 +318,230 @@ def H1_H2_base(year):
     df_2020 = pd.concat([df_2020, df_addition_2020])
 
     return df_base, df_2020
+
+
+# sources the H1 and H2 proportions are built from, with whether the source keeps a folder per year
+PROPORTION_SOURCES = {'SARS': True, 'SAWIS_monthly': True, 'SALBA_summary': True, 'data_orbis_monthly': False}
+
+# objects built or loaded from the store in this run, by path of their entry (stores of other cache directories
+# are kept apart)
+_store = {}
+
+
+def get_store_key(year, sources, modules=('utils.proportions',)):
+    """ Method to get the key of an object in the store that is built from a set of sources. The key is made of
+    the fingerprints of the source workbooks and of the code, so it changes whenever one of the workbooks or the
+    code building the object changes
+
+    param year: year of analysis
+    param sources: dictionary of source name to whether the source keeps a folder per year, see SOURCE_SCHEMAS
+    param modules: modules building the object, the code they use is part of the key, see code_fingerprint
+    : return: hex digest identifying the object
+    """
+
+    fingerprints = []
+    for source, per_year in sources.items():
+        base_dir, sheet_name, read_kwargs = get_source_request(source, year if per_year else None)
+        fingerprints.append((source, file_fingerprint(get_file_in_directory(base_dir)), sheet_name,
+                             sorted(read_kwargs.items())))
+
+    key = repr((code_fingerprint(modules), year, fingerprints))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def get_store_path(name, key, cache_dir=None):
+    """ Method to get the path of an entry of the store, in the store folder of the cache directory
+
+    param name: name of the object, used as prefix of the entry, e.g. 'proportions'
+    param key: store key of the object, see get_store_key
+    param cache_dir: directory of the store, defaults to CACHE_DIRECTORY
+    : return: path of the pickled entry
+    """
+
+    return Path(cache_dir or CACHE_DIRECTORY) / STORE_FOLDER / f'{name}_{key}.pkl'
+
+
+def is_stored(name, key, cache_dir=None):
+    """ Method to check whether an object is in the store, without loading it
+
+    param name: name of the object, e.g. 'proportions'
+    param key: store key of the object
+    param cache_dir: directory of the store, defaults to CACHE_DIRECTORY
+    : return: True if the object is in memory or persisted in the cache directory
+    """
+
+    path = get_store_path(name, key, cache_dir)
+    return path in _store or path.exists()
+
+
+def load_stored(name, key, cache_dir=None):
+    """ Method to load an object from the store
+
+    param name: name of the object, e.g. 'proportions'
+    param key: store key of the object
+    param cache_dir: directory of the store, defaults to CACHE_DIRECTORY
+    : return: the stored object, or None if the object is not in the store
+    """
+
+    path = get_store_path(name, key, cache_dir)
+    if path in _store:
+        return _store[path]
+    if not path.exists():
+        return None
+    try:
+        stored = pd.read_pickle(path)
+    except Exception:
+        # unreadable entry (e.g. written by another pandas version), the object has to be built again
+        return None
+
+    _store[path] = stored
+    return stored
+
+
+def save_stored(stored, name, key, cache_dir=None):
+    """ Method to persist an object in the store, it is kept in memory for the rest of the run
+
+    param stored: object to store
+    param name: name of the object, e.g. 'proportions'
+    param key: store key of the object
+    param cache_dir: directory of the store, defaults to CACHE_DIRECTORY
+    : return: the stored object
+    """
+
+    path = get_store_path(name, key, cache_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # write to a temporary file first so that concurrent readers never see a partial entry
+    tmp_path = get_temporary_path(path)
+    pd.to_pickle(stored, tmp_path)
+    os.replace(tmp_path, path)
+
+    _store[path] = stored
+    return stored
+
+
+def load_or_build(name, key, build, cache_dir=None):
+    """ Method to load an object from the store, or build and persist it when it is not in the store yet.
+    Entries are pickled in the cache directory and kept in memory for the rest of the run
+
+    param name: name of the object, used as prefix of the entry, e.g. 'proportions'
+    param key: store key of the object, see get_store_key
+    param build: function without arguments that builds the object
+    param cache_dir: directory of the store, defaults to CACHE_DIRECTORY
+    : return: the stored object
+    """
+
+    stored = load_stored(name, key, cache_dir)
+    if stored is None:
+        stored = save_stored(build(), name, key, cache_dir)
+    return stored
+
+
+def get_proportions(year, cache_dir=None, start_month=7):
+    """ Method to get the base and 2020 H1 and H2 proportions from the proportions store. The proportions are
+    built once by H1_H2_base and persisted in the cache directory, later calls and runs load them until one of
+    the source workbooks changes. All fiscal year conversions share the proportions of the store.
+    Fiscal years that do not start in July take their proportions from the seasonality cube instead
+
+    param year: year of analysis
+    param cache_dir: directory of the store, defaults to CACHE_DIRECTORY
+    param start_month: first month of the fiscal year, 7 or 1, see get_fiscal_year_proportions
+    : return: tuple of the base and 2020 proportions
+    """
+
+    if start_month != 7:
+        # imported here as utils.seasonality builds on this module
+        from utils.seasonality import get_fiscal_year_proportions
+        return get_fiscal_year_proportions(start_month, year, cache_dir)
+
+    key = get_store_key(year, PROPORTION_SOURCES)
+    proportions = load_or_build('proportions', key, lambda: H1_H2_base(year), cache_dir)
+    return tuple(df.copy() for df in proportions)
+
+
+# year whose H1 and H2 proportions are taken from the 2020 proportions instead of the base proportions
+EXCEPTIONAL_YEAR = 2020
+
+
+def get_year_columns(df):
+    """ Method to get the full range of years found in the columns of a dataframe
+
+    param df: dataframe with years (e.g. 2019 or '2019') among its columns
+    : return: tuple of (year columns of df in year order, every year from the first to the last one)
+    """
+
+    columns = sorted([c for c in df.columns if re.match(YEAR_PATTERN, str(c))], key=int)
+    if not columns:
+        raise ValueError('No year columns found')
+    return columns, list(range(int(columns[0]), int(columns[-1]) + 1))
+
+
+def get_year_values(df):
+    """ Method to get the values of the year columns of a dataframe as an array over the full year range.
+    Years missing in between the first and last year are filled with NaN
+
+    param df: dataframe with years (e.g. 2019 or '2019') among its columns
+    : return: tuple of (numpy array of shape (rows, years), every year from the first to the last one)
+    """
+
+    columns, years = get_year_columns(df)
+    values = df[columns].to_numpy(dtype=float)
+    if len(columns) < len(years):
+        values = pd.DataFrame(values, columns=[int(c) for c in columns]).reindex(columns=years).to_numpy()
+    return values, years
+
+
+def stack_proportions(categories, years, df_base, df_2020, exceptional_year=EXCEPTIONAL_YEAR):
+    """ Method to stack the H1 and H2 proportions of every category and year into a single array.
+    The exceptional year takes the 2020 proportions, all other years the base proportions
+
+    param categories: categories in row order, e.g. the index of the forecasts
+    param years: years in column order
+    param df_base: base H1 and H2 proportions with the categories as index
+    param df_2020: 2020 H1 and H2 proportions with the categories as index
+    param exceptional_year: year that takes the 2020 proportions
+    : return: numpy array of shape (categories, years, 2) with the H1 and H2 proportions
+    """
+
+    proportions = np.empty((len(categories), len(years), 2))
+    proportions[:] = df_base.loc[categories, ['H1', 'H2']].to_numpy(dtype=float)[:, np.newaxis, :]
+
+    exceptional = np.array([int(y) == int(exceptional_year) for y in years], dtype=bool)
+    if exceptional.any():
+        proportions[:, exceptional] = df_2020.loc[categories, ['H1', 'H2']].to_numpy(dtype=float)[:, np.newaxis, :]
+    return proportions
+
+
+def fiscal_years(values, proportions):
+    """ Method to convert calendar years to fiscal years, where fiscal year y is H2 of year y - 1 plus H1 of year y
+
+    param values: numpy array of shape (rows, years) with the calendar year volumes or values
+    param proportions: numpy array of shape (rows, years, 2) with the H1 and H2 proportions, see stack_proportions
+    : return: numpy array of shape (rows, years - 1) with the fiscal years from the second year on
+    """
+
+    halves = proportions * values[:, :, np.newaxis]
+    return halves[:, :-1, 1] + halves[:, 1:, 0]
+
+
+def fiscal_year_engine(df, df_base, df_2020):
+    """ Method to convert a (category x year) table to fiscal years, for every year range found in the table.
+    Years missing in between the first and last year give NaN in the fiscal years next to them
+
+    param df: dataframe with the categories as index and the years as columns, other columns are ignored
+    param df_base: base H1 and H2 proportions with the categories as index
+    param df_2020: 2020 H1 and H2 proportions with the categories as index
+    : return: dataframe with the categories as index and the fiscal years (e.g. '2021') as columns
+    """
+
+    values, years = get_year_values(df)
+    fiscal = fiscal_years(values, stack_proportions(df.index, years, df_base, df_2020))
+    return pd.DataFrame(data=fiscal, index=df.index, columns=[str(y) for y in years[1:]])
+
+
 def fiscal_year_cagr(year):
     """..."""
     # Get the CAGR data (from 2011 to 2020)
-    base_dir = DATA_DIRECTORY / 'CAGR' /''
-    path = get_file_in_directory(base_dir)
-    df = pd.read_excel(path, sheet_name='Summary2', skiprows=2)
+    df = read_source('CAGR')
     #df = df.iloc[:,:12]
     df = df.dropna()
     df = df.set_index(['CATEGORY'])
@@ -380,191 +549,39 @@ def fiscal_year_cagr(year):
     df = df[df['INSTITUTION'] == 'DISTELL']
 
     # Get the base and 2020 proportions
-    df_base, df_2020 = H1_H2_base(year) # TODO check naming convention with retrieved file
-
-    # calculate splits
-    length, _ = df.shape
-    df_mod_2011 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df.index)
-    df_mod_2012 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df.index)
-    df_mod_2013 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df.index)
-    df_mod_2014 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df.index)
-    df_mod_2015 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df.index)
-    df_mod_2016 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df.index)
-    df_mod_2017 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df.index)
-    df_mod_2018 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df.index)
-    df_mod_2019 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df.index)
-    df_mod_2020 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df.index)
-    df_mod_2021 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df.index)
-    df_mod_2022 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df.index)
-    df_mod_2023 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df.index)
-    df_mod_2024 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df.index)
-    df_mod_2025 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df.index)
-    df_mod_2026 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df.index)
-    #
-    for index in df.index:
-        df_mod_2011.loc[index]['H1'] = df_base.loc[index]['H1'] * df.loc[index][2011]
-        df_mod_2011.loc[index]['H2'] = df_base.loc[index]['H2'] * df.loc[index][2011]
-    for index in df.index:
-        df_mod_2012.loc[index]['H1'] = df_base.loc[index]['H1'] * df.loc[index][2012]
-        df_mod_2012.loc[index]['H2'] = df_base.loc[index]['H2'] * df.loc[index][2012]
-    for index in df.index:
-        df_mod_2013.loc[index]['H1'] = df_base.loc[index]['H1'] * df.loc[index][2013]
-        df_mod_2013.loc[index]['H2'] = df_base.loc[index]['H2'] * df.loc[index][2013]
-    for index in df.index:
-        df_mod_2014.loc[index]['H1'] = df_base.loc[index]['H1'] * df.loc[index][2014]
-        df_mod_2014.loc[index]['H2'] = df_base.loc[index]['H2'] * df.loc[index][2014]
-    for index in df.index:
-        df_mod_2015.loc[index]['H1'] = df_base.loc[index]['H1'] * df.loc[index][2015]
-        df_mod_2015.loc[index]['H2'] = df_base.loc[index]['H2'] * df.loc[index][2015]
-    for index in df.index:
-        df_mod_2016.loc[index]['H1'] = df_base.loc[index]['H1'] * df.loc[index][2016]
-        df_mod_2016.loc[index]['H2'] = df_base.loc[index]['H2'] * df.loc[index][2016]
-    for index in df.index:
-        df_mod_2017.loc[index]['H1'] = df_base.loc[index]['H1'] * df.loc[index][2017]
-        df_mod_2017.loc[index]['H2'] = df_base.loc[index]['H2'] * df.loc[index][2017]
-    for index in df.index:
-        df_mod_2018.loc[index]['H1'] = df_base.loc[index]['H1'] * df.loc[index][2018]
-        df_mod_2018.loc[index]['H2'] = df_base.loc[index]['H2'] * df.loc[index][2018]
-    for index in df.index:
-        df_mod_2019.loc[index]['H1'] = df_base.loc[index]['H1'] * df.loc[index][2019]
-        df_mod_2019.loc[index]['H2'] = df_base.loc[index]['H2'] * df.loc[index][2019]
-    for index in df.index:
-        df_mod_2020.loc[index]['H1'] = df_2020.loc[index]['H1'] * df.loc[index][2020]
-        df_mod_2020.loc[index]['H2'] = df_2020.loc[index]['H2'] * df.loc[index][2020]
-    for index in df.index:
-        df_mod_2021.loc[index]['H1'] = df_base.loc[index]['H1'] * df.loc[index][2021]
-        df_mod_2021.loc[index]['H2'] = df_base.loc[index]['H2'] * df.loc[index][2021]
-    for index in df.index:
-        df_mod_2022.loc[index]['H1'] = df_base.loc[index]['H1'] * df.loc[index][2022]
-        df_mod_2022.loc[index]['H2'] = df_base.loc[index]['H2'] * df.loc[index][2022]
-    for index in df.index:
-        df_mod_2023.loc[index]['H1'] = df_base.loc[index]['H1'] * df.loc[index][2023]
-        df_mod_2023.loc[index]['H2'] = df_base.loc[index]['H2'] * df.loc[index][2023]
-    for index in df.index:
-        df_mod_2024.loc[index]['H1'] = df_base.loc[index]['H1'] * df.loc[index][2024]
-        df_mod_2024.loc[index]['H2'] = df_base.loc[index]['H2'] * df.loc[index][2024]
-    for index in df.index:
-        df_mod_2025.loc[index]['H1'] = df_base.loc[index]['H1'] * df.loc[index][2025]
-        df_mod_2025.loc[index]['H2'] = df_base.loc[index]['H2'] * df.loc[index][2025]
-    for index in df.index:
-        df_mod_2026.loc[index]['H1'] = df_base.loc[index]['H1'] * df.loc[index][2026]
-        df_mod_2026.loc[index]['H2'] = df_base.loc[index]['H2'] * df.loc[index][2026]
-    # Fiscal year conversions
-    df_mod_final = pd.DataFrame()
-    df_mod_final['2012'] = df_mod_2011['H2'] + df_mod_2012['H1']
-    df_mod_final['2013'] = df_mod_2012['H2'] + df_mod_2013['H1']
-    df_mod_final['2014'] = df_mod_2013['H2'] + df_mod_2014['H1']
-    df_mod_final['2015'] = df_mod_2014['H2'] + df_mod_2015['H1']
-    df_mod_final['2016'] = df_mod_2015['H2'] + df_mod_2016['H1']
-    df_mod_final['2017'] = df_mod_2016['H2'] + df_mod_2017['H1']
-    df_mod_final['2018'] = df_mod_2017['H2'] + df_mod_2018['H1']
-    df_mod_final['2019'] = df_mod_2018['H2'] + df_mod_2019['H1']
-    df_mod_final['2020'] = df_mod_2019['H2'] + df_mod_2020['H1']
-    df_mod_final['2021'] = df_mod_2020['H2'] + df_mod_2021['H1']
-    df_mod_final['2022'] = df_mod_2021['H2'] + df_mod_2022['H1']
-    df_mod_final['2023'] = df_mod_2022['H2'] + df_mod_2023['H1']
-    df_mod_final['2024'] = df_mod_2023['H2'] + df_mod_2024['H1']
-    df_mod_final['2025'] = df_mod_2024['H2'] + df_mod_2025['H1']
-    df_mod_final['2026'] = df_mod_2025['H2'] + df_mod_2026['H1']
-
-    output_path = f'out\Fiscal_year_new.csv'
+    df_base, df_2020 = get_proportions(year) # TODO check naming convention with retrieved file
+
+    # Fiscal year conversions of every year in the CAGR data
+    df_mod_final = fiscal_year_engine(df, df_base, df_2020)
+
+    output_path = OUTPUT_DIRECTORY / 'Fiscal_year_new.csv'
     df_mod_final.to_csv(output_path)
     return df_mod_final
 
-def fiscal_year_conversion(year):
+def fiscal_year_conversion(year, start_month=7):
     """ Function to apply proportions to sales volume and convert to Fiscal year
 
         param year: year of analysis
+        param start_month: first month of the fiscal year, July by default
         : return: Fiscal year conversions
     """
-    df_base, df_2020 = H1_H2_base(year)
-    # calculate splits
+    df_base, df_2020 = get_proportions(year, start_month=start_month)
     df_forecasts = get_forecasts_volume()
-    length, _ = df_forecasts.shape
-    df_mod_2019 = pd.DataFrame(data={'H1': np.zeros(length),
-                                'H2': np.zeros(length)}, index=df_forecasts.index)
-    df_mod_2020 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df_forecasts.index)
-    df_mod_2021 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df_forecasts.index)
-    df_mod_2022 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df_forecasts.index)
-    df_mod_2023 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df_forecasts.index)
-    df_mod_2024 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df_forecasts.index)
-    df_mod_2025 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df_forecasts.index)
-    df_mod_2026 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length)}, index=df_forecasts.index)
-
-    for index in df_forecasts.index:
-        df_mod_2019.loc[index]['H1'] = df_base.loc[index]['H1'] * df_forecasts.loc[index][2019]
-        df_mod_2019.loc[index]['H2'] = df_base.loc[index]['H2'] * df_forecasts.loc[index][2019]
-    for index in df_forecasts.index:
-        df_mod_2020.loc[index]['H1'] = df_2020.loc[index]['H1'] * df_forecasts.loc[index][2020]
-        df_mod_2020.loc[index]['H2'] = df_2020.loc[index]['H2'] * df_forecasts.loc[index][2020]
-    for index in df_forecasts.index:
-        df_mod_2021.loc[index]['H1'] = df_base.loc[index]['H1'] * df_forecasts.loc[index][2021]
-        df_mod_2021.loc[index]['H2'] = df_base.loc[index]['H2'] * df_forecasts.loc[index][2021]
-    for index in df_forecasts.index:
-        df_mod_2022.loc[index]['H1'] = df_base.loc[index]['H1'] * df_forecasts.loc[index][2022]
-        df_mod_2022.loc[index]['H2'] = df_base.loc[index]['H2'] * df_forecasts.loc[index][2022]
-    for index in df_forecasts.index:
-        df_mod_2023.loc[index]['H1'] = df_base.loc[index]['H1'] * df_forecasts.loc[index][2023]
-        df_mod_2023.loc[index]['H2'] = df_base.loc[index]['H2'] * df_forecasts.loc[index][2023]
-    for index in df_forecasts.index:
-        df_mod_2024.loc[index]['H1'] = df_base.loc[index]['H1'] * df_forecasts.loc[index][2024]
-        df_mod_2024.loc[index]['H2'] = df_base.loc[index]['H2'] * df_forecasts.loc[index][2024]
-    for index in df_forecasts.index:
-        df_mod_2025.loc[index]['H1'] = df_base.loc[index]['H1'] * df_forecasts.loc[index][2025]
-        df_mod_2025.loc[index]['H2'] = df_base.loc[index]['H2'] * df_forecasts.loc[index][2025]
-    for index in df_forecasts.index:
-        df_mod_2026.loc[index]['H1'] = df_base.loc[index]['H1'] * df_forecasts.loc[index][2026]
-        df_mod_2026.loc[index]['H2'] = df_base.loc[index]['H2'] * df_forecasts.loc[index][2026]
-    # output_path = f'out\base.csv'
-    # df_1.to_csv(output_path)
+    # Fiscal year conversions of every year in the forecasts
+    df_mod_final = fiscal_year_engine(df_forecasts, df_base, df_2020)
 
-    df_mod_final = pd.DataFrame()
-    df_mod_final['2020'] = df_mod_2019['H2'] + df_mod_2020['H1']
-    df_mod_final['2021'] = df_mod_2020['H2'] + df_mod_2021['H1']
-    df_mod_final['2022'] = df_mod_2021['H2'] + df_mod_2022['H1']
-    df_mod_final['2023'] = df_mod_2022['H2'] + df_mod_2023['H1']
-    df_mod_final['2024'] = df_mod_2023['H2'] + df_mod_2024['H1']
-    df_mod_final['2025'] = df_mod_2024['H2'] + df_mod_2025['H1']
-    df_mod_final['2026'] = df_mod_2025['H2'] + df_mod_2026['H1']
-
-    output_path = f'out\Forecast_Fiscal_Year.csv'
+    output_path = OUTPUT_DIRECTORY / 'Forecast_Fiscal_Year.csv'
     df_mod_final.to_csv(output_path)
 
     return df_mod_final
 
-def get_forecasts_volume():
+def get_forecasts_volume(sources=None):
     """ Function to get and preprocess forecasts
 
-        param year: year of analysis
+        param sources: optional SourceRegistry of the current run
         : return: processed forecasts
     """
-    base_dir = DATA_DIRECTORY / 'Forecasts' / 'sales_volume'
-    path = get_file_in_directory(base_dir)
-
-    df = pd.read_excel(path, sheet_name='Summary')
+    df = read_source('forecasts_volume', None, sources)
     df = df.set_index(['CATEGORY'])
     # Drop other wines
     df = df.drop('Other Wines')
@@ -580,112 +597,44 @@ def get_forecasts_value():
             param year: year of analysis
             : return: processed forecasts
         """
-    base_dir = DATA_DIRECTORY / 'Forecasts' / 'sales_value'
-    path = get_file_in_directory(base_dir)
-    df = pd.read_excel(path, sheet_name='Prices', skiprows=2)
-    df = df.iloc[:,:11]
+    # the first 11 columns are read, see the schema of forecasts_value
+    df = read_source('forecasts_value')
 
     return df
 
-def fiscal_year_conversion_value(year):
+def fiscal_year_conversion_value(year, start_month=7):
     """ Function to apply proportions to sales value and convert to Fiscal year
 
         param year: year of analysis
+        param start_month: first month of the fiscal year, July by default
         : return: Fiscal year conversions
     """
-    df_base, df_2020 = H1_H2_base(year)
+    df_base, df_2020 = get_proportions(year, start_month=start_month)
 
     df_forecast = get_forecasts_value()
     # df_forecast = df_forecast.replace(['Fortified', 'Gin', 'Aperitif', 'Sparkling', 'Fabs'],
     #                               ['Fortified Wine', 'Gin and Genever', 'Aperitifs', 'Sparkling Wine', 'FABs'])
 
-    length, _ = df_forecast.shape
-    df_mod_2019 = pd.DataFrame(data={'H1': np.zeros(length),
-                                'H2': np.zeros(length),
-                                })
-    df_mod_2020 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length),
-                                     })
-    df_mod_2021 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length),
-                                     })
-    df_mod_2022 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length),
-                                     })
-    df_mod_2023 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length),
-                                     })
-    df_mod_2024 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length),
-                                     })
-    df_mod_2025 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length),
-                                     })
-    df_mod_2026 = pd.DataFrame(data={'H1': np.zeros(length),
-                                     'H2': np.zeros(length),
-                                     })
-
-    for index in df_forecast.index:
-        df_mod_2019.iloc[index]['H1'] = df_base.loc[df_forecast.iloc[index]['SELECT']]['H1'] * df_forecast.iloc[index][2019]
-        df_mod_2019.iloc[index]['H2'] = df_base.loc[df_forecast.iloc[index]['SELECT']]['H2'] * df_forecast.iloc[index][2019]
-
-    for index in df_forecast.index:
-        df_mod_2020.iloc[index]['H1'] = df_base.loc[df_forecast.iloc[index]['SELECT']]['H1'] * df_forecast.iloc[index][2020]
-        df_mod_2020.iloc[index]['H2'] = df_base.loc[df_forecast.iloc[index]['SELECT']]['H2'] * df_forecast.iloc[index][2020]
-
-    for index in df_forecast.index:
-        df_mod_2021.iloc[index]['H1'] = df_base.loc[df_forecast.iloc[index]['SELECT']]['H1'] * df_forecast.iloc[index][2021]
-        df_mod_2021.iloc[index]['H2'] = df_base.loc[df_forecast.iloc[index]['SELECT']]['H2'] * df_forecast.iloc[index][2021]
-
-    for index in df_forecast.index:
-        df_mod_2022.iloc[index]['H1'] = df_base.loc[df_forecast.iloc[index]['SELECT']]['H1'] * df_forecast.iloc[index][2022]
-        df_mod_2022.iloc[index]['H2'] = df_base.loc[df_forecast.iloc[index]['SELECT']]['H2'] * df_forecast.iloc[index][2022]
-
-    for index in df_forecast.index:
-        df_mod_2023.iloc[index]['H1'] = df_base.loc[df_forecast.iloc[index]['SELECT']]['H1'] * df_forecast.iloc[index][2023]
-        df_mod_2023.iloc[index]['H2'] = df_base.loc[df_forecast.iloc[index]['SELECT']]['H2'] * df_forecast.iloc[index][2023]
-
-    for index in df_forecast.index:
-        df_mod_2024.iloc[index]['H1'] = df_base.loc[df_forecast.iloc[index]['SELECT']]['H1'] * df_forecast.iloc[index][2024]
-        df_mod_2024.iloc[index]['H2'] = df_base.loc[df_forecast.iloc[index]['SELECT']]['H2'] * df_forecast.iloc[index][2024]
-
-    for index in df_forecast.index:
-        df_mod_2025.iloc[index]['H1'] = df_base.loc[df_forecast.iloc[index]['SELECT']]['H1'] * df_forecast.iloc[index][2025]
-        df_mod_2025.iloc[index]['H2'] = df_base.loc[df_forecast.iloc[index]['SELECT']]['H2'] * df_forecast.iloc[index][2025]
-
-    for index in df_forecast.index:
-        df_mod_2026.iloc[index]['H1'] = df_base.loc[df_forecast.iloc[index]['SELECT']]['H1'] * df_forecast.iloc[index][2026]
-        df_mod_2026.iloc[index]['H2'] = df_base.loc[df_forecast.iloc[index]['SELECT']]['H2'] * df_forecast.iloc[index][2026]
+    missing = sorted(set(df_forecast['SELECT']) - set(df_base.index))
+    if missing:
+        raise KeyError(f'No proportions for categories: {missing}')
+
+    # join the proportions onto the forecasts by category, all price bands and indices of a category share them.
+    # The base proportions are used for every year, 2020 included
+    df_proportions = df_forecast[['SELECT']].join(df_base[['H1', 'H2']], on='SELECT')
+    values, years = get_year_values(df_forecast)
+    proportions = np.repeat(df_proportions[['H1', 'H2']].to_numpy(dtype=float)[:, np.newaxis, :], len(years), axis=1)
+
+    # Fiscal year conversions of every year at once
+    df_fiscal = pd.DataFrame(data=fiscal_years(values, proportions), index=df_forecast.index,
+                             columns=[str(y) for y in years[1:]])
 
     df_mod_final = pd.DataFrame()
     df_mod_final['Price_band'] = df_forecast['PRICE BAND CORRECT']
     df_mod_final['Index'] = df_forecast['INDEX']
     df_mod_final['category'] = df_forecast['SELECT']
-
-    df_mod_final['2020'] = df_mod_2019['H2'] + df_mod_2020['H1']
-    df_mod_final['2021'] = df_mod_2020['H2'] + df_mod_2021['H1']
-    df_mod_final['2022'] = df_mod_2021['H2'] + df_mod_2022['H1']
-    df_mod_final['2023'] = df_mod_2022['H2'] + df_mod_2023['H1']
-    df_mod_final['2024'] = df_mod_2023['H2'] + df_mod_2024['H1']
-    df_mod_final['2025'] = df_mod_2024['H2'] + df_mod_2025['H1']
-    df_mod_final['2026'] = df_mod_2025['H2'] + df_mod_2026['H1']
+    df_mod_final = pd.concat([df_mod_final, df_fiscal], axis=1)
 
     df_mod_final = df_mod_final.set_index(['category'])
 
     return df_mod_final
-
-#%%
-df = fiscal_year_conversion_value('all_years')
-
-#%%
-output_path = f'out\Fiscal_year_value_new.csv'
-df.to_csv(output_path)
-
-
-
-
-
-
-
-
-
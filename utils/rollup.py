@@ -0,0 +1,85 @@
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def _compile(frozen_spec, leaves):
+    """ Method to compile a frozen hierarchy spec, see compile_hierarchy """
+
+    groups = [group for group, _ in frozen_spec]
+    # rows of the value array: the leaves of the source first, followed by the derived groups in spec order
+    position = {leaf: i for i, leaf in enumerate(leaves)}
+
+    levels, level_of = [], {}
+    for i, (group, members) in enumerate(frozen_spec):
+        children, level = [], 0
+        for member in members:
+            if member in level_of:
+                # member is a group derived earlier in the spec, its partial sum is reused
+                children.append(len(leaves) + level_of[member][1])
+                level = max(level, level_of[member][0] + 1)
+            elif member in position:
+                children.append(position[member])
+            else:
+                raise KeyError(member)
+        if len(levels) <= level:
+            levels.append([])
+        levels[level].append((i, children))
+        level_of[group] = (level, i)
+
+    # one sparse 0/1 matrix per level, every level only reads rows filled by the levels before it
+    compiled = []
+    size = len(leaves) + len(groups)
+    for level in levels:
+        rows = np.array([len(leaves) + i for i, _ in level])
+        # the members are kept in spec order within a row, so the sums are added up in the order of the spec
+        indices = [child for _, children in level for child in children]
+        indptr = np.cumsum([0] + [len(children) for _, children in level])
+        matrix = sparse.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(len(level), size))
+        compiled.append((rows, matrix))
+
+    return tuple(groups), tuple(compiled)
+
+
+def compile_hierarchy(spec, leaves):
+    """ Method to compile a hierarchy spec into sparse 0/1 aggregation matrices. Members of a group are rows
+    of the source or groups defined earlier in the spec, which are then summed from the earlier group
+    instead of from its leaves again. Compiled specs are kept, so a spec is only compiled once per source layout
+
+    param spec: list of (derived group, [members]) tuples, e.g. [('Fortified Wine 1', ['HP Fortified', 'SP Fortified'])]
+    param leaves: index of the source dataframe, in order
+    : return: tuple of (derived groups, tuple of (rows filled, sparse matrix) per level)
+    """
+
+    frozen_spec = tuple((group, tuple(members)) for group, members in spec)
+    return _compile(frozen_spec, tuple(leaves))
+
+
+def rollup(df, spec, columns=None, keep_leaves=False):
+    """ Method to compute all derived groups of a hierarchy spec across all value columns at once.
+    The result is written into a single preallocated frame instead of being concatenated row by row
+
+    param df: source dataframe with the leaves as index
+    param spec: list of (derived group, [members]) tuples, see compile_hierarchy
+    param columns: value columns to aggregate, defaults to all columns of df
+    param keep_leaves: keep the rows of df in front of the derived groups
+    : return: pandas dataframe with the derived groups as index (after the leaves when keep_leaves is set)
+    """
+
+    columns = list(df.columns) if columns is None else columns
+    groups, levels = compile_hierarchy(spec, df.index)
+
+    leaves = df[columns].to_numpy()
+    values = np.zeros((len(df.index) + len(groups), len(columns)), dtype=np.result_type(leaves.dtype, np.float64))
+    values[:len(df.index)] = leaves
+    for rows, matrix in levels:
+        values[rows] = matrix @ values
+
+    if keep_leaves:
+        index = list(df.index) + list(groups)
+    else:
+        values, index = values[len(df.index):], list(groups)
+    return pd.DataFrame(data=values, index=index, columns=columns)
@@ -0,0 +1,186 @@
+
+import re
+
+YEAR_PATTERN = r'^\d{4}$'
+
+
+class Columns:
+    """ Column selection of a sheet, used as usecols of pd.read_excel. A column is read when its name is listed
+    or matches the pattern (e.g. the year columns). The selection has a stable repr and hash, so that it can be part
+    of the disk cache key and the registry key of a sheet
+    """
+
+    def __init__(self, names, pattern=None):
+        self.names = tuple(names)
+        self.pattern = pattern
+
+    def __call__(self, name):
+        return name in self.names or (self.pattern is not None and re.match(self.pattern, str(name)) is not None)
+
+    def __repr__(self):
+        return f'Columns({list(self.names)!r}, {self.pattern!r})'
+
+    def __eq__(self, other):
+        return isinstance(other, Columns) and repr(self) == repr(other)
+
+    def __hash__(self):
+        return hash(repr(self))
+
+
+# layout of the workbook of every source. folder is relative to the data directory and may contain {year},
+# skiprows / nrows / usecols are passed on to pd.read_excel, names renames the columns after reading,
+# dtypes are applied after reading and required lists the columns that have to be in the sheet.
+# year_columns is the pattern of the year columns, at least one of them has to be in the sheet.
+# Volumes are kept as float64, the totals of the larger sources do not fit the precision of float32
+SOURCE_SCHEMAS = {
+    'income_statement': {
+        'folder': 'income_statement/{year}',
+        'sheet_name': 'Sheet1',
+        'required': ['Stats Group', 'Brand'],
+    },
+    'IWSR': {
+        'folder': 'IWSR/{year}',
+        'sheet_name': 'IWSR',
+        'skiprows': 7,
+        'usecols': Columns(['Category 2'], YEAR_PATTERN),
+        'required': ['Category 2'],
+        'year_columns': YEAR_PATTERN,
+    },
+    'SAWIS': {
+        'folder': 'SAWIS/{year}',
+        'sheet_name': 'SAWIS',
+        'skiprows': 2,
+        'nrows': 17,
+        'required': ['Still Wine', 'Sparkling Wine', 'Fortified Wine'],
+    },
+    'SAWIS_monthly': {
+        'folder': 'SAWIS/{year}',
+        'sheet_name': 'Local',
+        'skiprows': 2,
+        'nrows': 14,
+        'required': ['Still Wine', 'Sparkling Wine', 'Fortified Wine'],
+    },
+    'SALBA': {
+        'folder': 'SALBA/{year}',
+        'sheet_name': 'SALBA',
+        'required': ['Year', 'Category', 'Quarter'],
+    },
+    'SALBA_summary': {
+        'folder': 'SALBA/{year}',
+        'sheet_name': 'SUMMARY',
+        # label column, the H1/H2 shares of the three base years and of the current year
+        'usecols': [1, 18, 19, 20, 21],
+    },
+    'SARS': {
+        'folder': 'SARS/{year}',
+        'sheet_name': 'Sheet1',
+        'skiprows': 1,
+        'nrows': 20,
+        'required': ['Unnamed: 14'],
+    },
+    'GLOBAL_data': {
+        'folder': 'GLOBAL_data/{year}',
+        'sheet_name': 'GLOBALdata',
+        'skiprows': 18,
+        'usecols': Columns(['Unnamed: 0', 'Unnamed: 1', 'Unnamed: 2', 'Unnamed: 3'], YEAR_PATTERN),
+        'names': {'Unnamed: 0': 'Country', 'Unnamed: 1': 'Category', 'Unnamed: 2': 'Brand Owner',
+                  'Unnamed: 3': 'Beer and Cider Type'},
+        'required': ['Country', 'Category', 'Brand Owner', 'Beer and Cider Type'],
+        'year_columns': YEAR_PATTERN,
+    },
+    'data_orbis': {
+        'folder': 'data_orbis/{year}',
+        'sheet_name': 'Sheet1',
+        'usecols': Columns(['COUNTRYNAME', 'PRODUCTCATEGORY', 'PRODUCTSUBCATEGORY', 'SALESVOLUME']),
+        'dtypes': {'COUNTRYNAME': 'category', 'PRODUCTCATEGORY': 'category', 'PRODUCTSUBCATEGORY': 'category',
+                   'SALESVOLUME': 'float64'},
+        'required': ['COUNTRYNAME', 'PRODUCTCATEGORY', 'PRODUCTSUBCATEGORY', 'SALESVOLUME'],
+    },
+    'data_orbis_monthly': {
+        'folder': 'data_orbis_low_level/Data_Orbis_Charl',
+        'sheet_name': 'Sheet1',
+        'usecols': Columns(['COUNTRYNAME', 'PRODUCTCATEGORY', 'PRODUCTSUBCATEGORY', 'Realigned YYYYMM', 'SALESVOLUME']),
+        'dtypes': {'COUNTRYNAME': 'category', 'SALESVOLUME': 'float64'},
+        'required': ['COUNTRYNAME', 'PRODUCTSUBCATEGORY', 'Realigned YYYYMM', 'SALESVOLUME'],
+    },
+    'price_bands_rtds': {
+        'folder': 'data_orbis_low_level/Data_Orbis_Socilla',
+        'sheet_name': 'CHARL RTD MAT DEC',
+        'skiprows': 2,
+        'required': ['INDEX', 'CY 12 Mths', 'PY 12 Mths', 'CY 12 Mths.1', 'PY 12 Mths.1'],
+    },
+    'price_bands_wine': {
+        'folder': 'data_orbis_low_level/Data_Orbis_Socilla',
+        'sheet_name': 'Charl WINE MAT DEC 2020',
+        'skiprows': 2,
+        'required': ['INDEX', 'CY 12 Mths', 'PY 12 Mths', 'CY 12 Mths.1', 'PY 12 Mths.1'],
+    },
+    'price_bands_spirits': {
+        'folder': 'data_orbis_low_level/Data_Orbis_Socilla',
+        'sheet_name': 'CHARL SPIRIT MAT DEC',
+        'skiprows': 3,
+        'required': ['INDEX', 'CY 12 Mths', 'PY 12 Mths', 'CY 12 Mths.1', 'PY 12 Mths.1'],
+    },
+    'CAGR': {
+        'folder': 'CAGR',
+        'sheet_name': 'Summary2',
+        'skiprows': 2,
+        'required': ['CATEGORY', 'INSTITUTION'],
+        'year_columns': YEAR_PATTERN,
+    },
+    'forecasts_volume': {
+        'folder': 'Forecasts/sales_volume',
+        'sheet_name': 'Summary',
+        'required': ['CATEGORY', 'INST'],
+        'year_columns': YEAR_PATTERN,
+    },
+    'forecasts_value': {
+        'folder': 'Forecasts/sales_value',
+        'sheet_name': 'Prices',
+        'skiprows': 2,
+        'usecols': list(range(11)),
+    },
+    'IWSR_estimates': {
+        'folder': 'Estimates/{year}/Nikki_estimates',
+        'sheet_name': 'Porportions',
+        'required': ['IWSR_Category2.1', 'Alcoholic', 'No Alcohol', 'Low Alcohol'],
+    },
+}
+
+READ_ARGUMENTS = ['skiprows', 'nrows', 'usecols']
+
+
+def get_read_kwargs(schema):
+    """ Method to get the keyword arguments for pd.read_excel from a schema
+
+    param schema: schema of a source, see SOURCE_SCHEMAS
+    : return: dictionary with the skiprows, nrows and usecols of the schema
+    """
+
+    return {argument: schema[argument] for argument in READ_ARGUMENTS if argument in schema}
+
+
+def apply_schema(df, schema, source=''):
+    """ Method to validate the layout of a parsed sheet and apply the column names and dtypes of its schema.
+    A sheet whose layout changed fails here, naming the source and the missing columns
+
+    param df: parsed sheet
+    param schema: schema of the source, see SOURCE_SCHEMAS
+    param source: name of the source, used in the error message
+    : return: dataframe with the renamed and typed columns
+    """
+
+    if 'names' in schema:
+        df = df.rename(columns=schema['names'])
+
+    missing = [column for column in schema.get('required', []) if column not in df.columns]
+    if missing:
+        raise ValueError(f'Layout of {source} changed, missing columns: {missing}')
+
+    if 'year_columns' in schema and not any(re.match(schema['year_columns'], str(c)) for c in df.columns):
+        raise ValueError(f'Layout of {source} changed, no year columns matching {schema["year_columns"]}')
+
+    dtypes = {column: dtype for column, dtype in schema.get('dtypes', {}).items() if column in df.columns}
+    if dtypes:
+        df = df.astype(dtypes)
+    return df
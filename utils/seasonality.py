@@ -0,0 +1,286 @@
+
+import re
+import numpy as np
+import pandas as pd
+from utils.proportions import EPOS_SUBCATEGORIES, EXCEPTIONAL_YEAR, get_store_key, load_or_build
+from utils.utils import *
+
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+# sources of the seasonality cube, with whether the source keeps a folder per year. These are the sheets the H1 and
+# H2 proportions of H1_H2_base are built from, with the quarterly SALBA volumes instead of the SALBA SUMMARY sheet
+SEASONALITY_SOURCES = {'SARS': True, 'SAWIS_monthly': True, 'SALBA': True, 'data_orbis_monthly': False}
+
+# number of months the data of every source of the cube resolves. SARS only has H1 and H2 shares and SALBA quarterly
+# volumes, their months are spread evenly over the half or quarter, see spread_periods
+SOURCE_PERIOD_MONTHS = {'SARS': 6, 'SAWIS': 1, 'SALBA': 3, 'EPOS': 1}
+
+# year columns of the SAWIS blocks, e.g. 2019 for still wine and '2019.1' for sparkling wine
+SAWIS_YEAR_PATTERN = r'^(\d{4})(\.\d+)?$'
+
+SALBA_QUARTERS = ['1st Quarter', '2nd Quarter', '3rd Quarter', '4th Quarter']
+
+
+def spread_periods(values, period_months):
+    """ Function to spread the volumes (or shares) of the periods of a source evenly over their months
+
+    param values: array of shape (rows, periods) with the volume of every period, e.g. the H1 and H2 shares
+    param period_months: number of months of every period, e.g. 6 for halves or 3 for quarters
+    : return: numpy array of shape (rows, 12) with the volume of every month
+    """
+
+    return np.repeat(np.asarray(values, dtype=float) / period_months, period_months, axis=1)
+
+
+def get_SAWIS_months(year, sources=None):
+    """ Function to read the monthly SAWIS volumes of every wine category and year in the file
+
+    param year: year of analysis, i.e. the folder of the SAWIS file
+    param sources: optional SourceRegistry of the current run
+    : return: dataframe with (category, year) as index and the months 1 - 12 as columns
+    """
+
+    df = read_source('SAWIS_monthly', year, sources)
+
+    # every block starts with the category column (holding the month names) followed by its year columns,
+    # year columns in front of the first category column do not belong to a block
+    blocks = []
+    category, month, rows = None, None, None
+    for column in df.columns:
+        match = re.match(SAWIS_YEAR_PATTERN, str(column))
+        if match is None:
+            category = column
+            month = df[column].map({name: i + 1 for i, name in enumerate(MONTHS)})
+            rows = month.notna()
+        elif category is not None:
+            blocks.append(pd.DataFrame({'category': category, 'year': int(match.group(1)),
+                                        'month': month[rows].astype(int),
+                                        'volume': pd.to_numeric(df.loc[rows, column])}))
+
+    df = pd.concat(blocks, ignore_index=True)
+    return df.set_index(['category', 'year', 'month'])['volume'].unstack('month')
+
+
+def get_SALBA_months(year, sources=None):
+    """ Function to read the quarterly SALBA volumes of every SALBA group (see salba_rollup) and year in the file,
+    the volumes transform_SALBA_df rolls up. Every quarter is spread evenly over its three months
+
+    param year: year of analysis, i.e. the folder of the SALBA file
+    param sources: optional SourceRegistry of the current run
+    : return: dataframe with (category, year) as index and the months 1 - 12 as columns
+    """
+
+    df = read_source('SALBA', year, sources)
+    df = df.rename(columns={df.columns[-1]: 'Sales'})
+
+    # one column per (year, quarter), so the groups of all years are rolled up at once
+    df = df.groupby(['Category', 'Year', 'Quarter'])['Sales'].sum().unstack(['Year', 'Quarter']).fillna(0)
+    groups = rollup(df, salba_rollup)
+    groups.columns = df.columns
+    df = groups.stack('Year').reindex(columns=SALBA_QUARTERS, fill_value=0)
+    df.index = df.index.set_names(['category', 'year'])
+    return pd.DataFrame(data=spread_periods(df, 3), index=df.index, columns=range(1, 13))
+
+
+def get_SARS_months(year, sources=None):
+    """ Function to read the H1 and H2 shares of beer of every year in the SARS file. The file has no monthly or
+    quarterly data, so every half is spread evenly over its six months and the cube only resolves the SARS halves,
+    see SOURCE_PERIOD_MONTHS
+
+    param year: year of analysis, i.e. the folder of the SARS file
+    param sources: optional SourceRegistry of the current run
+    : return: dataframe with (category, year) as index and the months 1 - 12 as columns
+    """
+
+    # year column followed by the H1 and H2 shares, see H1_H2_SARS
+    df = read_source('SARS', year, sources)
+    df = df.iloc[:20, 14:].dropna(subset=['Unnamed: 14'])
+    years = df['Unnamed: 14'].round().astype(int)
+
+    index = pd.MultiIndex.from_arrays([['Beer'] * len(df), years], names=['category', 'year'])
+    return pd.DataFrame(data=spread_periods(df[['H1', 'H2']], 6), index=index, columns=range(1, 13))
+
+
+def get_EPOS_months(df=None, sources=None):
+    """ Function to read the monthly EPOS volumes of South Africa of every category and year in the file
+
+    param df: optional monthly EPOS data, read from the Data_Orbis_Charl file by default
+    param sources: optional SourceRegistry of the current run
+    : return: dataframe with (category, year) as index and the months 1 - 12 as columns, NaN for missing months
+    """
+
+    if df is None:
+        df = read_source('data_orbis_monthly', None, sources)
+    df = df[df['COUNTRYNAME'] == 'South Africa']
+
+    # parse the period (YYYY-MM) of every row at once, cognac is counted as brandy
+    period = df['Realigned YYYYMM'].astype(str)
+    year = period.str[:4].astype(int)
+    month = period.str[5:7].astype(int)
+    category = df['PRODUCTSUBCATEGORY'].replace(['Cognac'], 'Brandy').map(EPOS_SUBCATEGORIES)
+
+    df = df['SALESVOLUME'].groupby([category.values, year.values, month.values]).sum()
+    return df.unstack(2).rename_axis(['category', 'year'])
+
+
+def build_seasonality_cube(year, sources=None):
+    """ Function to build the seasonality cube of the monthly SAWIS volumes, the quarterly SALBA volumes, the
+    half-yearly SARS shares and the monthly EPOS volumes
+
+    param year: year of analysis, i.e. the folder of the SARS, SAWIS and SALBA files
+    param sources: optional SourceRegistry of the current run
+    : return: dataframe with (source, category, year) as index and the months 1 - 12 as columns
+    """
+
+    cube = pd.concat({'SARS': get_SARS_months(year, sources), 'SAWIS': get_SAWIS_months(year, sources),
+                      'SALBA': get_SALBA_months(year, sources), 'EPOS': get_EPOS_months(sources=sources)})
+    cube = cube.reindex(columns=range(1, 13)).astype(float)
+    cube.index = cube.index.set_names(['source', 'category', 'year'])
+    cube.columns.name = 'month'
+    return cube
+
+
+def get_seasonality_cube(year='all_years', cache_dir=None, sources=None):
+    """ Function to get the seasonality cube from the store. The cube is built once and persisted in the cache
+    directory until one of the source workbooks or the code changes
+
+    param year: year of analysis, i.e. the folder of the SARS, SAWIS and SALBA files
+    param cache_dir: directory of the store, defaults to CACHE_DIRECTORY
+    param sources: optional SourceRegistry of the current run
+    : return: dataframe with (source, category, year) as index and the months 1 - 12 as columns
+    """
+
+    key = get_store_key(year, SEASONALITY_SOURCES, ['utils.seasonality'])
+    return load_or_build('seasonality', key, lambda: build_seasonality_cube(year, sources), cache_dir).copy()
+
+
+def get_periods(start_month=1, period_months=12):
+    """ Function to get the periods a calendar year is cut into for a fiscal calendar
+
+    param start_month: first month of the fiscal year, e.g. 7 for a July - June year or 4 for a March year-end
+    param period_months: length of the periods in months, one of 1, 2, 3, 4, 6 or 12
+    : return: list of (first month, last month) tuples covering January - December
+    """
+
+    if period_months not in [1, 2, 3, 4, 6, 12]:
+        raise ValueError(f'Periods of {period_months} months do not divide a year')
+    if start_month not in range(1, 13):
+        raise ValueError(f'Invalid start month {start_month}')
+
+    starts = sorted({0} | {(start_month - 1 + k * period_months) % 12 for k in range(12 // period_months)})
+    return [(first + 1, last) for first, last in zip(starts, starts[1:] + [12])]
+
+
+def get_unresolved_sources(sources, start_month=1, period_months=12):
+    """ Function to find the sources whose data does not resolve the periods of a fiscal calendar, i.e. a period
+    starts or ends within one of their halves or quarters. Their proportions would only reflect the even spread of
+    spread_periods, not the data
+
+    param sources: names of sources of the seasonality cube, e.g. ['SARS', 'SALBA']
+    param start_month: first month of the fiscal year, e.g. 7 for a July - June year
+    param period_months: length of the periods in months, e.g. 3 for quarters
+    : return: list of the sources that do not resolve the periods
+    """
+
+    boundaries = [first - 1 for first, _ in get_periods(start_month, period_months)]
+    return [source for source in sources
+            if any(boundary % SOURCE_PERIOD_MONTHS[source] for boundary in boundaries)]
+
+
+def get_period_proportions(cube, start_month=1, period_months=12):
+    """ Function to get the proportion of the calendar year volume that falls into each period of a fiscal calendar.
+    A period that runs over the turn of the year is split into its part in each calendar year. The proportions of a
+    source whose data does not resolve the periods (e.g. SARS halves for quarters) are left NaN
+
+    param cube: seasonality cube, see get_seasonality_cube
+    param start_month: first month of the fiscal year, e.g. 7 for a July - June year
+    param period_months: length of the periods in months, e.g. 3 for quarters
+    : return: dataframe with (source, category, year) as index and the periods (e.g. 'Jan-Mar') as columns
+    """
+
+    periods = get_periods(start_month, period_months)
+
+    # cumulative volume up to every month, so that every period is a difference of two columns. Missing months
+    # count as 0, like in H1_H2_Epos, instead of making the whole year NaN
+    cumulative = np.zeros((len(cube), 13))
+    cumulative[:, 1:] = np.nancumsum(cube.to_numpy(dtype=float), axis=1)
+    first = np.array([first for first, _ in periods])
+    last = np.array([last for _, last in periods])
+    totals = (cumulative[:, last] - cumulative[:, first - 1]) / cumulative[:, [12]]
+
+    if 'source' in cube.index.names:
+        source = cube.index.get_level_values('source')
+        unresolved = get_unresolved_sources(source.unique(), start_month, period_months)
+        totals[source.isin(unresolved)] = np.nan
+
+    labels = [MONTHS[f - 1] if f == l else f'{MONTHS[f - 1]}-{MONTHS[l - 1]}' for f, l in periods]
+    return pd.DataFrame(data=totals, index=cube.index, columns=labels)
+
+
+def get_fiscal_proportions(cube, start_month=7):
+    """ Function to get the H1 and H2 proportions of a fiscal year that starts in any month. H1 is the part of the
+    calendar year before the start month, which falls into the fiscal year ending in that calendar year, and H2 is
+    the part from the start month on. The proportions can be passed on to fiscal_year_engine
+
+    param cube: seasonality cube, see get_seasonality_cube
+    param start_month: first month of the fiscal year, e.g. 7 for a July - June year or 4 for a March year-end
+    : return: dataframe with (source, category, year) as index and H1 and H2 as columns
+    """
+
+    df = get_period_proportions(cube, start_month, 12)
+    if start_month == 1:
+        # the fiscal year is the calendar year
+        return pd.DataFrame(data={'H1': df.iloc[:, 0], 'H2': 0.0}, index=cube.index)
+    return pd.DataFrame(data={'H1': df.iloc[:, 0], 'H2': df.iloc[:, 1]}, index=cube.index)
+
+
+# source, category in the seasonality cube and base years of the categories of the fiscal year conversions, the
+# same sources and base years as the H1 and H2 proportions of H1_H2_base
+FISCAL_CATEGORIES = {
+    'Beer': ('SARS', 'Beer', [2017, 2018, 2019]),
+    'Still Wine': ('SAWIS', 'Still Wine', [2018, 2019]),
+    'Sparkling Wine': ('SAWIS', 'Sparkling Wine', [2018, 2019]),
+    'Fortified Wine': ('SAWIS', 'Fortified Wine', [2018, 2019]),
+    'Brandy': ('SALBA', 'Brandy', [2017, 2018, 2019]),
+    'Gin and Genever': ('SALBA', 'Gin', [2017, 2018, 2019]),
+    'Vodka': ('SALBA', 'Vodka and Cane Spirits', [2017, 2018, 2019]),
+    'Cane': ('SALBA', 'Vodka and Cane Spirits', [2017, 2018, 2019]),
+    'Whisky': ('SALBA', 'Whisky', [2017, 2018, 2019]),
+    'Liqueurs': ('SALBA', 'Liqueurs', [2017, 2018, 2019]),
+    'Aperitifs': ('EPOS', 'Aperitif', [2019]),
+    'Cider': ('EPOS', 'Cider', [2019]),
+    'FABs': ('EPOS', 'Fabs', [2019]),
+    'Rum': ('EPOS', 'Rum', [2019]),
+    'Tequila': ('EPOS', 'Tequila', [2019]),
+}
+
+
+def get_fiscal_year_proportions(start_month=7, year='all_years', cache_dir=None, sources=None):
+    """ Function to get the base and 2020 H1 and H2 proportions of every category for a fiscal year that starts in
+    another month, in the layout of H1_H2_base, so they can be passed on to fiscal_year_engine. The base proportions
+    come from the mean monthly volumes of the base years of the category. The SARS data only has halves, so the
+    fiscal year has to start in January or July
+
+    param start_month: first month of the fiscal year, e.g. 7 for a July - June year or 4 for a March year-end
+    param year: year of analysis, i.e. the folder of the SARS, SAWIS and SALBA files
+    param cache_dir: directory of the store of the seasonality cube, defaults to CACHE_DIRECTORY
+    param sources: optional SourceRegistry of the current run
+    : return: tuple of the base and 2020 proportions with the categories as index and H1 and H2 as columns
+    """
+
+    unresolved = get_unresolved_sources({source for source, _, _ in FISCAL_CATEGORIES.values()}, start_month)
+    if unresolved:
+        raise ValueError(f'A fiscal year starting in {MONTHS[start_month - 1]} cuts the periods of the '
+                         f'{", ".join(sorted(unresolved))} data, which do not have monthly volumes')
+
+    cube = get_seasonality_cube(year, cache_dir, sources).sort_index()
+
+    base, current = [], []
+    for source, category, base_years in FISCAL_CATEGORIES.values():
+        months = cube.loc[(source, category)]
+        base.append(months.reindex(base_years).mean())
+        current.append(months.reindex([EXCEPTIONAL_YEAR]).iloc[0])
+
+    df_base = pd.DataFrame(data=base, index=list(FISCAL_CATEGORIES))
+    df_2020 = pd.DataFrame(data=current, index=list(FISCAL_CATEGORIES))
+    return get_fiscal_proportions(df_base, start_month), get_fiscal_proportions(df_2020, start_month)
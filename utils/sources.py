@@ -0,0 +1,117 @@
+
+import time
+import pandas as pd
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from utils.utils import DATA_DIRECTORY, get_file_in_directory
+from utils.cache import read_excel_cached
+
+
+def _load_sheet(base_dir, sheet_name, read_kwargs):
+    """ Method to read a sheet and measure the load time, runs in the threads or processes of SourceRegistry.prefetch
+
+    param base_dir: directory of the source file
+    param sheet_name: name of the sheet to read
+    param read_kwargs: further keyword arguments for pd.read_excel
+    : return: tuple of (parsed sheet, load time in seconds)
+    """
+
+    start = time.perf_counter()
+    df = read_excel_cached(get_file_in_directory(base_dir), sheet_name=sheet_name, **read_kwargs)
+    return df, time.perf_counter() - start
+
+
+class SourceRegistry:
+    """ Registry of the source sheets read during a single run. Every (source, year, sheet) combination is read
+    from disk once and then shared between all stages of the run. Stages receive a copy of the stored sheet,
+    so that no stage can change the data seen by another stage.
+    """
+
+    def __init__(self):
+        self.frames = {}
+        self.reads = {}
+        self.timings = {}
+        self.pending = {}
+
+    @staticmethod
+    def _source_name(base_dir):
+        """ Method to get the name of a source directory relative to the data directory, e.g. IWSR/2019
+
+        param base_dir: directory of the source file
+        : return: name of the source
+        """
+
+        try:
+            return Path(base_dir).relative_to(DATA_DIRECTORY).as_posix()
+        except ValueError:
+            return Path(base_dir).as_posix()
+
+    def _key(self, base_dir, sheet_name, read_kwargs):
+        """ Method to build the key of a sheet from the source name, sheet name and read arguments """
+
+        # the read arguments are keyed on their repr, since e.g. a list of usecols is not hashable
+        return self._source_name(base_dir), sheet_name, tuple((k, repr(v)) for k, v in sorted(read_kwargs.items()))
+
+    def _store(self, key, df, seconds):
+        """ Method to keep a loaded sheet with its load time """
+
+        self.frames[key] = df
+        self.reads[key] = self.reads.get(key, 0) + 1
+        self.timings[key] = seconds
+
+    def read_sheet(self, base_dir, sheet_name, **read_kwargs):
+        """ Method to get a sheet of the file in base_dir, reading the workbook only the first time it is requested.
+        A sheet that is still being prefetched is waited for
+
+        param base_dir: directory of the source file, e.g. DATA_DIRECTORY / 'IWSR' / '2019'
+        param sheet_name: name of the sheet to read
+        param read_kwargs: further keyword arguments for pd.read_excel, e.g. skiprows and nrows
+        : return: copy of the parsed sheet
+        """
+
+        key = self._key(base_dir, sheet_name, read_kwargs)
+
+        if key in self.pending:
+            self._store(key, *self.pending.pop(key).result())
+        elif key not in self.frames:
+            self._store(key, *_load_sheet(base_dir, sheet_name, read_kwargs))
+
+        return self.frames[key].copy()
+
+    def prefetch(self, requests, max_workers=None, executor='thread'):
+        """ Method to start loading sheets in parallel. The call returns immediately, read_sheet then takes
+        each sheet as soon as it has been loaded, so the estimates run while the other sheets are still loading
+
+        param requests: list of (base_dir, sheet_name, read_kwargs) tuples, e.g. from utils.get_source_request
+        param max_workers: number of threads or processes, defaults to the default of the executor
+        param executor: 'thread' or 'process'
+        : return: the registry
+        """
+
+        pool_class = {'thread': ThreadPoolExecutor, 'process': ProcessPoolExecutor}[executor]
+        pool = pool_class(max_workers=max_workers)
+
+        for base_dir, sheet_name, read_kwargs in requests:
+            key = self._key(base_dir, sheet_name, read_kwargs)
+            if key not in self.frames and key not in self.pending:
+                self.pending[key] = pool.submit(_load_sheet, base_dir, sheet_name, read_kwargs)
+
+        # the submitted sheets keep loading, the workers are released once they are done
+        pool.shutdown(wait=False)
+        return self
+
+    @property
+    def workbook_reads(self):
+        """ Number of sheets that were read from disk (or the disk cache) during the run """
+
+        return sum(self.reads.values())
+
+    def report(self):
+        """ Method to summarise the sheets that were read during the run
+
+        : return: dataframe with the source, sheet, number of reads and load time in seconds per loaded sheet
+        """
+
+        return pd.DataFrame(data=[[source, sheet, reads, self.timings.get((source, sheet, kwargs))]
+                                  for (source, sheet, kwargs), reads in self.reads.items()],
+                            columns=['Source', 'Sheet', 'Reads', 'Seconds'])
@@ -0,0 +1,347 @@
+
+import numpy as np
+from pathlib import Path
+from utils.schemas import SOURCE_SCHEMAS
+
+# row count multipliers of the benchmark data sets
+SCALES = [1, 10, 100]
+
+# years written for the sources that keep a folder per year, the estimates and backtest run on the last two
+SYNTHETIC_YEARS = ['2018', '2019', '2020']
+
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+QUARTERS = ['1st Quarter', '2nd Quarter', '3rd Quarter', '4th Quarter']
+
+INCOME_GROUPS = ['HP Fortified', 'SP Fortified', 'HP Wine', 'MP Wine', 'SP Wine', 'Perle Wine', 'Flavoured Wines',
+                 'Wine Aperitif', 'Other Flavoured Beverages', 'Ciders', 'Spirit Cooler', 'Beer', 'Brandy', 'Gin',
+                 'Vodka', 'Liqueurs', 'Whisky', 'Sparkling Wine', 'Cane', 'Rum', 'Tequila', 'Other Spirits']
+IWSR_CATEGORIES = ['Brandy', 'Gin and Genever', 'Vodka', 'Flavoured Spirits', 'Whisky', 'Fortified Wine',
+                   'Light Aperitifs', 'Beer', 'Sparkling Wine', 'Still Wine', 'RTDs', 'Cider', 'Cane', 'Rum', 'Tequila']
+SALBA_CATEGORIES = ['Brandy (Premium and Cognac)', 'Brandy (Prop and Non-Prop)', 'Gin', 'Vodka and Cane Spirits',
+                    'Whisky (Premium)', 'Whisky (Prop and Non-Prop)', 'Liqueurs', 'Sparkling Wine',
+                    'Standard Still and Perlé Wine', 'Super Premium Red Wine', 'Super Premium Rosé Wine',
+                    'Super Premium White Wine', 'Premium Wine', 'Total Fortified Wines and Aperitifs',
+                    'Alcoholic Fruit Beverages', 'Spirit Coolers']
+DATA_ORBIS_CATEGORIES = [('Beer', 'Beer'), ('Beer', 'Flavoured Beer'), ('Rtds', 'Flavoured Beer'),
+                         ('Rtds', 'Non-Alcoholic'), ('Rtds', 'Cider'), ('Rtds', 'Fabs'), ('Rtds', 'Spirit Cooler'),
+                         ('Rtds', 'Cocktails'), ('Spirits', 'Brandy'), ('Spirits', 'Cane'), ('Spirits', 'Cognac'),
+                         ('Spirits', 'Gin'), ('Spirits', 'Liqueurs'), ('Spirits', 'Rum'), ('Spirits', 'Vodka'),
+                         ('Spirits', 'Whisky'), ('Spirits', 'Tequila'), ('Wine', 'Fortified'), ('Wine', 'Sparkling'),
+                         ('Wine', 'Unfortified'), ('Wine', 'BIB'), ('Wine', 'Perle'), ('Wine', 'Aperitif')]
+EPOS_SUBCATEGORIES = ['Aperitif', 'Beer', 'Brandy', 'Cognac', 'Cane', 'Cider', 'Fabs', 'Fortified', 'Gin', 'Liqueurs',
+                      'Rum', 'Sparkling', 'Still wine', 'Tequila', 'Vodka', 'Whisky']
+PRICE_BAND_SUBCATEGORIES = {'price_bands_rtds': ['Beer', 'Cider', 'Fabs'],
+                            'price_bands_wine': ['Sparkling', 'Still wine', 'Fortified', 'Aperitif'],
+                            'price_bands_spirits': ['Brandy', 'Cognac', 'Cane', 'Gin', 'Liqueurs', 'Rum', 'Tequila',
+                                                    'Vodka', 'Whisky']}
+PRICE_BAND_INDICES = ['Alcohol', 'Low-Alcohol', 'No-Alcohol', 'Energy']
+PRICE_BAND_NAMES = ['Accessible Premium', 'Low Price', 'Premium', 'Super Premium', 'Ultra Premium', 'Affordable',
+                    'Value']
+FORECAST_CATEGORIES = ['Beer', 'Still Wine', 'Sparkling Wine', 'Fortified Wine', 'Brandy', 'Gin and Genever', 'Vodka',
+                       'Cane', 'Whisky', 'Liqueurs', 'Aperitifs', 'Cider', 'FABs', 'Rum', 'Tequila']
+ESTIMATE_CATEGORIES = ['Cider', 'RTDs', 'Beer', 'Brandy', 'Cane', 'Gin and Genever', 'Liquers', 'Rum', 'Tequila',
+                       'Vodka', 'Whisky', 'Light Aperitifs', 'Fortified Wine', 'Sparkling Wine', 'Still Wine',
+                       'Other A', 'Other B', 'Other C']
+
+
+def _openpyxl():
+    """ Method to import openpyxl lazily, it is only needed to write the synthetic workbooks
+
+    : return: the openpyxl module
+    """
+
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImportError('openpyxl is required to write the synthetic workbooks, run pip install openpyxl')
+    return openpyxl
+
+
+class SyntheticWorkbook:
+    """ Workbook of a source in the synthetic data folder. The folder, sheet names and header offsets are taken
+    from SOURCE_SCHEMAS, so the synthetic workbooks follow the layout the readers expect
+    """
+
+    def __init__(self, root, source, year=None, file_name=None):
+        """
+        param root: synthetic data folder
+        param source: source whose folder the workbook is written to, see SOURCE_SCHEMAS
+        param year: year of the data, for the sources that keep a folder per year
+        param file_name: name of the workbook, defaults to <source>.xlsx
+        """
+
+        self.path = Path(root) / SOURCE_SCHEMAS[source]['folder'].format(year=year) / (file_name or f'{source}.xlsx')
+        self.workbook = _openpyxl().Workbook(write_only=True)
+
+    def sheet(self, source):
+        """ Method to add the sheet of a source, starting with the rows its reader skips
+
+        param source: name of the source, see SOURCE_SCHEMAS
+        : return: write only worksheet to append the header and data rows to
+        """
+
+        schema = SOURCE_SCHEMAS[source]
+        ws = self.workbook.create_sheet(schema['sheet_name'])
+        for i in range(schema.get('skiprows', 0)):
+            ws.append([f'{source} line {i}'])
+        return ws
+
+    def save(self):
+        """ Method to write the workbook, the folder is created when it does not exist
+
+        : return: path of the workbook
+        """
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.workbook.save(self.path)
+        return self.path
+
+
+def volumes(rng, size=None, scale=1.0):
+    """ Method to draw random volumes
+
+    param rng: numpy random generator
+    param size: number of volumes, a single float by default
+    param scale: scale of the volumes
+    : return: float or list of floats rounded to 2 decimals
+    """
+
+    values = np.round(rng.uniform(1000, 100000, size) * scale, 2)
+    return float(values) if size is None else values.tolist()
+
+
+def get_end_year(year):
+    """ Method to get the year the data of a folder ends in
+
+    param year: folder of the data, e.g. '2020' or 'all_years'
+    : return: year as int, 2020 for the folders holding all years
+    """
+
+    return 2020 if year == 'all_years' else int(year)
+
+
+def write_income_statement(root, year, n, rng):
+    """ Method to write the income statement with n brands per stats group, in litres (L) and rand (R) """
+
+    book = SyntheticWorkbook(root, 'income_statement', year)
+    ws = book.sheet('income_statement')
+    ws.append(['Stats Group', 'Brand', 'Pack', None] + MONTHS)
+    for group in INCOME_GROUPS:
+        for brand in range(n):
+            ws.append([group, f'{group} brand {brand}', '750ml', 'L'] + volumes(rng, 12))
+            ws.append([group, f'{group} brand {brand}', '750ml', 'R'] + volumes(rng, 12))
+    for brand in ['Amarula Cream Liqueur', 'Amarula Gold']:
+        ws.append(['Liqueurs', brand, '750ml', 'L'] + volumes(rng, 12))
+    return book.save()
+
+
+def write_IWSR(root, year, n, rng):
+    """ Method to write the IWSR export with n brands per category and the last four years as columns """
+
+    years = [str(y) for y in range(get_end_year(year) - 3, get_end_year(year) + 1)]
+    book = SyntheticWorkbook(root, 'IWSR', year)
+    ws = book.sheet('IWSR')
+    ws.append(['Category 1', 'Category 2', 'Brand'] + years)
+    for category in IWSR_CATEGORIES:
+        for brand in range(n):
+            ws.append(['Alcohol', category, f'{category} {brand}'] + volumes(rng, len(years), 0.01))
+    return book.save()
+
+
+def write_SALBA(root, year, n, rng):
+    """ Method to write the SALBA workbook with the quarterly volumes of n members per category and the SUMMARY sheet
+    with the H1 shares of the base years and the current year """
+
+    book = SyntheticWorkbook(root, 'SALBA', year)
+    ws = book.sheet('SALBA')
+    ws.append(['Year', 'Category', 'Quarter', 'Member', 'Litres'])
+    for y in range(get_end_year(year) - 2, get_end_year(year) + 1):
+        for category in SALBA_CATEGORIES:
+            for quarter in QUARTERS:
+                for member in range(n):
+                    ws.append([y, category, quarter, f'member {member}', volumes(rng, scale=10)])
+
+    ws = book.sheet('SALBA_summary')
+    ws.append(['Row', 'Label'] + [f'c{i}' for i in range(2, 18)] + ['2017', '2018', '2019', None])
+    for row in range(42):
+        ws.append([row, f'label {row}'] + [0.0] * 16 + np.round(rng.uniform(0.4, 0.6, 4), 4).tolist())
+    return book.save()
+
+
+def _append_SAWIS_block(ws, years, rows, rng):
+    """ Method to append the still, sparkling and fortified wine blocks side by side, one row per label in rows """
+
+    header = []
+    for category in ['Still Wine', 'Sparkling Wine', 'Fortified Wine']:
+        header += [category] + years
+    ws.append(header)
+    ws.append(['units'] * len(header))
+    for label in rows:
+        line = []
+        for _ in range(3):
+            line += [label] + volumes(rng, len(years), 100)
+        ws.append(line)
+
+
+def write_SAWIS(root, year, n, rng):
+    """ Method to write the SAWIS workbook with the yearly volumes per region and the monthly local volumes """
+
+    years = list(range(get_end_year(year) - 3, get_end_year(year) + 1))
+    book = SyntheticWorkbook(root, 'SAWIS', year)
+    _append_SAWIS_block(book.sheet('SAWIS'), years, [f'Region {i}' for i in range(14)] + ['Total'], rng)
+    _append_SAWIS_block(book.sheet('SAWIS_monthly'), years, MONTHS + ['Total'], rng)
+    return book.save()
+
+
+def write_GLOBAL_data(root, year, n, rng):
+    """ Method to write the GlobalData export with n brand owners of beer and cider, with missing values as '-' """
+
+    years = [str(y) for y in range(get_end_year(year) - 3, get_end_year(year) + 1)]
+    book = SyntheticWorkbook(root, 'GLOBAL_data', year)
+    ws = book.sheet('GLOBAL_data')
+    ws.append([None, None, None, None] + years)
+    ws.append(['Country', 'Category', 'Brand Owner', 'Type'] + ['ML'] * len(years))
+    for category in ['Beer', 'Cider']:
+        for owner in range(n):
+            values = volumes(rng, len(years), 0.001)
+            ws.append(['South Africa', category, f'Owner {owner}', 'Lager'] +
+                      ['-' if missing else value for missing, value in zip(rng.uniform(size=len(years)) < 0.1, values)])
+    return book.save()
+
+
+def write_data_orbis(root, year, n, rng):
+    """ Method to write the Data Orbis export with n products per subcategory for South Africa and Namibia """
+
+    book = SyntheticWorkbook(root, 'data_orbis', year)
+    ws = book.sheet('data_orbis')
+    ws.append(['COUNTRYNAME', 'PRODUCTCATEGORY', 'PRODUCTSUBCATEGORY', 'PRODUCTDESCRIPTION', 'SALESVOLUME'])
+    for category, subcategory in DATA_ORBIS_CATEGORIES:
+        for product in range(n):
+            for country in ['South Africa', 'Namibia']:
+                ws.append([country, category, subcategory, f'{subcategory} {product} 750ml', volumes(rng)])
+    return book.save()
+
+
+def write_data_orbis_monthly(root, years, n, rng):
+    """ Method to write the monthly Data Orbis export (Data_Orbis_Charl) with n rows per subcategory and month """
+
+    book = SyntheticWorkbook(root, 'data_orbis_monthly', file_name='Data_Orbis_Charl.xlsx')
+    ws = book.sheet('data_orbis_monthly')
+    ws.append(['COUNTRYNAME', 'PRODUCTCATEGORY', 'PRODUCTSUBCATEGORY', 'Realigned YYYYMM', 'SALESVOLUME'])
+    for year in years:
+        for month in range(1, 13):
+            for subcategory in EPOS_SUBCATEGORIES:
+                for _ in range(n):
+                    ws.append(['South Africa', 'All', subcategory, f'{year}-{month:02d}', volumes(rng)])
+                    ws.append(['Botswana', 'All', subcategory, f'{year}-{month:02d}', volumes(rng)])
+    return book.save()
+
+
+def write_price_bands(root, n, rng):
+    """ Method to write the Data Orbis price band workbook (Data_Orbis_Socilla) with the RTD, wine and spirit sheets,
+    n products per subcategory, alcohol index and price band """
+
+    book = SyntheticWorkbook(root, 'price_bands_rtds', file_name='Data_Orbis_Socilla.xlsx')
+    for source, subcategories in PRICE_BAND_SUBCATEGORIES.items():
+        ws = book.sheet(source)
+        ws.append(['COUNTRY', 'CATEGORY', 'BRAND', 'PRODUCTDESCRIPTION', 'Look up', 'SUBCATEGORY', 'INDEX', 'PACK',
+                   'PRICE BAND CORRECT', 'X', 'CY 12 Mths', 'PY 12 Mths', 'CY 12 Mths', 'PY 12 Mths'])
+        for subcategory in subcategories:
+            for index in PRICE_BAND_INDICES:
+                for band in PRICE_BAND_NAMES:
+                    for product in range(n):
+                        description = f'{subcategory} {band} {product} 330ml'
+                        ws.append(['South Africa', source, f'{subcategory} brand', description, 330, subcategory,
+                                   index, '6x', band, None] + volumes(rng, 2) + volumes(rng, 2, 50))
+    return book.save()
+
+
+def write_SARS(root, rng):
+    """ Method to write the SARS workbook with the H1 and H2 shares of every year """
+
+    book = SyntheticWorkbook(root, 'SARS', 'all_years')
+    ws = book.sheet('SARS')
+    ws.append([f'c{i}' for i in range(14)] + [None, 'H1', 'H2'])
+    for y in range(2010, 2021):
+        h1 = float(np.round(rng.uniform(0.4, 0.6), 4))
+        ws.append([0] * 14 + [y, h1, 1 - h1])
+    return book.save()
+
+
+def write_CAGR(root, rng):
+    """ Method to write the CAGR summary with the yearly volumes of Distell and the other institutions """
+
+    years = list(range(2011, 2027))
+    book = SyntheticWorkbook(root, 'CAGR')
+    ws = book.sheet('CAGR')
+    ws.append(['CATEGORY', 'INSTITUTION'] + years)
+    for category in FORECAST_CATEGORIES + ['Other Wines']:
+        ws.append([category, 'DISTELL'] + volumes(rng, len(years), 100))
+        ws.append([category, 'OTHER'] + volumes(rng, len(years), 100))
+    return book.save()
+
+
+def write_forecasts(root, n, rng):
+    """ Method to write the volume forecasts per category and the value forecasts with n rows per category,
+    price band and alcohol index """
+
+    years = list(range(2019, 2027))
+    book = SyntheticWorkbook(root, 'forecasts_volume')
+    ws = book.sheet('forecasts_volume')
+    ws.append(['CATEGORY', 'INST'] + years + [None])
+    for category in FORECAST_CATEGORIES + ['Other Wines']:
+        ws.append([category, 'DISTELL'] + volumes(rng, len(years), 100) + ['n'])
+    ws.append([None, 'TOTAL'] + volumes(rng, len(years), 1000) + ['n'])
+    book.save()
+
+    book = SyntheticWorkbook(root, 'forecasts_value')
+    ws = book.sheet('forecasts_value')
+    ws.append(['SELECT', 'PRICE BAND CORRECT', 'INDEX'] + years + ['Notes'])
+    for category in FORECAST_CATEGORIES:
+        for band in PRICE_BAND_NAMES[:4]:
+            for index in PRICE_BAND_INDICES[:2]:
+                for _ in range(n):
+                    ws.append([category, band, index] + volumes(rng, len(years), 10) + ['n'])
+    return book.save()
+
+
+def write_IWSR_estimates(root, year, rng):
+    """ Method to write the IWSR estimates with the alcoholic, no alcohol and low alcohol shares per category """
+
+    book = SyntheticWorkbook(root, 'IWSR_estimates', year)
+    ws = book.sheet('IWSR_estimates')
+    header = [f'c{i}' for i in range(15)] + [None, 'IWSR_Category2', 'Alcoholic', 'No Alcohol', 'Low Alcohol']
+    header[1] = 'IWSR_Category2'
+    ws.append(header)
+    for category in ESTIMATE_CATEGORIES:
+        alcoholic = float(np.round(rng.uniform(0.8, 0.95), 3))
+        low = float(np.round((1 - alcoholic) / 2, 3))
+        ws.append([0, 'x'] + [0] * 13 + [volumes(rng, scale=0.01), category, alcoholic, 1 - alcoholic - low, low])
+    return book.save()
+
+
+def generate_synthetic_data(root, scale=1, years=SYNTHETIC_YEARS, seed=0):
+    """ Method to write a synthetic data folder with a workbook for every source in SOURCE_SCHEMAS. The workbooks
+    follow the layouts of the confidential workbooks, so every stage runs on them, and the number of rows grows
+    linearly with scale. Write to an empty folder, every reader takes the first workbook in its folder
+
+    param root: data folder to write to, e.g. the folder passed on to --data-dir
+    param scale: row count multiplier, e.g. 1, 10 or 100
+    param years: years of the sources that keep a folder per year
+    param seed: seed of the random volumes, the same seed writes the same volumes
+    : return: list of paths of the written workbooks
+    """
+
+    rng = np.random.default_rng(seed)
+    paths = []
+    for year in years:
+        paths += [write_income_statement(root, year, scale, rng), write_IWSR(root, year, scale, rng),
+                  write_SALBA(root, year, scale, rng), write_SAWIS(root, year, scale, rng),
+                  write_GLOBAL_data(root, year, scale, rng), write_data_orbis(root, year, scale, rng),
+                  write_IWSR_estimates(root, year, rng)]
+
+    # the fiscal year conversions and the seasonality read the folders holding all years
+    paths += [write_SALBA(root, 'all_years', scale, rng), write_SAWIS(root, 'all_years', scale, rng),
+              write_data_orbis_monthly(root, years[-2:], scale, rng), write_price_bands(root, scale, rng),
+              write_SARS(root, rng), write_CAGR(root, rng), write_forecasts(root, scale, rng)]
+    return paths
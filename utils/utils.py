@@ -1,10 +1,20 @@
 
+import os
 import pandas as pd
 import numpy as np
 from pathlib import Path
+from scipy import sparse
+from utils import OUTPUT_DIRECTORY
+from utils.cache import read_excel_cached, read_excel_sheets_cached
+from utils.mappings import data_orbis_rules, bip_rollup, salba_rollup, epos_rollup
+from utils.rollup import rollup
+from utils.schemas import SOURCE_SCHEMAS, get_read_kwargs, apply_schema
 
 full_path = Path().resolve()
-DATA_DIRECTORY = full_path.parent / 'Market Sizing' / 'data'
+# MARKET_SIZING_DATA points the readers at another data folder, e.g. through the --data-dir option of main.py
+DATA_DIRECTORY = Path(os.environ.get('MARKET_SIZING_DATA', full_path.parent / 'Market Sizing' / 'data'))
+# rows per chunk when streaming the Data Orbis export, e.g. through the --orbis-chunksize option of main.py. 0 reads it at once
+DATA_ORBIS_CHUNKSIZE = int(os.environ.get('MARKET_SIZING_ORBIS_CHUNKSIZE', 0))
 #DATA_DIRECTORY
 
 def get_file_in_directory(base_dir):
@@ -26,25 +36,96 @@ def get_file_in_directory(base_dir):
     return path[0]
 
 
-def get_income_statement_data(year):
+def read_source_sheet(base_dir, sheet_name, sources=None, **read_kwargs):
+    """ Method to read a sheet of the file in base_dir. When a source registry is given the sheet is
+    taken from the registry, so that every sheet is only read once per run
+
+    param base_dir: directory which to look in
+    param sheet_name: name of the sheet to read
+    param sources: optional SourceRegistry of the current run
+    param read_kwargs: further keyword arguments for pd.read_excel, e.g. skiprows and nrows
+    : return: parsed sheet as a pandas dataframe
+    """
+
+    if sources is not None:
+        return sources.read_sheet(base_dir, sheet_name, **read_kwargs)
+
+    path = get_file_in_directory(base_dir)
+    return read_excel_cached(path, sheet_name=sheet_name, **read_kwargs)
+
+
+def get_source_request(source, year=None):
+    """ Method to get the directory, sheet and read arguments of the workbook of a source, see SOURCE_SCHEMAS
+
+    param source: name of the source, e.g. 'IWSR'
+    param year: year of the data, e.g. '2020', for the sources that keep a folder per year
+    : return: tuple of (directory, sheet name, read arguments)
+    """
+
+    schema = SOURCE_SCHEMAS[source]
+    return DATA_DIRECTORY / schema['folder'].format(year=year) / '', schema['sheet_name'], get_read_kwargs(schema)
+
+
+def read_source(source, year=None, sources=None):
+    """ Method to read the sheet of a source as declared in SOURCE_SCHEMAS. Only the declared columns are parsed,
+    the layout is validated and the declared names and dtypes are applied
+
+    param source: name of the source, e.g. 'IWSR'
+    param year: year of the data, e.g. '2020', for the sources that keep a folder per year
+    param sources: optional SourceRegistry of the current run
+    : return: parsed sheet as a pandas dataframe
+    """
+
+    base_dir, sheet_name, read_kwargs = get_source_request(source, year)
+    df = read_source_sheet(base_dir, sheet_name, sources, **read_kwargs)
+    return apply_schema(df, SOURCE_SCHEMAS[source], source)
+
+
+def read_sources(names, year=None, sources=None):
+    """ Method to read the sheets of several sources at once, see read_source. Every workbook is opened only once,
+    also when several of the sources are sheets of the same workbook
+
+    param names: list of source names, e.g. ['price_bands_rtds', 'price_bands_wine']
+    param year: year of the data, e.g. '2020', for the sources that keep a folder per year
+    param sources: optional SourceRegistry of the current run
+    : return: dictionary of source name to parsed sheet
+    """
+
+    if sources is not None:
+        return {name: read_source(name, year, sources) for name in names}
+
+    # group the sheets by workbook
+    workbooks = {}
+    for name in names:
+        base_dir, sheet_name, read_kwargs = get_source_request(name, year)
+        workbooks.setdefault(base_dir, []).append((name, sheet_name, read_kwargs))
+
+    frames = {}
+    for base_dir, requests in workbooks.items():
+        sheets = read_excel_sheets_cached(get_file_in_directory(base_dir),
+                                          [(sheet_name, read_kwargs) for _, sheet_name, read_kwargs in requests])
+        for (name, _, _), df in zip(requests, sheets):
+            frames[name] = apply_schema(df, SOURCE_SCHEMAS[name], name)
+    return frames
+
+
+def get_income_statement_data(year, sources=None):
     """"
     Function to read in and preprocess the Income Statement file located in the income statement CY directory
     
     param year: 
+    param sources: optional SourceRegistry of the current run
     : return: preprocessed base df with Distell stats group as index 
     """
 
-    base_dir = DATA_DIRECTORY / 'income_statement' / year / '' 
-    path = get_file_in_directory(base_dir)
-    
-    df = pd.read_excel(path, sheet_name='Sheet1')
+    df = read_source('income_statement', year, sources)
     #if 'Unnamed: 0' in df.columns:
     #    df = df[df['Unnamed: 0'] == 'Sales Litres']
         
     #df = pd.DataFrame(df.groupby(['Stats Group']).agg('sum').T.sum())
     #df = df.rename(columns = {0: 'Volume'})
     df = df[df["Unnamed: 3"] == 'L']
-    df = pd.DataFrame(df.groupby(['Stats Group']).agg('sum').T.sum())
+    df = pd.DataFrame(df.groupby(['Stats Group']).sum(numeric_only=True).T.sum())
     df = df.rename(columns={0: 'Volume'})
 
     return df
@@ -59,18 +140,16 @@ def get_income_statement_data(year):
 
 
 
-def get_amarula_data(year):
+def get_amarula_data(year, sources=None):
     """"
     Function to get amarula volumes from the Income Statement data
     
     param year: 
+    param sources: optional SourceRegistry of the current run
     : return: preprocessed base df with Distell stats group as index 
     """
 
-    base_dir = DATA_DIRECTORY / 'income_statement' / year / '' 
-    path = get_file_in_directory(base_dir)
-    
-    df = pd.read_excel(path, sheet_name='Sheet1')
+    df = read_source('income_statement', year, sources)
 
     #print(df['Unnamed: 3'].value_counts())
     if 'Unnamed: 0' in df.columns:
@@ -79,7 +158,7 @@ def get_amarula_data(year):
         df = df[df['Unnamed: 3'] == 'L']
     
     #print(df[df['Brand'] == 'Amarula Cream Liqueur'])
-    agg_df = df.groupby('Brand').agg('sum')
+    agg_df = df.groupby('Brand').sum(numeric_only=True)
     amarula = agg_df.loc['Amarula Cream Liqueur'].T.sum() + agg_df.loc['Amarula Gold'].T.sum()
     return amarula
 
@@ -90,18 +169,16 @@ def get_amarula_data(year):
 #Test passed
 
 
-def get_IWSR_data(year = '2019'):
+def get_IWSR_data(year = '2019', sources=None):
     """"
     Function to read in and preprocess the IWSR file 
     
     param year: 
+    param sources: optional SourceRegistry of the current run
     : return: preprocessed df with IWSR data with stats group as index 
     """
 
-    base_dir = DATA_DIRECTORY / 'IWSR' / year / '' 
-    path = get_file_in_directory(base_dir)
-    
-    df = pd.read_excel(path, sheet_name='IWSR', skiprows = 7)
+    df = read_source('IWSR', year, sources)
     df = df.groupby(['Category 2']).agg('sum')[[year]]
     df = df.rename(columns = {year: 'Volume'})
     df['Volume'] = df['Volume']*1000
@@ -113,20 +190,18 @@ def get_IWSR_data(year = '2019'):
 #Test passed
 
 
-def get_SAWIS_data(year):
+def get_SAWIS_data(year, sources=None):
     """"
     Function to read in and preprocess the SAWIS file 
     
     param file_path: file path of source within the data directory
     param year:
+    param sources: optional SourceRegistry of the current run
     : return: preprocessed df with SAWIS data with stats group as index 
     """
 
     
-    base_dir = DATA_DIRECTORY / 'SAWIS' / year / '' 
-    path = get_file_in_directory(base_dir)
-    
-    sawis_df = pd.read_excel(path, sheet_name='SAWIS', skiprows = 2, nrows = 17)
+    sawis_df = read_source('SAWIS', year, sources)
     still_wine = sawis_df.T[:5].T[1:]
     spark_wine = sawis_df.T[5:10].T[1:]
     fortified  = sawis_df.T[10:].T[1:]
@@ -146,20 +221,18 @@ def get_SAWIS_data(year):
 #assert SAWIS_data['Volume'][0] == 298417621, "Aggregation incorrect"
 #Test passed
 
-def get_SALBA_data(year):
+def get_SALBA_data(year, sources=None):
     """" Function to read in and preprocess the SALBA file 
 
     param file_path: file path of source within the data directory
+    param sources: optional SourceRegistry of the current run
     : return: preprocessed df with SALBA data with stats group as index 
     """
 
-    base_dir = DATA_DIRECTORY / 'SALBA' / year / '' 
-    path = get_file_in_directory(base_dir)
-
-    df = pd.read_excel(path, sheet_name='SALBA')
+    df = read_source('SALBA', year, sources)
     df = df[df['Year'] == int(year)] # TODO: generalize this
     df = df.rename(columns={df.columns[-1]: 'Sales'})
-    df = df.groupby(['Category', 'Quarter']).agg('sum')[['Sales']].reset_index().pivot(index = 'Category', 
+    df = df.groupby(['Category', 'Quarter']).sum(numeric_only=True)[['Sales']].reset_index().pivot(index = 'Category', 
                                                                                        columns = 'Quarter', 
                                                                                        values = 'Sales')
     df['Volume'] = df['1st Quarter'] + df['2nd Quarter'] + df['3rd Quarter'] + df['4th Quarter']
@@ -172,27 +245,21 @@ def get_SALBA_data(year):
 #Test passed
 
 
-def get_global_data(year):
+def get_global_data(year, sources=None):
     """" Function to read in and preprocess the GLOBAL data file 
     
     param file_path: file path of source within the data directory
+    param sources: optional SourceRegistry of the current run
     : return: preprocessed df with GLOBAL data with stats group as index 
     """
     
-    base_dir = DATA_DIRECTORY / 'GLOBAL_data' / year / '' 
-    path = get_file_in_directory(base_dir)
-
-    global_df = pd.read_excel(path, sheet_name='GLOBALdata', skiprows = 18)
-    global_df = global_df.rename({"Unnamed: 0": "Country", 
-                  "Unnamed: 1": 'Category', 
-                  "Unnamed: 2": 'Brand Owner',
-                  "Unnamed: 3": 'Beer and Cider Type'}, axis = 1)
-
+    global_df = read_source('GLOBAL_data', year, sources)
+    # the columns are renamed by the schema of GLOBAL_data
     global_df = global_df[1:] 
     global_df[year] = global_df[year].apply(lambda x: 0 if x == '-' else x)
     global_df = global_df[['Country', 'Category', 'Brand Owner', 'Beer and Cider Type', year]].dropna()
     
-    global_df = global_df.groupby('Category').agg('sum')[[year]].rename(columns = {year: 'Volume'})
+    global_df = global_df.groupby('Category')[[year]].agg('sum').rename(columns = {year: 'Volume'})
     global_df['Volume'] = global_df['Volume']*1000000
     return global_df
 
@@ -202,22 +269,94 @@ def get_global_data(year):
 
 #Test passed
 
-def get_data_orbis(year):
+def read_sheet_chunks(path, sheet_name, columns, chunksize):
+    """ Method to stream a sheet of an xlsx workbook in chunks of rows, so that only one chunk is kept in memory.
+    The workbook is opened read-only and only the requested columns are kept
+
+    param path: path of the workbook
+    param sheet_name: name of the sheet to read
+    param columns: names of the columns to keep, as in the header row of the sheet
+    param chunksize: number of rows per chunk
+    : return: generator of pandas dataframes with the requested columns
+    """
+
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb[sheet_name].iter_rows(values_only=True)
+        header = list(next(rows))
+        positions = [header.index(column) for column in columns]
+
+        chunk = []
+        for row in rows:
+            chunk.append([row[i] if i < len(row) else None for i in positions])
+            if len(chunk) == chunksize:
+                yield pd.DataFrame(data=chunk, columns=columns)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(data=chunk, columns=columns)
+    finally:
+        wb.close()
+
+
+def is_streamed(source):
+    """ Method to check whether the sheet of a source is streamed in chunks instead of read at once, see
+    get_data_orbis. A streamed sheet is never read into the registry, so it is not prefetched or loaded either
+
+    param source: name of the source, e.g. 'data_orbis'
+    : return: True if the source is streamed
+    """
+
+    return source == 'data_orbis' and DATA_ORBIS_CHUNKSIZE > 0
+
+
+def get_data_orbis(year, sources=None, chunksize=None):
     """" Function to read in and preprocess the Data Orbis file 
     
     param file_path: file path of source within the data directory
+    param sources: optional SourceRegistry of the current run
+    param chunksize: stream the sheet in chunks of this many rows, defaults to DATA_ORBIS_CHUNKSIZE (0 reads it at once)
     : return: preprocessed dataframe with external datasource
     """
-    
-    base_dir = DATA_DIRECTORY / 'data_orbis' / year / '' 
-    path = get_file_in_directory(base_dir)
 
-    df = pd.read_excel(path, sheet_name='Sheet1')
+    chunksize = chunksize or DATA_ORBIS_CHUNKSIZE
+    if chunksize:
+        return get_data_orbis_streamed(year, chunksize)
+
+    df = read_source('data_orbis', year, sources)
     df = df[df['COUNTRYNAME'] == 'South Africa']
-    agg_df = df.groupby(['PRODUCTCATEGORY', 'PRODUCTSUBCATEGORY']).agg('sum')[['SALESVOLUME']]
+    agg_df = df.groupby(['PRODUCTCATEGORY', 'PRODUCTSUBCATEGORY'], observed=True)[['SALESVOLUME']].sum()
     agg_df = agg_df.reset_index()
+    # the categories are only used to group, the result keeps plain labels
+    agg_df[['PRODUCTCATEGORY', 'PRODUCTSUBCATEGORY']] = agg_df[['PRODUCTCATEGORY', 'PRODUCTSUBCATEGORY']].astype(object)
     return agg_df
 
+
+def get_data_orbis_streamed(year, chunksize):
+    """" Function to read in and preprocess the Data Orbis file in chunks of rows with bounded memory.
+    Every chunk is filtered and aggregated on its own, and the partial sums are merged into a running total
+    
+    param year: year of the Data Orbis export
+    param chunksize: number of rows per chunk
+    : return: preprocessed dataframe with external datasource, as returned by get_data_orbis
+    """
+
+    base_dir, sheet_name, _ = get_source_request('data_orbis', year)
+    keys = ['PRODUCTCATEGORY', 'PRODUCTSUBCATEGORY']
+
+    total = None
+    for chunk in read_sheet_chunks(get_file_in_directory(base_dir), sheet_name, ['COUNTRYNAME'] + keys + ['SALESVOLUME'],
+                                   chunksize):
+        chunk = chunk[chunk['COUNTRYNAME'] == 'South Africa']
+        chunk = chunk.assign(SALESVOLUME=pd.to_numeric(chunk['SALESVOLUME']))
+        partial = chunk.groupby(keys)[['SALESVOLUME']].sum()
+        total = partial if total is None else total.add(partial, fill_value=0)
+
+    if total is None:
+        total = pd.DataFrame(columns=keys + ['SALESVOLUME']).set_index(keys)
+    return total.sort_index().reset_index()
+
 ##Test out the get orbis data function
 #orbis_data = get_data_orbis('2020')
 #assert orbis_data['SALESVOLUME'][0].round() == 2265514, "Aggregation incorrect"
@@ -247,69 +386,85 @@ def map_to_base_data(group, df, mappings):
     return None
 
 
-def transform_data_orbis(df):
-    """ Function to transform EPOS dataframe to indexes which are compatible with BIP indexes. 
+def sum_in_row_order(values, codes, size):
+    """ Function to sum values per group in one pass. The rows are sorted stably by group and every group is summed
+    with np.add.reduceat, which adds the values of a group up one after the other in row order. Filtering the rows
+    of a group and summing them (as H1_H2_Epos did) adds them up pairwise instead, so the sums can differ from those
+    in the last digits
+
+    param values: array of values, NaN counts as 0
+    param codes: array with the group of every value, from 0 to size - 1
+    param size: number of groups
+    : return: array with the sum of every group, 0 for groups without values
+    """
+
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(size + 1))
+    ordered = np.where(np.isnan(values[order]), 0.0, values[order])
+
+    sums = np.zeros(size)
+    # reduceat returns the value at the start of an empty group instead of 0, and needs starts within the array
+    filled = bounds[1:] > bounds[:-1]
+    if filled.any():
+        sums[filled] = np.add.reduceat(ordered, bounds[:-1][filled])
+    return sums
+
+
+def compile_data_orbis_rules(df, rules=data_orbis_rules):
+    """ Function to compile the rule table into a sparse 0/1 membership matrix of stats groups by rows of df.
+    The rows are factorised once on their (category, subcategory) pair and the rules are joined with the distinct
+    pairs only, so the matrix is built in time linear in the number of rows
+
+    param df: dataframe containing aggregated EPOS data
+    param rules: list of (PRODUCTCATEGORY, PRODUCTSUBCATEGORY, stats group) rules, None matches any value
+    : return: tuple of (stats groups in rule order, sparse matrix of shape (groups, rows))
+    """
+
+    keys = ['PRODUCTCATEGORY', 'PRODUCTSUBCATEGORY']
+
+    # single pass over the rows, every row gets the code of its (category, subcategory) pair
+    codes, pairs = pd.MultiIndex.from_frame(df[keys].fillna('')).factorize()
+    pairs = pairs.to_frame(index=False, name=keys)
+    pairs['pair'] = np.arange(len(pairs))
+
+    # join the distinct pairs with the rules on both keys, the category only or the subcategory only
+    rules_df = pd.DataFrame(data=rules, columns=keys + ['Group'])
+    rules_df['rule'] = np.arange(len(rules_df))
+    has_category, has_subcategory = rules_df[keys[0]].notna(), rules_df[keys[1]].notna()
+    matched = pd.concat([pairs.merge(rules_df[has_category & has_subcategory], on=keys),
+                         pairs.merge(rules_df[has_category & ~has_subcategory].drop(columns=keys[1]), on=keys[0]),
+                         pairs.merge(rules_df[~has_category & has_subcategory].drop(columns=keys[0]), on=keys[1])])
+
+    groups = list(dict.fromkeys(rules_df['Group']))
+    group_codes = matched['Group'].map({group: i for i, group in enumerate(groups)}).to_numpy(dtype=int)
+
+    # stats groups by pairs, a pair matched by two rules of a group counts twice like the sums of the rules did
+    group_pairs = sparse.csr_matrix((np.ones(len(matched)), (group_codes, matched['pair'].to_numpy(dtype=int))),
+                                    shape=(len(groups), len(pairs)))
+    pair_rows = sparse.csr_matrix((np.ones(len(codes)), (codes, np.arange(len(codes)))), shape=(len(pairs), len(codes)))
+    membership = group_pairs @ pair_rows
+    # the rows of a stats group in row order, the product adds them up in that order
+    membership.sort_indices()
+    return groups, membership
+
+
+def transform_data_orbis(df, rules=data_orbis_rules, columns=('SALESVOLUME',)):
+    """ Function to transform EPOS dataframe to indexes which are compatible with BIP indexes.
+    The rule table is compiled into a membership matrix of stats groups by rows (see compile_data_orbis_rules) and all
+    value columns are rolled up with one sparse matrix product, so the run time is linear in the number of rows and
+    does not depend on the number of stats groups. The rows of a stats group are added up one after the other in row
+    order, so the sums can differ from the pairwise sums of pandas in the last digits
     
     param df: dataframe containing aggregated EPOS data
+    param rules: list of (PRODUCTCATEGORY, PRODUCTSUBCATEGORY, stats group) rules, None matches any value
+    param columns: value columns to roll up, NaN counts as 0 and SALESVOLUME is renamed to Volume
     : return: transformed dataframe compatible with base df
     """
 
-    new_df = None
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df[df['PRODUCTCATEGORY'] == 'Beer']['SALESVOLUME'].sum() +
-                                                    df[(df['PRODUCTCATEGORY'] == 'Rtds') & 
-                                                       (df['PRODUCTSUBCATEGORY'] == 'Flavoured Beer')]['SALESVOLUME'].sum()], 
-                                           index = ['Beer'], 
-                                           columns = ['SALESVOLUME'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df[df['PRODUCTSUBCATEGORY'] == 'Brandy']['SALESVOLUME'].sum()], 
-                                           index = ['Brandy'], 
-                                           columns = ['SALESVOLUME'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df[df['PRODUCTSUBCATEGORY'] == 'Cane']['SALESVOLUME'].sum()], 
-                                           index = ['Cane'], 
-                                           columns = ['SALESVOLUME'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df[df['PRODUCTSUBCATEGORY'] == 'Cider']['SALESVOLUME'].sum() + 
-                                                     df[(df['PRODUCTCATEGORY'] == 'Rtds') & 
-                                                        (df['PRODUCTSUBCATEGORY'] == 'Non-Alcoholic')]['SALESVOLUME'].sum()], 
-                                           index = ['Cider'], 
-                                           columns = ['SALESVOLUME'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df[df['PRODUCTSUBCATEGORY'] == 'Cocktails']['SALESVOLUME'].sum()], 
-                                           index = ['Cocktails'], 
-                                           columns = ['SALESVOLUME'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df[df['PRODUCTSUBCATEGORY'] == 'Cognac']['SALESVOLUME'].sum()], 
-                                           index = ['Cognac'], 
-                                           columns = ['SALESVOLUME'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df[df['PRODUCTSUBCATEGORY'] == 'Fabs']['SALESVOLUME'].sum()], 
-                                           index = ['Fabs'], 
-                                           columns = ['SALESVOLUME'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df[df['PRODUCTSUBCATEGORY'] == 'Fortified']['SALESVOLUME'].sum()], 
-                                           index = ['Fortified Wine'], 
-                                           columns = ['SALESVOLUME'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df[df['PRODUCTSUBCATEGORY'] == 'Gin']['SALESVOLUME'].sum()], 
-                                           index = ['Gin'], 
-                                           columns = ['SALESVOLUME'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df[df['PRODUCTSUBCATEGORY'] == 'Liqueurs']['SALESVOLUME'].sum()], 
-                                           index = ['Liqueurs'], 
-                                           columns = ['SALESVOLUME'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df[df['PRODUCTSUBCATEGORY'] == 'Rum']['SALESVOLUME'].sum()], 
-                                           index = ['Rum'], 
-                                           columns = ['SALESVOLUME'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df[df['PRODUCTSUBCATEGORY'] == 'Sparkling']['SALESVOLUME'].sum()], 
-                                           index = ['Sparkling Wine'], 
-                                           columns = ['SALESVOLUME'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df[df['PRODUCTSUBCATEGORY'] == 'Spirit Cooler']['SALESVOLUME'].sum()], 
-                                           index = ['Spirit Cooler'], 
-                                           columns = ['SALESVOLUME'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df[df['PRODUCTSUBCATEGORY'] == 'Unfortified']['SALESVOLUME'].sum() + 
-                                                     df[df['PRODUCTSUBCATEGORY'] == 'BIB']['SALESVOLUME'].sum() + 
-                                                     df[df['PRODUCTSUBCATEGORY'] == 'Perle']['SALESVOLUME'].sum()
-                                                    ], 
-                                           index = ['Still Wine'], 
-                                           columns = ['SALESVOLUME'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df[df['PRODUCTSUBCATEGORY'] == 'Vodka']['SALESVOLUME'].sum()], 
-                                           index = ['Vodka'], 
-                                           columns = ['SALESVOLUME'])])    
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df[df['PRODUCTSUBCATEGORY'] == 'Whisky']['SALESVOLUME'].sum()], 
-                                           index = ['Whisky'], 
-                                           columns = ['SALESVOLUME'])])
+    groups, membership = compile_data_orbis_rules(df, rules)
+    values = df[list(columns)].fillna(0).to_numpy(dtype=float)
+
+    new_df = pd.DataFrame(data=membership @ values, index=groups, columns=list(columns))
     new_df = new_df.rename(columns = {'SALESVOLUME': 'Volume'})
     return new_df
 
@@ -321,72 +476,8 @@ def transform_data_epos(df):
     : return: transformed dataframe compatible with base df
     """
 
-    new_df = None
-    new_df = pd.concat([new_df, pd.DataFrame(data=(df.loc['BEER']['L'] + df.loc['BEER FLAVOURED']['L']),
-                                             index=['Beer'],
-                                             columns=['Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data=(df.loc['BIB']['L']),
-                                             index=['BIB'],
-                                             columns=['Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data=(df.loc['BRANDY']['L']),
-                                             index=['Brandy'],
-                                             columns=['Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data=(df.loc['CANE']['L']),
-                                             index=['Cane'],
-                                             columns=['Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data=(df.loc['CIDER']['L']),
-                                             index=['Cider'],
-                                             columns=['Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data=(df.loc['COCKTAILS']['L']),
-                                             index=['Cocktails'],
-                                             columns=['Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data=(df.loc['COGNAC']['L']),
-                                             index=['Cognac'],
-                                             columns=['Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data=(df.loc['FABS']['L']),
-                                             index=['Fabs'],
-                                             columns=['Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data=(df.loc['FORTIFIED']['L']),
-                                             index=['Fortified Wine'],
-                                             columns=['Volume'])])
-
-    new_df = pd.concat([new_df, pd.DataFrame(data=(df.loc['GIFT PACK']['L']),
-                                             index=['Gift Pack'],
-                                             columns=['Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data=(df.loc['GIN']['L']),
-                                             index=['Gin'],
-                                             columns=['Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data=(df.loc['GIN ENHANCER']['L']),
-                                             index=['Gin Enhancer'],
-                                             columns=['Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data=(df.loc['LIQUEURS']['L']),
-                                             index=['Liqueurs'],
-                                             columns=['Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data=(df.loc['PERLE']['L'] + df.loc['RED']['L'] + df.loc['ROSE']['L'] +
-                                                   df.loc['WHITE']['L'] + df.loc['BIB']['L']
-                                                   + df.loc['FRUIT']['L']),
-                                             index=['Still Wine'],
-                                             columns=['Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data=(df.loc['RUM']['L']),
-                                             index=['Rum'],
-                                             columns=['Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data=(df.loc['SPARKLING']['L']),
-                                             index=['Sparkling Wine'],
-                                             columns=['Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data=(df.loc['SPIRIT COOLER']['L']),
-                                             index=['Spirit Cooler'],
-                                             columns=['Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data=(df.loc['VODKA']['L']),
-                                             index=['Vodka'],
-                                             columns=['Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data=(df.loc['WHISKY']['L']),
-                                             index=['Whisky'],
-                                             columns=['Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data=(df.loc['FABS']['L'] + df.loc['CIDER']['L']),
-                                             index=['CIDER & RTDs'],
-                                             columns=['Volume'])])
-
-
+    new_df = rollup(df, epos_rollup, columns=['L'])
+    new_df = new_df.rename(columns = {'L': 'Volume'})
     return new_df
 
 
@@ -399,43 +490,7 @@ def transform_SALBA_df(df):
     : return: transformed dataframe compatible with BIP data
     """
 
-    new_df = None
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df.loc['Brandy (Premium and Cognac)'] + df.loc['Brandy (Prop and Non-Prop)']], 
-                                           index = ['Brandy'], 
-                                           columns = ['1st Quarter', '2nd Quarter', '3rd Quarter', '4th Quarter', 'Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df.loc['Gin']], 
-                                           index = ['Gin'], 
-                                           columns = ['1st Quarter', '2nd Quarter', '3rd Quarter', '4th Quarter', 'Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df.loc['Vodka and Cane Spirits']], 
-                                           index = ['Vodka and Cane Spirits'], 
-                                           columns = ['1st Quarter', '2nd Quarter', '3rd Quarter', '4th Quarter', 'Volume'])])
-    
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df.loc['Whisky (Premium)'] + df.loc['Whisky (Prop and Non-Prop)']], 
-                                           index = ['Whisky'], 
-                                           columns = ['1st Quarter', '2nd Quarter', '3rd Quarter', '4th Quarter', 'Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df.loc['Liqueurs']], 
-                                           index = ['Liqueurs'], 
-                                           columns = ['1st Quarter', '2nd Quarter', '3rd Quarter', '4th Quarter', 'Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df.loc['Sparkling Wine']], 
-                                           index = ['Sparkling Wine'], 
-                                           columns = ['1st Quarter', '2nd Quarter', '3rd Quarter', '4th Quarter', 'Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df.loc['Standard Still and Perlé Wine'] + 
-                                                     df.loc['Super Premium Red Wine'] + 
-                                                     df.loc['Super Premium Rosé Wine'] + 
-                                                     df.loc['Super Premium White Wine'] + 
-                                                     df.loc['Premium Wine']], 
-                                           index = ['Still Wine'], 
-                                           columns = ['1st Quarter', '2nd Quarter', '3rd Quarter', '4th Quarter', 'Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df.loc['Total Fortified Wines and Aperitifs']], 
-                                           index = ['Fortified Wine'], 
-                                           columns = ['1st Quarter', '2nd Quarter', '3rd Quarter', '4th Quarter', 'Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df.loc['Alcoholic Fruit Beverages']], 
-                                           index = ['AFB'], 
-                                           columns = ['1st Quarter', '2nd Quarter', '3rd Quarter', '4th Quarter', 'Volume'])])
-    new_df = pd.concat([new_df, pd.DataFrame(data = [df.loc['Spirit Coolers']], 
-                                           index = ['Spirit Cooler'], 
-                                           columns = ['1st Quarter', '2nd Quarter', '3rd Quarter', '4th Quarter', 'Volume'])])
-    return new_df
+    return rollup(df, salba_rollup, columns = ['1st Quarter', '2nd Quarter', '3rd Quarter', '4th Quarter', 'Volume'])
 
 
 #tranformed_SALBA = transform_SALBA_df(SALBA_data)
@@ -446,36 +501,49 @@ def transform_BIP_data(df):
     : return: transformed df with stats groups as indexes
     
     """
-    df = pd.concat([df, pd.DataFrame(data = [df.loc['HP Fortified'] +
-                                             df.loc['SP Fortified']], 
-                                     index = ['Fortified Wine 1'], 
-                                     columns = ['Volume'])])
-    df = pd.concat([df, pd.DataFrame(data = [df.loc['HP Wine'] + 
-                                             df.loc['MP Wine'] + 
-                                             df.loc['SP Wine'] + 
-                                             df.loc['Perle Wine'] + 
-                                             df.loc['Flavoured Wines']], 
-                                     index = ['Still Wine'], 
-                                     columns = ['Volume'])])
-    df = pd.concat([df, pd.DataFrame(data = [df.loc['HP Fortified'] + 
-                                             df.loc['SP Fortified'] + 
-                                             df.loc['Wine Aperitif']], 
-                                     index = ['Fortified Wine 2'], 
-                                     columns = ['Volume'])])
-    df = pd.concat([df, pd.DataFrame(data = [df.loc['Other Flavoured Beverages'] + 
-                                             df.loc['Ciders'] + 
-                                             df.loc['Spirit Cooler']], 
-                                     index = ['CIDER & RTDs'], 
-                                     columns = ['Volume'])])
-    df = pd.concat([df, pd.DataFrame(data = [df.loc['Other Flavoured Beverages'] + 
-                                             df.loc['Spirit Cooler']], 
-                                     index = ['FABs'], 
-                                     columns = ['Volume'])])
-    return df
+    return rollup(df, bip_rollup, columns = ['Volume'], keep_leaves = True)
 
 #transformed_income_stat = transform_BIP_data(income_stat)
 
 
+ESTIMATE_COLUMNS = ['IWSR Estimate', 'SALBA Estimate', 'SAWIS Estimate',  'GLOBAL Estimate', 'Data Orbis Estimate']
+
+
+def get_adjusted_mean_estimates(df, columns=ESTIMATE_COLUMNS):
+    """Method to calculate the adjusted mean of every row at once by discarding the furthest point (outlier) in each set.
+    Missing estimates are masked out, and ties in distance discard the last of the tied estimates
+    
+    param df: dataframe with a row per set of different estimates, e.g. a stats group or a scenario
+    param columns: columns of df holding the estimates
+    : return: dataframe with the adjusted mean ('Avg Estimate') and the discarded source ('Discarded Estimate') per row
+    """
+
+    values = df[columns].to_numpy(dtype=float)
+    mask = ~np.isnan(values)
+    count = mask.sum(axis=1)
+
+    # calculate mean, measure each estimate's distance to mean. Discard furthest estimate and recalculate mean from remainder
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(mask, values, 0).sum(axis=1) / count
+        distance = np.where(mask, np.abs(values - mean[:, None]), np.inf)
+
+    # order the estimates of each row by distance (missing ones last), the furthest is the last present estimate.
+    # The stable sort keeps ties in column order, so the last of equally far estimates is discarded
+    order = np.argsort(distance, axis=1, kind='stable')
+    rows = np.arange(values.shape[0])
+    furthest = order[rows, np.maximum(count - 1, 0)]
+    discard = count > 1
+
+    # remove further point is |set| > 1 and recalculate mean, summing in order of distance
+    kept = np.arange(values.shape[1]) < np.where(discard, count - 1, count)[:, None]
+    ordered = np.take_along_axis(values, order, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        adjusted = np.where(kept, ordered, 0).sum(axis=1) / kept.sum(axis=1)
+
+    discarded = np.where(discard, np.array(columns, dtype=object)[furthest], None)
+    return pd.DataFrame(data={'Avg Estimate': adjusted, 'Discarded Estimate': discarded}, index=df.index)
+
+
 def get_adjusted_mean_estimate(row):
     """Method to calculate mean by discarding furthest point (outlier) in set 
     
@@ -483,14 +551,4 @@ def get_adjusted_mean_estimate(row):
     : return: adjusted mean for the row
     """
     
-    # calculate mean, measure each estimate's distance to mean. Discard furthest estimate and recalculate mean from remainder
-    mean = row[['IWSR Estimate', 'SALBA Estimate', 'SAWIS Estimate',  'GLOBAL Estimate', 'Data Orbis Estimate']].mean()
-
-    # measure difference between each point and mean
-    diff = row[['IWSR Estimate', 'SALBA Estimate', 'SAWIS Estimate',  'GLOBAL Estimate', 'Data Orbis Estimate']] - mean
-    diff = diff.dropna().apply(lambda x: np.abs(x)).sort_values(ascending = True)
-    
-    # remove further point is |set| > 1 and recalculate mean
-    if diff.shape[0] > 1:
-        return row.loc[diff[:-1].index].mean()
-    return row.loc[diff.index].mean()
+    return get_adjusted_mean_estimates(row.to_frame().T)['Avg Estimate'].iloc[0]